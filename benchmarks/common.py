@@ -0,0 +1,131 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# The aspects of robots.json; fleets with more aspects add extra-NN ones
+ASPECTS = ('CPU', 'IMU', 'battery-level', 'cameras', 'customer', 'gpu')
+MODELS = ('modelA', 'modelB', 'modelC', 'modelD', 'modelE')
+CUSTOMERS = ('None', 'google', 'acme', 'initech')
+LOCATIONS = ('no location', 'site-a', 'site-b', 'site-c')
+
+
+def load_cli(workdir, database_url=None):
+    """Import the CLI with a fleet-config.toml that points at a scratch SQLite DB
+
+    Pass database_url to run against another database, such as a local
+    Postgres, instead.
+    """
+    os.makedirs(os.path.join(workdir, 'robots', 'config'), exist_ok=True)
+    with open(os.path.join(workdir, 'robots', 'config', 'fleet-config.toml'), 'w') as f:
+        f.write(f'DATABASE_URL = "{database_url or f"sqlite:///{workdir}/robots.db"}"\n')
+        f.write('SQLALCHEMY_TRACK_MODIFICATIONS = false\n')
+        # Measure the database paths, not the local snapshot
+        f.write('snapshot = false\n')
+        # Audit events pile up in the scratch directory instead of being shipped
+        f.write(f'audit-spool-dir = "{workdir}/audit"\n')
+        f.write('audit-background-flush = false\n')
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from robots.cli import commands
+    return commands
+
+
+def aspect_names(count=len(ASPECTS)):
+    """The first `count` aspect names of a synthetic fleet"""
+    return ASPECTS[:count] + tuple(f'extra-{index:02d}' for index in range(count - len(ASPECTS)))
+
+
+def build_fleet(app, size, aspects=len(ASPECTS), batch=2000):
+    """Recreate the schema and insert `size` robots with `aspects` aspects each
+
+    The fleet is the same on every run for the same size. Rows go in
+    through executemany, `batch` robots at a time, so 50k-robot fleets
+    take seconds. That skips RobotAspect's validator, so the typed columns
+    are filled here.
+    """
+    from robots.db.types import typed_values
+    from robots.models import db, Robot, RobotAspect, User
+    names = aspect_names(aspects)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(oauth_id='default', email='default@robots.local', name='Default User')
+        db.session.add(user)
+        db.session.commit()
+        for start in range(0, size, batch):
+            indexes = range(start, min(start + batch, size))
+            db.session.execute(Robot.__table__.insert(), [
+                {
+                    'id': i + 1,
+                    'name': f'robot{i:05d}',
+                    'model': MODELS[i % len(MODELS)],
+                    'hostname': f'10.{i // 62500}.{i // 250 % 250}.{i % 250}',
+                    'status': 'online' if i % 3 else 'idle',
+                    'deployed': bool(i % 2),
+                    'location': LOCATIONS[i % len(LOCATIONS)],
+                    'user_id': user.id,
+                }
+                for i in indexes
+            ])
+            db.session.execute(RobotAspect.__table__.insert(), [
+                dict(typed_values(aspect_value(name, i)), robot_id=i + 1, name=name,
+                     value=aspect_value(name, i))
+                for i in indexes
+                for name in names
+            ])
+        db.session.commit()
+
+
+def aspect_value(name, i):
+    if name == 'battery-level':
+        return str(i * 37 % 101)
+    if name == 'customer':
+        return CUSTOMERS[i % len(CUSTOMERS)]
+    if name.startswith('extra-'):
+        # A mix of numbers and words, so both typed and text columns are exercised
+        return str(i % 50) if int(name[6:]) % 2 else f'{name}-{i % 11}'
+    return f'{name}-{i % 7}'
+
+
+@contextmanager
+def count_statements(app):
+    """Collect every SQL statement sent to the app's engine"""
+    from robots.models import db
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda *a, **kw: statements.append(a[2])
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+
+def peak_memory(fn):
+    """Peak Python memory allocated while fn runs, in KB"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def timed(fn, repeat=3):
+    """Best wall time of `repeat` runs, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -0,0 +1,168 @@
+"""
+Release download concurrency benchmark
+
+Builds a release of random data into a scratch store, then serves it from
+a threaded local API server in a separate process. For each concurrency
+level it starts a fresh server, and that many downloaders fetch every
+chunk of the release at once, every other one with Range requests for the
+second half of each chunk as a resumed download would. The script reports
+throughput and the server's resident memory: idle, peak and growth per
+downloader. Chunks are streamed from disk in small blocks, so the peak
+should stay near idle however many downloaders there are, rather than
+growing by a chunk per downloader as buffered responses would.
+
+    python benchmarks/fetch_load.py [--size 64] [--levels 1,8,32,128]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(port):
+    """Run the API app on port until killed (the --serve mode of this script)"""
+    import logging
+    from werkzeug.serving import make_server
+    from robots.api.app import app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def rss_kb(pid, field='VmRSS'):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def download(port, chunks, resume, results):
+    """Fetch every chunk once, reading the body in small blocks"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    received = 0
+    for digest, size in chunks:
+        headers = {'Range': f'bytes={size // 2}-', 'If-Range': f'"{digest}"'} if resume else {}
+        connection.request('GET', f'/api/chunks/{digest}', headers=headers)
+        response = connection.getresponse()
+        if response.status != (206 if resume else 200):
+            raise RuntimeError(f"Unexpected {response.status} for chunk {digest}")
+        while True:
+            block = response.read(64 * 1024)
+            if not block:
+                break
+            received += len(block)
+        if response.will_close:
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    results.append(received)
+
+
+def run_level(port, chunks, downloaders, env):
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port)], env=env)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        # One request first so the app and its imports are warm before measuring
+        download(port, chunks[:1], False, [])
+        idle = rss_kb(server.pid)
+
+        peak, done = idle, threading.Event()
+
+        def sample():
+            nonlocal peak
+            while not done.is_set():
+                peak = max(peak, rss_kb(server.pid))
+                time.sleep(0.01)
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        results = []
+        threads = [threading.Thread(target=download, args=(port, chunks, index % 2 == 1, results))
+                   for index in range(downloaders)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        sampler.join()
+        peak = max(peak, rss_kb(server.pid, 'VmHWM'))
+    finally:
+        server.kill()
+        server.wait()
+    if len(results) != downloaders:
+        raise RuntimeError(f"{downloaders - len(results)} downloaders failed")
+    return sum(results), elapsed, idle, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=64, help='Release size in MB')
+    parser.add_argument('--levels', default='1,8,32,128', help='Comma-separated downloader counts')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    if args.serve:
+        serve(args.serve)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='robots-bench-')
+    config_path = os.path.join(workdir, 'fleet-config.toml')
+    with open(config_path, 'w') as f:
+        f.write(f'DATABASE_URL = "sqlite:///{workdir}/robots.db"\n')
+        f.write('SQLALCHEMY_TRACK_MODIFICATIONS = false\n')
+        f.write(f'build-store-dir = "{workdir}/store"\n')
+    env = dict(os.environ, ROBOTS_CONFIG=config_path,
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    os.environ['ROBOTS_CONFIG'] = config_path
+
+    from robots.build import ReleaseStore
+    from robots.build.store import chunk_sizes
+    from robots.config import load_config
+    source = os.path.join(workdir, 'source')
+    os.makedirs(source)
+    for index in range(max(1, args.size // 16)):
+        with open(os.path.join(source, f'part{index:03d}.bin'), 'wb') as f:
+            f.write(os.urandom(min(16, args.size) * 1024 * 1024))
+    manifest, _ = ReleaseStore(load_config()).build('bench', source, 'bench')
+    chunks = sorted(chunk_sizes(manifest).items())
+    total = sum(size for _, size in chunks)
+    print(f'Release of {total / 2 ** 20:.0f}MB in {len(chunks)} chunks '
+          f'(largest {max(size for _, size in chunks) / 2 ** 20:.1f}MB)')
+    print(f"{'downloaders':>11} {'MB sent':>9} {'seconds':>8} {'MB/s':>8} "
+          f"{'idle RSS':>9} {'peak RSS':>9} {'per dl':>8}")
+
+    results = []
+    for downloaders in [int(level) for level in args.levels.split(',')]:
+        sent, elapsed, idle, peak = run_level(free_port(), chunks, downloaders, env)
+        growth = (peak - idle) / downloaders
+        results.append({'downloaders': downloaders, 'bytes': sent, 'seconds': elapsed,
+                        'idle_rss_kb': idle, 'peak_rss_kb': peak, 'growth_per_downloader_kb': growth})
+        print(f'{downloaders:>11} {sent / 2 ** 20:>9.0f} {elapsed:>8.2f} {sent / 2 ** 20 / elapsed:>8.0f} '
+              f'{idle / 1024:>7.1f}MB {peak / 1024:>7.1f}MB {growth:>6.0f}KB')
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Filter compiler benchmark
+
+Times combinations of column and aspect filters and aspect sorts over a
+synthetic 50k-robot SQLite fleet, and prints each query's plan so index use
+can be checked.
+
+    python benchmarks/filters.py [--robots 50000]
+"""
+
+import argparse
+import tempfile
+
+from common import build_fleet, load_cli, timed
+
+CASES = {
+    'column': ([('model', 'modelA')], None),
+    'aspect': ([('customer', 'google')], None),
+    'two aspects': ([('customer', 'google'), ('gpu', 'gpu-3')], None),
+    'column + two aspects': ([('model', 'modelB'), ('customer', 'acme'), ('CPU', 'CPU-1')], None),
+    'aspect !=': ([('customer', '!None')], None),
+    'aspect prefix': ([('gpu', 'gpu-1*')], None),
+    'aspect IN': ([('customer', 'acme,initech')], None),
+    'aspect sort': ([], 'battery-level'),
+    'aspect filter + aspect sort': ([('customer', 'google')], '-battery-level'),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--robots', type=int, default=50000)
+    parser.add_argument('--plans', action='store_true', help='Print EXPLAIN QUERY PLAN output')
+    args = parser.parse_args()
+
+    commands = load_cli(tempfile.mkdtemp(prefix='robots-bench-'))
+    from robots.db.filters import compile_query
+    from robots.models import db, Robot
+
+    print(f'Building {args.robots} robots...')
+    build_fleet(commands.get_app(), args.robots)
+
+    with commands.get_app().app_context():
+        print(f"\n{'case':<30}{'rows':>8}{'best (ms)':>12}")
+        for case, (filters, sort) in CASES.items():
+            query = compile_query(Robot.query, filters, sort)
+            rows = query.count()
+            elapsed = timed(lambda: query.all())
+            print(f'{case:<30}{rows:>8}{elapsed * 1000:>12.1f}')
+            if args.plans:
+                sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+                for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')):
+                    print(f'    {row[-1]}')
+
+
+if __name__ == '__main__':
+    main()
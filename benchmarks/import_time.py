@@ -0,0 +1,97 @@
+"""
+CLI start-up benchmark
+
+Times `robots --help` and a `robots list` answered from a warm snapshot in
+fresh interpreters, and checks that neither of them imports Flask,
+SQLAlchemy or the models. Exits non-zero when a median exceeds its budget
+or a heavy module is loaded.
+
+    python benchmarks/import_time.py [--runs 10] [--robots 1000]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import build_fleet, load_cli
+
+# Median wall time budgets in seconds, interpreter start-up included
+BUDGETS = {
+    '--help': 0.35,
+    'list (snapshot)': 0.5,
+}
+
+HEAVY_MODULES = ('flask', 'flask_sqlalchemy', 'flask_migrate', 'sqlalchemy', 'robots.models')
+
+# Runs the CLI in-process, then reports which heavy modules it pulled in
+RUNNER = """
+import json, sys
+from robots.cli import cli
+try:
+    cli(sys.argv[1:], standalone_mode=False)
+finally:
+    sys.stdout.flush()
+    sys.stderr.write(json.dumps([m for m in {heavy!r} if m in sys.modules]) + '\\n')
+"""
+
+
+def run_cli(workdir, args):
+    """Run the CLI in a new interpreter, returning (seconds, heavy modules loaded)"""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', RUNNER.format(heavy=HEAVY_MODULES)] + args,
+        cwd=workdir, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - started
+    assert result.returncode == 0, result.stderr
+    return elapsed, json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--robots', type=int, default=1000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='robots-bench-')
+    commands = load_cli(workdir)
+    build_fleet(commands.get_app(), args.robots)
+    # Turn the snapshot back on, with a window long enough to stay warm for the run
+    config_path = os.path.join(workdir, 'robots', 'config', 'fleet-config.toml')
+    with open(config_path) as f:
+        settings = f.read().replace('snapshot = false\n', '')
+    with open(config_path, 'w') as f:
+        f.write(settings)
+        f.write(f'snapshot-path = "{workdir}/snapshot.json"\n')
+        f.write('snapshot-max-age = 3600\n')
+
+    # Prime the snapshot; this run is expected to load the database stack
+    run_cli(workdir, ['list'])
+
+    failed = False
+    print(f"{'command':<20}{'median':>10}{'budget':>10}  heavy modules")
+    for name, cli_args in (('--help', ['--help']), ('list (snapshot)', ['list'])):
+        samples, heavy = [], set()
+        for _ in range(args.runs):
+            elapsed, loaded = run_cli(workdir, cli_args)
+            samples.append(elapsed)
+            heavy.update(loaded)
+        median = statistics.median(samples)
+        print(f'{name:<20}{median:>9.3f}s{BUDGETS[name]:>9.2f}s  {", ".join(sorted(heavy)) or "-"}')
+        if median > BUDGETS[name]:
+            failed = True
+            print(f'FAIL: `robots {" ".join(cli_args)}` is over its start-up budget')
+        if heavy:
+            failed = True
+            print(f'FAIL: `robots {" ".join(cli_args)}` imported {", ".join(sorted(heavy))}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
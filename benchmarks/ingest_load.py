@@ -0,0 +1,132 @@
+"""
+Status ingestion load test
+
+Serves the API from a threaded local server over a synthetic fleet. Client
+threads then post status reports as fast as they can for a fixed time, as
+single reports or batches. The script reports throughput, latency
+percentiles and 503 backpressure responses. Once the buffer drains, it
+checks that every robot's stored values match the last report accepted for
+it.
+
+    python benchmarks/ingest_load.py [--robots 5000] [--clients 16] [--seconds 10]
+        [--batch 1] [--database-url postgresql://...]
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from common import build_fleet, load_cli
+
+STATUSES = ('idle', 'charging', 'busy', 'error')
+
+
+def client(port, robots, batch, deadline, seed, results):
+    """Post reports until the deadline, recording latencies and the last accepted report per robot
+
+    Each client owns its robots, so its own request order is the order the
+    server accepted their reports in.
+    """
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    latencies, rejected, last = [], 0, {}
+    sequence = 0
+    while time.monotonic() < deadline:
+        reports = []
+        for _ in range(batch):
+            sequence += 1
+            reports.append({
+                'name': rng.choice(robots),
+                'status': rng.choice(STATUSES),
+                'aspects': {'battery-level': rng.randint(0, 100), 'seq': f'{seed}-{sequence}'},
+            })
+        if batch == 1:
+            path, body = f"/api/robots/{reports[0]['name']}/status", reports[0]
+        else:
+            path, body = '/api/robots/status', reports
+
+        started = time.perf_counter()
+        connection.request('POST', path, json.dumps(body), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        if response.status == 202:
+            for report in reports:
+                last[report['name']] = report
+        elif response.status == 503:
+            rejected += 1
+            time.sleep(float(response.getheader('Retry-After', '1')) / 10)
+        else:
+            raise RuntimeError(f"Unexpected {response.status} from {path}")
+    results.append((latencies, rejected, last))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--robots', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--batch', type=int, default=1, help='Reports per request')
+    parser.add_argument('--database-url', help='Database to use instead of a scratch SQLite file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='robots-bench-')
+    commands = load_cli(workdir, args.database_url)
+    build_fleet(commands.get_app(), args.robots)
+
+    from robots.api.app import app
+    from robots.models import db, Robot, RobotAspect
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    names = [f'robot{i:05d}' for i in range(args.robots)]
+    deadline = time.monotonic() + args.seconds
+    results = []
+    threads = [threading.Thread(target=client, args=(server.port, names[seed::args.clients], args.batch,
+                                                     deadline, seed, results))
+               for seed in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Waits for a flush already running, then writes what is left
+    buffer = app.extensions['status_buffer']
+    buffer.close()
+    server.shutdown()
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    requests = len(latencies)
+    reports = requests * args.batch
+    rejected = sum(result[1] for result in results)
+    print(f'{requests} requests ({reports} reports) in {args.seconds:g}s from {args.clients} clients')
+    print(f'  throughput   {requests / args.seconds:10.0f} req/s {reports / args.seconds:10.0f} reports/s')
+    print(f'  latency p50  {statistics.median(latencies) * 1000:10.2f} ms')
+    print(f'  latency p99  {latencies[int(len(latencies) * 0.99) - 1] * 1000:10.2f} ms')
+    print(f'  503s         {rejected:10d}')
+    print(f'  buffer       {json.dumps(buffer.snapshot_stats())}')
+
+    expected = {name: report for _, _, last in results for name, report in last.items()}
+    with app.app_context():
+        stored = dict(db.session.execute(db.select(Robot.name, Robot.status)).all())
+        seqs = dict(db.session.execute(
+            db.select(Robot.name, RobotAspect.value).join(RobotAspect).where(RobotAspect.name == 'seq')
+        ).all())
+    mismatched = [name for name, report in expected.items()
+                  if stored[name] != report['status'] or seqs.get(name) != report['aspects']['seq']]
+    print(f'  robots       {len(expected)} reported, {len(mismatched)} with stale values')
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == '__main__':
+    main()
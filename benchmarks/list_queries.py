@@ -0,0 +1,56 @@
+"""
+List query-count check
+
+Builds SQLite fleets of increasing size and asserts that `robots list`,
+`robots list --detailed` and `robots inspect` issue the same number of SQL
+statements regardless of how many robots there are. tests/test_list_queries.py
+runs the same check under pytest; this script prints the counts for larger
+fleets.
+
+    python benchmarks/list_queries.py
+"""
+
+import sys
+import tempfile
+
+from click.testing import CliRunner
+
+from common import build_fleet, count_statements, load_cli
+
+FLEET_SIZES = (10, 200, 1000)
+
+
+def count_queries(commands, args):
+    """Run a CLI command and return how many statements it sent to the DB"""
+    with count_statements(commands.get_app()) as statements:
+        result = CliRunner().invoke(commands.cli, args)
+        assert result.exit_code == 0, result.output
+    return len(statements)
+
+
+def main():
+    commands = load_cli(tempfile.mkdtemp(prefix='robots-bench-'))
+    paths = {
+        'list': ['list'],
+        'list --detailed': ['list', '--detailed'],
+        'list --detailed --filter': ['list', '--detailed', '--filter', 'model', 'modelA'],
+        'inspect': ['inspect', 'robot00001'],
+    }
+    counts = {path: [] for path in paths}
+    for size in FLEET_SIZES:
+        build_fleet(commands.get_app(), size)
+        for path, args in paths.items():
+            counts[path].append(count_queries(commands, args))
+
+    failed = False
+    print(f"{'path':<28}" + ''.join(f'{size:>8}' for size in FLEET_SIZES))
+    for path, row in counts.items():
+        print(f'{path:<28}' + ''.join(f'{count:>8}' for count in row))
+        if len(set(row)) != 1:
+            failed = True
+            print(f'FAIL: query count for `{path}` grows with fleet size')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
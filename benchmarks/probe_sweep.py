@@ -0,0 +1,102 @@
+"""
+Live probe sweep benchmark
+
+Probes a synthetic fleet of local "robots": some answer with an SSH
+banner, some accept the connection but never speak (and so time out), and
+some refuse the connection. Reports the wall time of the sweep next to what
+probing them one after another would have cost, and checks every robot
+came back in the expected state.
+
+    python benchmarks/probe_sweep.py [--robots 1000] [--silent 0.1] [--refused 0.1]
+        [--timeout 1.0] [--concurrency 256]
+"""
+
+import argparse
+import asyncio
+import random
+import socket
+import sys
+import threading
+import time
+
+from robots.api.connector import RobotConnector
+from robots.api.probe import ONLINE, UNREACHABLE
+
+ANSWERING = '127.0.0.1'
+SILENT = '127.0.0.2'
+REFUSING = '127.0.0.3'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((ANSWERING, 0))
+        return sock.getsockname()[1]
+
+
+def serve(port, ready):
+    """Banner server on ANSWERING and a silent one on SILENT, both on port"""
+    async def banner(reader, writer):
+        writer.write(b'SSH-2.0-OpenSSH_9.2 benchmark\r\n')
+        await writer.drain()
+        writer.close()
+
+    async def silent(reader, writer):
+        await reader.read()
+        writer.close()
+
+    async def main():
+        await asyncio.start_server(banner, ANSWERING, port, backlog=4096)
+        await asyncio.start_server(silent, SILENT, port, backlog=4096)
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--robots', type=int, default=1000)
+    parser.add_argument('--silent', type=float, default=0.1, help='Fraction that never answer')
+    parser.add_argument('--refused', type=float, default=0.1, help='Fraction that refuse')
+    parser.add_argument('--timeout', type=float, default=1.0)
+    parser.add_argument('--concurrency', type=int, default=256)
+    args = parser.parse_args()
+
+    port = free_port()
+    ready = threading.Event()
+    threading.Thread(target=serve, args=(port, ready), daemon=True).start()
+    ready.wait()
+
+    rng = random.Random(42)
+    targets, expected = [], {}
+    for index in range(args.robots):
+        name = f'robot{index:05d}'
+        roll = rng.random()
+        host = SILENT if roll < args.silent else REFUSING if roll < args.silent + args.refused else ANSWERING
+        targets.append((name, host))
+        expected[name] = ONLINE if host == ANSWERING else UNREACHABLE
+
+    connector = RobotConnector({'probe-port': port, 'probe-timeout': args.timeout,
+                                'probe-concurrency': args.concurrency})
+    started = time.perf_counter()
+    results = connector.probe(targets)
+    elapsed = time.perf_counter() - started
+
+    wrong = [result.name for result in results if result.state != expected[result.name]]
+    silent = sum(1 for _, host in targets if host == SILENT)
+    latencies = sorted(result.latency for result in results if result.latency is not None)
+    print(f"Probed {len(results)} robots in {elapsed:.2f}s "
+          f"(concurrency {args.concurrency}, timeout {args.timeout:g}s)")
+    print(f"  {len(latencies)} online, {len(results) - len(latencies)} unreachable "
+          f"({silent} timed out)")
+    if latencies:
+        print(f"  latency p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms")
+    print(f"  one at a time, the timeouts alone would take {silent * args.timeout:.0f}s")
+    if wrong:
+        print(f"FAIL: {len(wrong)} robots in the wrong state, e.g. {wrong[:5]}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
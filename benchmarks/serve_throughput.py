@@ -0,0 +1,124 @@
+"""
+API serving throughput by worker count
+
+Builds a synthetic fleet, then for each worker count starts `robots serve`
+on it and has client processes request a mix of listing, change feed and
+health endpoints over keep-alive connections for a fixed time. Reports
+requests per second, latency percentiles and the speedup over the first
+worker count. With a single worker every request shares one interpreter
+lock; throughput should grow with workers up to the number of CPUs.
+
+    python benchmarks/serve_throughput.py [--robots 5000] [--workers 1,2,4] [--clients 16]
+        [--seconds 10] [--database-url postgresql://...]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import build_fleet, load_cli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = (
+    '/api/robots?limit=50&filter=model:modelA',
+    '/api/robots?limit=20&sort=-battery-level',
+    '/api/changes?since=0&limit=100',
+    '/api/health',
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def client(port, deadline, seed, results):
+    """Request PATHS in turn until the deadline, recording each latency"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    index = seed
+    while time.monotonic() < deadline:
+        path = PATHS[index % len(PATHS)]
+        index += 1
+        started = time.perf_counter()
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        if response.status != 200:
+            raise RuntimeError(f"Unexpected {response.status} from {path}")
+        if response.will_close:
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    results.put(latencies)
+
+
+def run_level(workers, clients, seconds, workdir, env):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-c', 'from robots.cli import cli; cli()', 'serve', '--workers', str(workers),
+         '--port', str(port)], cwd=workdir, env=env, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        results = multiprocessing.Queue()
+        deadline = time.monotonic() + seconds
+        processes = [multiprocessing.Process(target=client, args=(port, deadline, seed, results))
+                     for seed in range(clients)]
+        for process in processes:
+            process.start()
+        latencies = sorted(latency for _ in processes for latency in results.get())
+        for process in processes:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--robots', type=int, default=5000)
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts')
+    parser.add_argument('--clients', type=int, default=16, help='Client processes')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--database-url', help='Database to use instead of a scratch SQLite file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='robots-bench-')
+    commands = load_cli(workdir, args.database_url)
+    build_fleet(commands.get_app(), args.robots)
+    env = dict(os.environ, ROBOTS_CONFIG=os.path.join(workdir, 'robots', 'config', 'fleet-config.toml'),
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+
+    print(f'{args.robots} robots, {args.clients} clients, {args.seconds:g}s per level, {os.cpu_count()} CPUs')
+    print(f"{'workers':>8} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'speedup':>8}")
+    results, base = [], None
+    for workers in [int(level) for level in args.workers.split(',')]:
+        latencies = run_level(workers, args.clients, args.seconds, workdir, env)
+        rate = len(latencies) / args.seconds
+        base = base or rate
+        p50, p99 = statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+        results.append({'workers': workers, 'requests': len(latencies), 'rps': rate,
+                        'p50': p50, 'p99': p99, 'speedup': rate / base})
+        print(f'{workers:>8} {len(latencies):>9} {rate:>8.0f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f} '
+              f'{rate / base:>7.2f}x')
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
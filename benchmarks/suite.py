@@ -0,0 +1,190 @@
+"""
+CLI, database and API benchmark suite
+
+Builds a synthetic fleet (robots x aspects, the same on every run), then
+runs each CLI command path and API endpoint against it, recording the best
+wall time, the number of SQL statements sent and the peak Python memory
+allocated. Results are compared with benchmarks/baseline.json, keyed by
+database backend and fleet shape, and the script exits non-zero when any
+path got slower, sent more statements or used more memory than its
+baseline allows.
+
+    python benchmarks/suite.py [--robots 10000] [--aspects 50] [--database-url postgresql://...]
+        [--only list] [--update-baseline]
+
+Timings depend on the machine, so refresh the baseline with
+--update-baseline on the machine the comparisons run on. Statement counts
+do not, and any increase fails.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+from click.testing import CliRunner
+
+from common import build_fleet, count_statements, load_cli, peak_memory, timed
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# A path fails when it takes longer than baseline * SLOWER + SLACK seconds,
+# or allocates more than baseline * BIGGER + MEMORY_SLACK KB at peak
+SLOWER = 1.5
+SLACK = 0.005
+BIGGER = 1.25
+MEMORY_SLACK = 512
+
+
+def cli_path(commands, args):
+    """A CLI invocation; args may be a function returning fresh args per run"""
+    runner = CliRunner()
+
+    def run():
+        argv = args() if callable(args) else args
+        result = runner.invoke(commands.cli, argv)
+        if result.exit_code != 0:
+            raise RuntimeError(f"`robots {' '.join(argv)}` exited {result.exit_code}: {result.output[-500:]}")
+    return run
+
+
+def api_path(client, url, method='GET', expect=200, **kwargs):
+    """An API request whose body is read to the end; kwargs may be a function too"""
+    def run():
+        options = kwargs['options']() if 'options' in kwargs else kwargs
+        response = client.open(url, method=method, **options)
+        response.get_data()
+        if response.status_code != expect:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}, expected {expect}")
+    return run
+
+
+def paths(commands, api_app, robots):
+    """{name: (app whose engine runs the statements, function running the path)}"""
+    cli_app = commands.get_app()
+    client = api_app.test_client()
+    target = f'robot{robots // 2:05d}'
+    runs = itertools.count()
+    etag = client.get('/api/robots').headers['ETag']
+
+    return {
+        # Reads come first, so the ETag above is still current for the 304 path
+        'cli list': (cli_app, cli_path(commands, ['list', '--fresh'])),
+        'cli list --detailed --filter --sort': (cli_app, cli_path(
+            commands, ['list', '--fresh', '--detailed', '--filter', 'customer', 'google',
+                       '--sort', '-battery-level'])),
+        'cli inspect': (cli_app, cli_path(commands, ['inspect', target, '--fresh'])),
+        'api GET /robots': (api_app, api_path(client, '/api/robots')),
+        'api GET /robots?filter&sort': (api_app, api_path(
+            client, '/api/robots?filter=customer:google&filter=model:modelA&sort=-battery-level')),
+        'api GET /robots?limit=100': (api_app, api_path(client, '/api/robots?limit=100')),
+        'api GET /robots (304)': (api_app, api_path(
+            client, '/api/robots', expect=304, headers={'If-None-Match': etag})),
+        'api GET /changes': (api_app, api_path(client, '/api/changes?since=0&limit=1000')),
+        'cli create': (cli_app, cli_path(
+            commands, lambda: ['create', f'bench{next(runs):05d}', 'modelA', 'bench.local'])),
+        'cli edit NAME': (cli_app, cli_path(
+            commands, lambda: ['edit', target, '--status', f'bench-{next(runs)}'])),
+        'cli edit --filter': (cli_app, cli_path(
+            commands, lambda: ['edit', '--filter', 'model', 'modelA', '--aspect', 'firmware', f'v{next(runs)}'])),
+        'api POST /robots/NAME/status': (api_app, api_path(
+            client, f'/api/robots/{target}/status', method='POST', expect=202,
+            options=lambda: {'json': {'status': 'busy', 'aspects': {'battery-level': str(next(runs) % 100)}}})),
+    }
+
+
+def measure(app, run, repeat):
+    """{seconds, queries, peak_kb} for one path; the first run also warms it up"""
+    with count_statements(app) as statements:
+        run()
+    return {
+        'seconds': round(timed(run, repeat), 4),
+        'queries': len(statements),
+        'peak_kb': round(peak_memory(run)),
+    }
+
+
+def compare(result, baseline):
+    """Reasons a result regressed from its baseline"""
+    failures = []
+    if result['queries'] > baseline['queries']:
+        failures.append(f"{result['queries']} statements, baseline {baseline['queries']}")
+    if result['seconds'] > baseline['seconds'] * SLOWER + SLACK:
+        failures.append(f"{result['seconds'] * 1000:.1f}ms, baseline {baseline['seconds'] * 1000:.1f}ms")
+    if result['peak_kb'] > baseline['peak_kb'] * BIGGER + MEMORY_SLACK:
+        failures.append(f"{result['peak_kb'] / 1024:.1f}MB peak, baseline {baseline['peak_kb'] / 1024:.1f}MB")
+    return failures
+
+
+def change(value, base):
+    if not base:
+        return ''
+    return f'{(value - base) / base * 100:+.0f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--robots', type=int, default=10000)
+    parser.add_argument('--aspects', type=int, default=50, help='Aspects per robot')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per path; the best counts')
+    parser.add_argument('--database-url', help='Database to use instead of a scratch SQLite file')
+    parser.add_argument('--only', action='append', help='Run only paths containing this text (repeatable)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store these results as the baseline instead of comparing with it')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='robots-bench-')
+    commands = load_cli(workdir, args.database_url)
+    backend = (args.database_url or 'sqlite').split(':')[0].split('+')[0]
+    key = f'{backend}:{args.robots}x{args.aspects}'
+
+    print(f'Building {args.robots} robots with {args.aspects} aspects each ({backend})...', flush=True)
+    started = time.perf_counter()
+    build_fleet(commands.get_app(), args.robots, args.aspects)
+    print(f'Built in {time.perf_counter() - started:.1f}s\n', flush=True)
+
+    from robots.api.app import app as api_app
+    try:
+        results = {}
+        for name, (app, run) in paths(commands, api_app, args.robots).items():
+            if args.only and not any(text in name for text in args.only):
+                continue
+            results[name] = measure(app, run, args.repeat)
+    finally:
+        api_app.extensions['status_buffer'].close()
+
+    try:
+        with open(BASELINE) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    if args.update_baseline:
+        baselines[key] = dict(baselines.get(key, {}), **results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Stored baseline for {key} in {BASELINE}\n')
+    baseline = baselines.get(key, {})
+
+    failed = []
+    print(f"{'path':<38}{'ms':>9}{'vs base':>9}{'queries':>9}{'base':>6}{'peak MB':>9}{'vs base':>9}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        print(f"{name:<38}{result['seconds'] * 1000:>9.1f}"
+              f"{change(result['seconds'], base and base['seconds']):>9}"
+              f"{result['queries']:>9}{base['queries'] if base else '-':>6}"
+              f"{result['peak_kb'] / 1024:>9.1f}{change(result['peak_kb'], base and base['peak_kb']):>9}")
+        if base:
+            failed.extend(f'{name}: {reason}' for reason in compare(result, base))
+    if not baseline:
+        print(f'\nNo baseline for {key}; run with --update-baseline to store one')
+    for failure in failed:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""initial schema
+
+Revision ID: 1c9e4f2a7b30
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+Databases created before migrations existed (by db.create_all) already
+match this revision; mark them with `flask db stamp 1c9e4f2a7b30`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c9e4f2a7b30'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('users',
+    sa.Column('oauth_id', sa.String(length=255), nullable=False),
+    sa.Column('email', sa.String(length=255), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('oauth_id')
+    )
+    op.create_table('robots',
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('model', sa.String(length=255), nullable=False),
+    sa.Column('hostname', sa.String(length=255), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=True),
+    sa.Column('deployed', sa.Boolean(), nullable=True),
+    sa.Column('location', sa.String(length=255), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('robot_aspects',
+    sa.Column('robot_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('value', sa.String(length=255), nullable=True),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['robot_id'], ['robots.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('robot_id', 'name', name='uix_robot_aspect')
+    )
+
+
+def downgrade():
+    op.drop_table('robot_aspects')
+    op.drop_table('robots')
+    op.drop_table('users')
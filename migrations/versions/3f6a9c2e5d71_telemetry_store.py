@@ -0,0 +1,57 @@
+"""telemetry store
+
+Revision ID: 3f6a9c2e5d71
+Revises: 8e2b6c0d9f14
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a9c2e5d71'
+down_revision = '8e2b6c0d9f14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('telemetry_samples',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('robot_id', sa.Integer(), nullable=False),
+        sa.Column('metric', sa.String(length=64), nullable=False),
+        sa.Column('ts', sa.BigInteger(), nullable=False),
+        sa.Column('value', sa.Float(), nullable=True),
+        sa.Column('text', sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(['robot_id'], ['robots.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_telemetry_samples_robot_metric_ts', 'telemetry_samples',
+                    ['robot_id', 'metric', 'ts'], unique=False)
+    op.create_index('ix_telemetry_samples_ts', 'telemetry_samples', ['ts'], unique=False)
+
+    op.create_table('telemetry_rollups',
+        sa.Column('robot_id', sa.Integer(), nullable=False),
+        sa.Column('metric', sa.String(length=64), nullable=False),
+        sa.Column('resolution', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.BigInteger(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=True),
+        sa.Column('minimum', sa.Float(), nullable=True),
+        sa.Column('maximum', sa.Float(), nullable=True),
+        sa.Column('last', sa.Float(), nullable=True),
+        sa.Column('last_text', sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(['robot_id'], ['robots.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('robot_id', 'metric', 'resolution', 'bucket')
+    )
+    op.create_index('ix_telemetry_rollups_resolution_bucket', 'telemetry_rollups',
+                    ['resolution', 'bucket'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_telemetry_rollups_resolution_bucket', table_name='telemetry_rollups')
+    op.drop_table('telemetry_rollups')
+    op.drop_index('ix_telemetry_samples_ts', table_name='telemetry_samples')
+    op.drop_index('ix_telemetry_samples_robot_metric_ts', table_name='telemetry_samples')
+    op.drop_table('telemetry_samples')
@@ -0,0 +1,32 @@
+"""aspect filter indexes
+
+Revision ID: 5a7d3e81c4f2
+Revises: 1c9e4f2a7b30
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7d3e81c4f2'
+down_revision = '1c9e4f2a7b30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (name, value, robot_id) answers aspect predicates from the index alone;
+    # per-robot lookups are already covered by uix_robot_aspect (robot_id, name)
+    op.create_index('ix_robot_aspects_name_value', 'robot_aspects',
+                    ['name', 'value', 'robot_id'], unique=False)
+    op.create_index('ix_robots_model', 'robots', ['model'], unique=False)
+    op.create_index('ix_robots_status', 'robots', ['status'], unique=False)
+    op.create_index('ix_robots_location', 'robots', ['location'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_robots_location', table_name='robots')
+    op.drop_index('ix_robots_status', table_name='robots')
+    op.drop_index('ix_robots_model', table_name='robots')
+    op.drop_index('ix_robot_aspects_name_value', table_name='robot_aspects')
@@ -0,0 +1,45 @@
+"""fleet change log
+
+Revision ID: 6c2f8a1d4e93
+Revises: b4d1e7a3c902
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2f8a1d4e93'
+down_revision = 'b4d1e7a3c902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('fleet_changes',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('seq', sa.BigInteger(), nullable=False),
+        sa.Column('robot_id', sa.Integer(), nullable=False),
+        sa.Column('robot_name', sa.String(length=255), nullable=False),
+        sa.Column('aspect', sa.String(length=255), nullable=True),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_fleet_changes_seq'), 'fleet_changes', ['seq'], unique=False)
+
+    counter = op.create_table('fleet_change_counter',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.BigInteger(), nullable=False),
+        sa.Column('pruned_seq', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Seed the single row so concurrent first writers queue on its lock
+    op.bulk_insert(counter, [{'id': 1, 'seq': 0, 'pruned_seq': 0}])
+
+
+def downgrade():
+    op.drop_table('fleet_change_counter')
+    op.drop_index(op.f('ix_fleet_changes_seq'), table_name='fleet_changes')
+    op.drop_table('fleet_changes')
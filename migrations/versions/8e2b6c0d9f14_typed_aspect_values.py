@@ -0,0 +1,70 @@
+"""typed aspect values
+
+Revision ID: 8e2b6c0d9f14
+Revises: 5a7d3e81c4f2
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from robots.db.types import typed_values
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b6c0d9f14'
+down_revision = '5a7d3e81c4f2'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade():
+    with op.batch_alter_table('robot_aspects') as batch_op:
+        batch_op.add_column(sa.Column('value_int', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('value_float', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('value_bool', sa.Boolean(), nullable=True))
+        batch_op.add_column(sa.Column('value_time', sa.DateTime(), nullable=True))
+
+    # Backfill the typed columns from the existing string values
+    aspects = sa.table('robot_aspects',
+        sa.column('id', sa.Integer()),
+        sa.column('value', sa.String()),
+        sa.column('value_int', sa.BigInteger()),
+        sa.column('value_float', sa.Float()),
+        sa.column('value_bool', sa.Boolean()),
+        sa.column('value_time', sa.DateTime()),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(aspects.c.id, aspects.c.value)
+                        .where(aspects.c.value.is_not(None))).fetchall()
+    update = (aspects.update()
+              .where(aspects.c.id == sa.bindparam('aspect_id'))
+              .values(value_int=sa.bindparam('value_int'),
+                      value_float=sa.bindparam('value_float'),
+                      value_bool=sa.bindparam('value_bool'),
+                      value_time=sa.bindparam('value_time')))
+    for start in range(0, len(rows), BATCH_SIZE):
+        bind.execute(update, [
+            dict(aspect_id=row.id, **typed_values(row.value))
+            for row in rows[start:start + BATCH_SIZE]
+        ])
+
+    op.create_index('ix_robot_aspects_name_value_int', 'robot_aspects',
+                    ['name', 'value_int', 'robot_id'], unique=False)
+    op.create_index('ix_robot_aspects_name_value_float', 'robot_aspects',
+                    ['name', 'value_float', 'robot_id'], unique=False)
+    op.create_index('ix_robot_aspects_name_value_time', 'robot_aspects',
+                    ['name', 'value_time', 'robot_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_robot_aspects_name_value_time', table_name='robot_aspects')
+    op.drop_index('ix_robot_aspects_name_value_float', table_name='robot_aspects')
+    op.drop_index('ix_robot_aspects_name_value_int', table_name='robot_aspects')
+    with op.batch_alter_table('robot_aspects') as batch_op:
+        batch_op.drop_column('value_time')
+        batch_op.drop_column('value_bool')
+        batch_op.drop_column('value_float')
+        batch_op.drop_column('value_int')
@@ -0,0 +1,46 @@
+"""audit events
+
+Revision ID: 9d4e2b7f1a58
+Revises: 6c2f8a1d4e93
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e2b7f1a58'
+down_revision = '6c2f8a1d4e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('audit_events',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('action_id', sa.String(length=32), nullable=False),
+        sa.Column('occurred_at', sa.DateTime(), nullable=False),
+        sa.Column('user', sa.String(length=255), nullable=False),
+        sa.Column('host', sa.String(length=255), nullable=True),
+        sa.Column('command', sa.String(length=64), nullable=False),
+        sa.Column('robot', sa.String(length=255), nullable=True),
+        sa.Column('args', sa.JSON(), nullable=True),
+        sa.Column('changes', sa.JSON(), nullable=True),
+        sa.Column('duration', sa.Float(), nullable=True),
+        sa.Column('exit_status', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_audit_events_action_id'), 'audit_events', ['action_id'], unique=False)
+    op.create_index(op.f('ix_audit_events_occurred_at'), 'audit_events', ['occurred_at'], unique=False)
+    op.create_index('ix_audit_events_robot_occurred_at', 'audit_events', ['robot', 'occurred_at'], unique=False)
+    op.create_index('ix_audit_events_user_occurred_at', 'audit_events', ['user', 'occurred_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_audit_events_user_occurred_at', table_name='audit_events')
+    op.drop_index('ix_audit_events_robot_occurred_at', table_name='audit_events')
+    op.drop_index(op.f('ix_audit_events_occurred_at'), table_name='audit_events')
+    op.drop_index(op.f('ix_audit_events_action_id'), table_name='audit_events')
+    op.drop_table('audit_events')
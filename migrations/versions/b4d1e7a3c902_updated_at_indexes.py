@@ -0,0 +1,26 @@
+"""updated_at indexes
+
+Revision ID: b4d1e7a3c902
+Revises: 3f6a9c2e5d71
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d1e7a3c902'
+down_revision = '3f6a9c2e5d71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serve max(updated_at) for ETags and "changed since" scans from the index
+    op.create_index('ix_robots_updated_at', 'robots', ['updated_at'], unique=False)
+    op.create_index('ix_robot_aspects_updated_at', 'robot_aspects', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_robot_aspects_updated_at', table_name='robot_aspects')
+    op.drop_index('ix_robots_updated_at', table_name='robots')
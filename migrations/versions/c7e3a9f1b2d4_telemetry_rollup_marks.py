@@ -0,0 +1,30 @@
+"""telemetry rollup marks
+
+Revision ID: c7e3a9f1b2d4
+Revises: 9d4e2b7f1a58
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e3a9f1b2d4'
+down_revision = '9d4e2b7f1a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Until the first rollup after this, late samples are only picked up in
+    # the newest rolled bucket, as before
+    op.create_table('telemetry_rollup_marks',
+        sa.Column('resolution', sa.Integer(), nullable=False),
+        sa.Column('sample_id', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('resolution')
+    )
+
+
+def downgrade():
+    op.drop_table('telemetry_rollup_marks')
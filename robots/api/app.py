@@ -3,6 +3,9 @@ Flask application for the Robots API
 """
 
 from flask import Flask
+from robots.api.ingest import StatusBuffer
+from robots.api.metrics import ApiMetrics
+from robots.config import load_config
 from robots.db import init_db
 
 def create_app():
@@ -11,6 +14,16 @@ def create_app():
     
     # Initialize database
     init_db(app)
+
+    # Let a front proxy send release chunks (X-Sendfile) instead of Python
+    app.config['USE_X_SENDFILE'] = load_config().get('release-x-sendfile', False)
+
+    # Status reports are buffered and written in bulk in the background
+    app.extensions['status_buffer'] = StatusBuffer(app, load_config())
+
+    # Request and SQL timing, served by /api/metrics
+    if load_config().get('api-metrics', True):
+        ApiMetrics(load_config()).init_app(app)
     
     # Register blueprints
     from robots.api.routes import api_bp
@@ -18,8 +31,13 @@ def create_app():
     
     return app
 
-# Create the application instance
-app = create_app()
+def __getattr__(name):
+    # `from robots.api.app import app` builds the app on first use rather
+    # than at import, so `robots serve` can build it once before forking
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    create_app().run(debug=True) 
\ No newline at end of file
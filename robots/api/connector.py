@@ -4,7 +4,144 @@ Robot Connector
 Handles remote connection tasks for robots
 """
 
+import asyncio
+import os
+import re
+import shlex
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from robots.api.manifest import ManifestCache
+from robots.api.probe import probe_host, probe_many
+
+
+@dataclass
+class ExecResult:
+    """Outcome of running a command on a single robot"""
+    name: str
+    hostname: str
+    exit_code: int = None
+    stdout: str = ''
+    stderr: str = ''
+    duration: float = 0.0
+    timed_out: bool = False
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+    def to_dict(self):
+        """Convert result to dictionary"""
+        return {
+            "name": self.name,
+            "hostname": self.hostname,
+            "exit_code": self.exit_code,
+            "stdout": self.stdout,
+            "stderr": self.stderr,
+            "duration": round(self.duration, 3),
+            "timed_out": self.timed_out
+        }
+
+
+@dataclass
+class TransferResult:
+    """Outcome of an rsync to or from a single robot"""
+    name: str
+    hostname: str
+    location: str = None
+    exit_code: int = None
+    bytes_transferred: int = 0
+    duration: float = 0.0
+    error: str = ''
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+    def to_dict(self):
+        """Convert result to dictionary"""
+        return {
+            "name": self.name,
+            "hostname": self.hostname,
+            "location": self.location,
+            "exit_code": self.exit_code,
+            "bytes_transferred": self.bytes_transferred,
+            "duration": round(self.duration, 3),
+            "error": self.error
+        }
+
+
+# A --info=progress2 update, e.g. "    1,234,567  45%    1.23MB/s    0:00:01"
+_PROGRESS_RE = re.compile(r'^\s*([\d,]+)\s+\d+%')
+
+
+def _format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024:
+            return f"{count:.1f}{unit}" if unit != 'B' else f"{count}B"
+        count /= 1024
+    return f"{count:.1f}TB"
+
+
+class _TransferProgress:
+    """Aggregates per-robot rsync progress into a single status line"""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.running = 0
+        self.bytes = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def update(self, name, transferred):
+        with self.lock:
+            self.bytes[name] = transferred
+
+    def started(self):
+        with self.lock:
+            self.running += 1
+
+    def finished(self, ok):
+        with self.lock:
+            self.running -= 1
+            self.done += 1
+            if not ok:
+                self.failed += 1
+
+    def line(self):
+        with self.lock:
+            return (f"[{self.done}/{self.total}] {self.running} running, "
+                    f"{self.failed} failed, {_format_bytes(sum(self.bytes.values()))} transferred")
+
+
+def _interleave_by_location(targets):
+    """Round-robin targets across locations so no site's queue starves the rest"""
+    groups = defaultdict(list)
+    for target in targets:
+        groups[target[2]].append(target)
+    ordered = []
+    queues = [list(group) for group in groups.values()]
+    while queues:
+        for queue in queues:
+            ordered.append(queue.pop(0))
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+
+def _decode(output):
+    """TimeoutExpired carries raw bytes even when text mode was requested"""
+    if output is None:
+        return ''
+    if isinstance(output, bytes):
+        return output.decode(errors='replace')
+    return output
 
 
 class RobotConnector:
@@ -18,7 +155,45 @@ class RobotConnector:
         self.rsync_options = self.config.get('rsync-options')
         self.ssh_user = self.config.get('ssh-user', 'default_user')
         self.ssh_key_path = self.config.get('ssh-key-path', '/path/to/default/key')
-            
+        self.exec_workers = self.config.get('exec-workers', 32)
+        self.exec_timeout = self.config.get('exec-timeout', 30)
+        self.transfer_workers = self.config.get('transfer-workers', 8)
+        self.transfer_bwlimit = self.config.get('transfer-bwlimit')
+        self.transfer_location_concurrency = self.config.get('transfer-location-concurrency', 4)
+        self.transfer_location_limits = self.config.get('transfer-location-limits', {})
+        self.manifest_cache = ManifestCache(self.config)
+        self.ssh_multiplex = self.config.get('ssh-multiplex', True)
+        self.ssh_control_dir = os.path.expanduser(self.config.get('ssh-control-dir', '~/.robots/ssh'))
+        self.ssh_control_persist = self.config.get('ssh-control-persist', 600)
+        self.probe_port = self.config.get('probe-port', 22)
+        self.probe_timeout = self.config.get('probe-timeout', 2.0)
+        self.probe_concurrency = self.config.get('probe-concurrency', 256)
+        self.probe_command = self.config.get('probe-command')
+        self.probe_command_timeout = self.config.get('probe-command-timeout', 5.0)
+
+    def _control_path(self):
+        """ControlPath pattern shared by every ssh and rsync invocation"""
+        return os.path.join(self.ssh_control_dir, '%r@%h:%p')
+
+    def _ssh_options(self):
+        """Build ssh options from config values"""
+        ssh_options = ['-o', f'User={self.ssh_user}', '-o', f'IdentityFile={self.ssh_key_path}']
+        if self.ssh_multiplex:
+            # The first connection to a host becomes a background master that later
+            # connect/exec/transfer calls reuse, skipping the handshake. ssh closes the
+            # master itself once it has been idle for ControlPersist seconds.
+            os.makedirs(self.ssh_control_dir, mode=0o700, exist_ok=True)
+            ssh_options += [
+                '-o', 'ControlMaster=auto',
+                '-o', f'ControlPath={self._control_path()}',
+                '-o', f'ControlPersist={self.ssh_control_persist}'
+            ]
+        return ssh_options
+
+    def _rsync_shell(self):
+        """rsync remote shell option so transfers ride the same ssh masters"""
+        return ['-e', shlex.join(['ssh'] + self._ssh_options())]
+
     def connect(self, hostname, remote_command=None):
         """Establish SSH connection to robot"""
         if not hostname:
@@ -28,8 +203,7 @@ class RobotConnector:
         try:
             print(f"Connecting to {hostname}...")
 
-            # Create ssh_options from config values:
-            ssh_options = ['-o', f'User={self.ssh_user}', '-o', f'IdentityFile={self.ssh_key_path}']
+            ssh_options = self._ssh_options()
             
             # Run a command as well if it was provided
             if remote_command:
@@ -45,7 +219,7 @@ class RobotConnector:
             print("\nConnection terminated by user")
             return False
             
-    def transfer(self, hostname, source_path, dest_path, pull=False):
+    def transfer(self, hostname, source_path, dest_path, pull=False, name=None, use_cache=True):
         """Transfer files between local machine and robot using rsync
         
         Args:
@@ -53,11 +227,15 @@ class RobotConnector:
             source_path: Path to source directory/file
             dest_path: Path to destination directory/file
             pull: If True, pull from robot. If False, push to robot (default: False)
+            name: Robot's name. Pushes with a name consult the manifest cache
+            use_cache: If False, always rsync the whole tree (default: True)
         """
         if not hostname or not source_path or not dest_path:
             print("Error: Missing required arguments (hostname, source_path, or dest_path)")
             return False
             
+        plan = None
+        files_from = None
         try:
             direction = "from" if pull else "to"
             print(f"Transferring files {direction} {hostname}...")
@@ -67,17 +245,403 @@ class RobotConnector:
             if pull:
                 source = f"{hostname}:{source_path}"
                 dest = dest_path
+                cache_options = []
             else:
-                source = source_path
+                plan = self._plan_push(name, hostname, source_path, dest_path, use_cache)
+                if plan and plan.mode == 'skip':
+                    print(f"{hostname} is up to date, nothing to push")
+                    plan.confirm()
+                    return True
+                source, cache_options, files_from = self._push_source(plan, source_path)
                 dest = f"{hostname}:{dest_path}"
+                if files_from:
+                    print(f"Pushing {len(plan.files)} changed file(s)")
                 
-            cmd = ['rsync'] + self.rsync_options + [source, dest]
+            cmd = ['rsync'] + self.rsync_options + cache_options + self._rsync_shell() + [source, dest]
             subprocess.run(cmd, check=True)
+            if plan:
+                plan.confirm()
             return True
         except subprocess.CalledProcessError:
             print(f"Failed to transfer files {direction} {hostname}")
+            if plan:
+                plan.abandon()
             return False
         except KeyboardInterrupt:
             print("\nFile transfer terminated by user")
+            if plan:
+                plan.abandon()
+            return False
+        finally:
+            if files_from:
+                os.unlink(files_from)
+
+    def _plan_push(self, name, hostname, source_path, dest_path, use_cache):
+        """Consult the manifest cache for a push, if it applies"""
+        if not name or not use_cache or not self.manifest_cache.enabled:
+            return None
+        try:
+            return self.manifest_cache.plan(name, hostname, source_path, dest_path, self.rsync_options)
+        except OSError as e:
+            print(f"Warning: manifest cache unavailable ({e}), pushing everything")
+            return None
+
+    @staticmethod
+    def _push_source(plan, source_path):
+        """rsync source and extra options for a push plan
+
+        Returns:
+            (source, extra rsync options, files-from temp path or None)
+        """
+        if not plan or plan.mode != 'partial':
+            return source_path, [], None
+        files_from = plan.write_files_from()
+        return plan.root, [f'--files-from={files_from}'], files_from
+
+    def run(self, name, hostname, remote_command, timeout=None):
+        """Run a command on a robot non-interactively and capture its output
+
+        Args:
+            name: Robot's name, used to label the result
+            hostname: Robot's hostname
+            remote_command: Command to run on the robot
+            timeout: Seconds before the ssh process is killed (default: exec-timeout)
+
+        Returns:
+            ExecResult for this robot. Never raises for remote failures.
+        """
+        timeout = timeout or self.exec_timeout
+        # BatchMode stops ssh from waiting on a password prompt nobody will answer
+        ssh_options = self._ssh_options() + [
+            '-o', 'BatchMode=yes',
+            '-o', f'ConnectTimeout={max(1, int(timeout))}'
+        ]
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(
+                ['ssh'] + ssh_options + [hostname, remote_command],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+            return ExecResult(name, hostname, proc.returncode, proc.stdout, proc.stderr,
+                              time.monotonic() - start)
+        except subprocess.TimeoutExpired as e:
+            return ExecResult(name, hostname, None, _decode(e.stdout),
+                              _decode(e.stderr) or f"Timed out after {timeout}s",
+                              time.monotonic() - start, timed_out=True)
+        except OSError as e:
+            return ExecResult(name, hostname, None, '', str(e), time.monotonic() - start)
+
+    def execute(self, targets, remote_command, workers=None, timeout=None, on_result=None):
+        """Run a command on many robots in parallel
+
+        Each robot gets its own ssh process with its own timeout, so slow or
+        dead hosts only ever occupy one worker.
+
+        Args:
+            targets: Iterable of (name, hostname) pairs
+            remote_command: Command to run on every robot
+            workers: Maximum number of concurrent ssh processes (default: exec-workers)
+            timeout: Per-host timeout in seconds (default: exec-timeout)
+            on_result: Optional callback invoked with each ExecResult as it completes
+
+        Returns:
+            List of ExecResult in the same order as targets
+        """
+        targets = list(targets)
+        if not targets:
+            return []
+        workers = max(1, min(workers or self.exec_workers, len(targets)))
+
+        results = {}
+        futures = {}
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                executor.submit(self.run, name, hostname, remote_command, timeout): name
+                for name, hostname in targets
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if on_result:
+                    on_result(result)
+        except KeyboardInterrupt:
+            print("\nExecution terminated by user")
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
+        return [results[name] for name, _ in targets if name in results]
+
+    def probe(self, targets, remote_command=None, concurrency=None, timeout=None, on_result=None):
+        """Check which robots are reachable, all at once
+
+        Every robot gets a TCP connect to its SSH port with a banner check,
+        plus remote_command over ssh if given. Probes run concurrently on
+        one event loop, at most `concurrency` at a time.
+
+        Args:
+            targets: Iterable of (name, hostname) pairs
+            remote_command: Optional command that must exit 0 for a robot to
+                count as online (default: probe-command)
+            concurrency: Maximum probes in flight (default: probe-concurrency)
+            timeout: Per-host timeout in seconds (default: probe-timeout)
+            on_result: Optional callback invoked with each ProbeResult as it completes
+
+        Returns:
+            List of ProbeResult in the same order as targets
+        """
+        targets = list(targets)
+        if not targets:
+            return []
+        return asyncio.run(probe_many(
+            targets, lambda name, hostname: self.probe_one(name, hostname, remote_command, timeout),
+            concurrency=concurrency or self.probe_concurrency, on_result=on_result
+        ))
+
+    async def probe_one(self, name, hostname, remote_command=None, timeout=None):
+        """Probe a single robot; a coroutine, for callers running their own event loop
+
+        Args and defaults are as for probe().
+
+        Returns:
+            ProbeResult. Never raises for network failures.
+        """
+        timeout = timeout or self.probe_timeout
+        remote_command = remote_command or self.probe_command
+        ssh_command = None
+        if remote_command:
+            ssh_command = ['ssh'] + self._ssh_options() + [
+                '-o', 'BatchMode=yes',
+                '-o', f'ConnectTimeout={max(1, int(timeout))}',
+                hostname, remote_command
+            ]
+        return await probe_host(name, hostname, port=self.probe_port, timeout=timeout,
+                                ssh_command=ssh_command, command_timeout=self.probe_command_timeout)
+
+    def transfer_many(self, targets, source_path, dest_path, pull=False, workers=None,
+                      bwlimit=None, location_limits=None, use_cache=True):
+        """Transfer files between the local machine and many robots in parallel
+
+        At most `workers` rsyncs run at once, and at most the configured limit
+        per `location` so one site's uplink is never saturated. An aggregate
+        bandwidth budget is split evenly across the workers. When pulling, each
+        robot's files land in `dest_path/<robot name>`.
+
+        Args:
+            targets: Iterable of (name, hostname, location) tuples
+            source_path: Path to source directory/file
+            dest_path: Path to destination directory/file
+            pull: If True, pull from robots. If False, push to robots (default: False)
+            workers: Maximum concurrent transfers (default: transfer-workers)
+            bwlimit: Aggregate bandwidth budget in KB/s (default: transfer-bwlimit)
+            location_limits: Mapping of location to maximum concurrent transfers,
+                merged over transfer-location-limits
+            use_cache: If False, pushes skip the manifest cache (default: True)
+
+        Returns:
+            List of TransferResult in the same order as targets
+        """
+        targets = list(targets)
+        if not targets or not source_path or not dest_path:
+            print("Error: Missing required arguments (targets, source_path, or dest_path)")
+            return []
+
+        workers = max(1, min(workers or self.transfer_workers, len(targets)))
+        bwlimit = bwlimit or self.transfer_bwlimit
+        per_worker_bwlimit = max(1, int(bwlimit) // workers) if bwlimit else None
+
+        limits = dict(self.transfer_location_limits)
+        limits.update(location_limits or {})
+        semaphores = {
+            location: threading.Semaphore(limits.get(location, self.transfer_location_concurrency))
+            for location in {target[2] for target in targets}
+        }
+
+        direction = "from" if pull else "to"
+        print(f"Transferring files {direction} {len(targets)} robots "
+              f"({workers} workers{f', {bwlimit} KB/s budget' if bwlimit else ''})...")
+
+        progress = _TransferProgress(len(targets))
+        stop = threading.Event()
+        ticker = threading.Thread(target=self._report_progress, args=(progress, stop), daemon=True)
+        ticker.start()
+
+        results = {}
+        futures = {}
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                executor.submit(self._transfer_one, target, source_path, dest_path, pull,
+                                per_worker_bwlimit, semaphores[target[2]], progress,
+                                use_cache): target[0]
+                for target in _interleave_by_location(targets)
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        except KeyboardInterrupt:
+            print("\nFile transfer terminated by user")
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        finally:
+            stop.set()
+            ticker.join()
+        executor.shutdown()
+
+        sys.stderr.write(f"\r{progress.line()}\033[K\n")
+        return [results[target[0]] for target in targets if target[0] in results]
+
+    @staticmethod
+    def _report_progress(progress, stop):
+        """Redraw the aggregated progress line until the transfers finish"""
+        while not stop.wait(0.5):
+            sys.stderr.write(f"\r{progress.line()}\033[K")
+            sys.stderr.flush()
+
+    def _transfer_one(self, target, source_path, dest_path, pull, bwlimit, semaphore, progress,
+                      use_cache=True):
+        """Run a single rsync for transfer_many, feeding its progress into the aggregate"""
+        name, hostname, location = target
+        plan = None
+        files_from = None
+        cache_options = []
+        if not pull:
+            plan = self._plan_push(name, hostname, source_path, dest_path, use_cache)
+            if plan and plan.mode == 'skip':
+                plan.confirm()
+                progress.started()
+                progress.finished(True)
+                return TransferResult(name, hostname, location, exit_code=0)
+
+        with semaphore:
+            progress.started()
+            if pull:
+                source = f"{hostname}:{source_path}"
+                dest = os.path.join(dest_path, name) + os.sep
+                os.makedirs(dest, exist_ok=True)
+            else:
+                source, cache_options, files_from = self._push_source(plan, source_path)
+                dest = f"{hostname}:{dest_path}"
+
+            # progress2 output is parsed below rather than shown directly
+            options = [option for option in self.rsync_options if not option.startswith('--info=')]
+            cmd = ['rsync'] + options + cache_options + ['--info=progress2'] + self._rsync_shell()
+            if bwlimit:
+                cmd.append(f'--bwlimit={bwlimit}')
+            cmd += [source, dest]
+
+            start = time.monotonic()
+            result = TransferResult(name, hostname, location)
+            try:
+                with tempfile.TemporaryFile() as stderr:
+                    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                            stderr=stderr)
+                    buffer = b''
+                    for chunk in iter(lambda: proc.stdout.read1(4096), b''):
+                        buffer += chunk
+                        # progress2 redraws with carriage returns
+                        *updates, buffer = re.split(rb'[\r\n]', buffer)
+                        for update in updates:
+                            match = _PROGRESS_RE.match(update.decode(errors='replace'))
+                            if match:
+                                result.bytes_transferred = int(match.group(1).replace(',', ''))
+                                progress.update(name, result.bytes_transferred)
+                    result.exit_code = proc.wait()
+                    if not result.ok:
+                        stderr.seek(0)
+                        result.error = stderr.read().decode(errors='replace').strip()
+            except OSError as e:
+                result.error = str(e)
+            finally:
+                if files_from:
+                    os.unlink(files_from)
+            if plan and result.ok:
+                plan.confirm()
+            elif plan:
+                plan.abandon()
+            result.duration = time.monotonic() - start
+            progress.finished(result.ok)
+            return result
+
+    def sessions(self):
+        """List multiplexed master connections
+
+        Returns:
+            List of dictionaries with user, hostname, port, socket path,
+            opened time and whether the master is still answering
+        """
+        if not os.path.isdir(self.ssh_control_dir):
+            return []
+
+        sessions = []
+        for entry in sorted(os.scandir(self.ssh_control_dir), key=lambda e: e.name):
+            user, _, rest = entry.name.partition('@')
+            hostname, _, port = rest.rpartition(':')
+            if not user or not hostname:
+                continue
+            sessions.append({
+                "user": user,
+                "hostname": hostname,
+                "port": port,
+                "socket": entry.path,
+                "opened": entry.stat().st_mtime,
+                "alive": self._control(entry.path, hostname, 'check')
+            })
+        return sessions
+
+    def close_session(self, hostname):
+        """Close any master connections to a hostname
+
+        Returns:
+            Number of masters closed
+        """
+        closed = 0
+        for session in self.sessions():
+            if session["hostname"] != hostname:
+                continue
+            if session["alive"]:
+                closed += self._control(session["socket"], hostname, 'exit')
+            else:
+                self._remove_socket(session["socket"])
+        return closed
+
+    def prune_sessions(self):
+        """Remove control sockets left behind by masters that have died
+
+        Returns:
+            Number of sockets removed
+        """
+        pruned = 0
+        for session in self.sessions():
+            if not session["alive"]:
+                self._remove_socket(session["socket"])
+                pruned += 1
+        return pruned
+
+    def _control(self, socket_path, hostname, command):
+        """Send an ssh -O control command to a master"""
+        try:
+            proc = subprocess.run(
+                ['ssh', '-o', f'ControlPath={socket_path}', '-O', command, hostname],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                timeout=5
+            )
+        except (subprocess.TimeoutExpired, OSError):
             return False
-    
\ No newline at end of file
+        return proc.returncode == 0
+
+    @staticmethod
+    def _remove_socket(socket_path):
+        try:
+            os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
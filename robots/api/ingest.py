@@ -0,0 +1,226 @@
+"""
+Write-behind buffer for robot status reports
+
+Robots report status and aspect values far more often than any one report
+needs to reach the database. Reports are merged per robot in memory, so a
+robot that reports ten times between flushes costs one row write. A
+background thread flushes the buffer as bulk upserts when it holds
+ingest-flush-size robots or every ingest-flush-interval seconds. When
+ingest-buffer-size robots are waiting, reports for robots not already
+buffered are refused so callers back off instead of growing memory. A
+batch that fails ingest-flush-attempts times in a row is written one robot
+at a time, and the robots that still fail are dropped and logged, so one
+bad report cannot hold up the rest.
+
+Values of the metrics listed in telemetry-metrics are also kept, every one
+of them rather than coalesced, as telemetry samples written in the same
+flush.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from robots.telemetry import TelemetryStore, now_ms
+
+logger = logging.getLogger(__name__)
+
+# Robot columns a status report may change
+REPORTED_FIELDS = ('status', 'location', 'deployed')
+
+
+class BufferFull(Exception):
+    """Raised when a report cannot be buffered until the next flush"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Status buffer is full, retry in {retry_after:g}s")
+        self.retry_after = retry_after
+
+
+class StatusBuffer:
+    """Coalesces status reports per robot and writes them in bulk"""
+
+    def __init__(self, app, config=None):
+        """Initialize StatusBuffer for a Flask app
+
+        Args:
+            app: Flask app whose database the buffer flushes to
+            config: Configuration dictionary containing ingest-* settings
+        """
+        config = config or {}
+        self.app = app
+        self.max_pending = config.get('ingest-buffer-size', 10000)
+        self.flush_size = config.get('ingest-flush-size', 500)
+        self.flush_interval = config.get('ingest-flush-interval', 1.0)
+        self.flush_attempts = config.get('ingest-flush-attempts', 3)
+        self.max_samples = config.get('telemetry-buffer-size', 100000)
+        self.telemetry = TelemetryStore(config)
+        self.pending = {}
+        self.samples = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.failures = 0
+        self.stats = {
+            'accepted': 0,
+            'coalesced': 0,
+            'rejected': 0,
+            'flushed': 0,
+            'unknown': 0,
+            'samples_written': 0,
+            'failed_flushes': 0,
+            'dropped': 0,
+            'last_flush_seconds': None,
+        }
+
+    def submit(self, updates):
+        """Buffer a list of (name, fields, aspects) reports
+
+        The whole list is accepted or refused together.
+
+        Raises:
+            BufferFull: if the new robots in the list do not fit
+        """
+        ts = now_ms()
+        samples = [(name, metric, ts, value)
+                   for name, fields, aspects in updates
+                   for metric, value in [*fields.items(), *aspects.items()]
+                   if self.telemetry.tracks(metric)]
+        with self.lock:
+            new = len({name for name, _, _ in updates if name not in self.pending})
+            if (len(self.pending) + new > self.max_pending
+                    or len(self.samples) + len(samples) > self.max_samples):
+                self.stats['rejected'] += len(updates)
+                raise BufferFull(self.flush_interval)
+            for name, fields, aspects in updates:
+                if name in self.pending:
+                    self.stats['coalesced'] += 1
+                    self.pending[name][0].update(fields)
+                    self.pending[name][1].update(aspects)
+                else:
+                    self.pending[name] = (dict(fields, name=name), dict(aspects))
+            self.samples.extend(samples)
+            self.stats['accepted'] += len(updates)
+            full = len(self.pending) >= self.flush_size or len(self.samples) >= self.max_samples // 2
+
+        self._start()
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """Write every buffered report to the database now
+
+        Reports from a failed flush go back into the buffer, under any newer
+        reports for the same robots, to be retried on the next flush. Once
+        ingest-flush-attempts flushes in a row have failed, the batch is
+        written robot by robot instead and the robots that fail are dropped.
+        """
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            samples, self.samples = self.samples, []
+        if not batch and not samples:
+            return
+
+        started = time.monotonic()
+        try:
+            skipped, written = self._write(batch, samples)
+        except Exception:
+            self.failures += 1
+            if self.failures >= self.flush_attempts:
+                logger.exception("Status flush of %d robots failed %d times, writing robots one at a time",
+                                 len(batch), self.failures)
+                self.failures = 0
+                with self.lock:
+                    self.stats['failed_flushes'] += 1
+                skipped, written = self._write_each(batch, samples)
+            else:
+                logger.exception("Status flush of %d robots failed, will retry", len(batch))
+                with self.lock:
+                    self.stats['failed_flushes'] += 1
+                    self.samples[:0] = samples
+                    for name, (fields, aspects) in batch.items():
+                        if name in self.pending:
+                            fields.update(self.pending[name][0])
+                            aspects.update(self.pending[name][1])
+                        self.pending[name] = (fields, aspects)
+                return
+        else:
+            self.failures = 0
+
+        with self.lock:
+            self.stats['flushed'] += len(batch)
+            self.stats['unknown'] += skipped
+            self.stats['samples_written'] += written
+            self.stats['last_flush_seconds'] = round(time.monotonic() - started, 4)
+        if skipped:
+            logger.warning("Dropped status for %d unknown robots", skipped)
+
+    def _write(self, batch, samples):
+        """Write reports and samples in one transaction; returns (unknown robots, samples written)"""
+        from robots.db.bulk import import_fleet
+        from robots.models import db
+
+        with self.app.app_context():
+            try:
+                stats = import_fleet(db.session, batch.values(), None,
+                                     batch_size=self.flush_size, create=False)
+                written, _ = self.telemetry.record(db.session, samples) if samples else (0, 0)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        return stats.skipped, written
+
+    def _write_each(self, batch, samples):
+        """Write each robot's report and samples on its own, dropping the ones that fail"""
+        by_robot = {}
+        for sample in samples:
+            by_robot.setdefault(sample[0], []).append(sample)
+        skipped = written = 0
+        for name in {*batch, *by_robot}:
+            report = {name: batch[name]} if name in batch else {}
+            try:
+                robot_skipped, robot_written = self._write(report, by_robot.get(name, []))
+            except Exception:
+                logger.exception("Dropped status for robot %s", name)
+                with self.lock:
+                    self.stats['dropped'] += 1
+                continue
+            skipped += robot_skipped
+            written += robot_written
+        return skipped, written
+
+    def snapshot_stats(self):
+        """Counters plus the current number of buffered robots and samples"""
+        with self.lock:
+            return dict(self.stats, pending=len(self.pending), pending_samples=len(self.samples))
+
+    def close(self):
+        """Stop the flush thread after writing what is buffered"""
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+        self.flush()
+
+    def _start(self):
+        # The thread starts on first use rather than with the app, so that
+        # pre-forked workers each get their own
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name='status-flush', daemon=True)
+            self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self.stopping:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if self.stopping:
+                return
+            self.flush()
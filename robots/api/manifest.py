@@ -0,0 +1,204 @@
+"""
+Manifest Cache
+
+Keeps a local record of what was last pushed to each (robot, dest_path) so a
+push only has to send the files that changed since then.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+MANIFEST_VERSION = 1
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """Return the sha256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_tree(root, prefix='', previous=None):
+    """Build a manifest of every file below root
+
+    Files whose size and mtime match the previous manifest reuse its hash
+    instead of being read again.
+
+    Args:
+        root: Directory to walk
+        prefix: Prefix for the relative paths recorded in the manifest
+        previous: Manifest from an earlier scan of the same tree
+
+    Returns:
+        Dictionary of relative path to [size, mtime_ns, sha256]
+    """
+    previous = previous or {}
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.join(prefix, os.path.relpath(path, root))
+            stat = os.lstat(path)
+            known = previous.get(relpath)
+            if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                manifest[relpath] = known
+            elif os.path.islink(path):
+                manifest[relpath] = [stat.st_size, stat.st_mtime_ns, 'link:' + os.readlink(path)]
+            else:
+                manifest[relpath] = [stat.st_size, stat.st_mtime_ns, hash_file(path)]
+    return manifest
+
+
+class PushPlan:
+    """What a push needs to send, as decided from the manifest cache
+
+    mode is one of:
+        full: no usable cache entry, rsync the whole tree
+        partial: rsync only `files`, relative to `root`
+        skip: the robot already has everything
+    """
+
+    def __init__(self, cache, key, mode, root=None, files=None, entry=None):
+        self.cache = cache
+        self.key = key
+        self.mode = mode
+        self.root = root
+        self.files = files or []
+        self.entry = entry
+
+    def write_files_from(self):
+        """Write the changed file list for rsync --files-from and return its path"""
+        fd, path = tempfile.mkstemp(prefix='robots-files-', suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(self.files) + '\n')
+        return path
+
+    def confirm(self):
+        """Record the pushed manifest as confirmed on the robot"""
+        if self.entry is None:
+            return
+        self.entry['confirmed'] = self.entry['local']
+        # A skipped push never talked to the robot, so it does not extend the TTL
+        if self.mode != 'skip':
+            self.entry['confirmed_at'] = time.time()
+        self.cache.save(self.key, self.entry)
+
+    def abandon(self):
+        """Drop the cache entry after a failed push so the next one runs in full"""
+        self.cache.invalidate(self.key)
+
+
+class ManifestCache:
+    """On-disk manifest cache keyed by (robot, dest_path)"""
+
+    def __init__(self, config=None):
+        """Initialize ManifestCache with optional config
+
+        Args:
+            config: Configuration dictionary containing manifest-cache-* settings
+        """
+        config = config or {}
+        self.enabled = config.get('manifest-cache', True)
+        self.cache_dir = os.path.expanduser(config.get('manifest-cache-dir', '~/.robots/manifests'))
+        # Anything older is treated as stale, since the robot may have been
+        # changed by other means since it was last confirmed.
+        self.max_age = config.get('manifest-cache-ttl', 86400)
+
+    def _path(self, key):
+        robot, dest_path = key
+        digest = hashlib.sha1(dest_path.encode()).hexdigest()
+        return os.path.join(self.cache_dir, robot, f'{digest}.json')
+
+    def load(self, key):
+        """Load a cache entry, dropping it if it is unreadable"""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            if entry.get('version') != MANIFEST_VERSION:
+                raise ValueError('unknown manifest version')
+            return entry
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError):
+            self.invalidate(key)
+            return None
+
+    def save(self, key, entry):
+        """Atomically write a cache entry"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, key):
+        """Forget what was pushed to (robot, dest_path)"""
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def plan(self, robot, hostname, source_path, dest_path, rsync_options=()):
+        """Decide which files a push has to send
+
+        Args:
+            robot: Robot's name
+            hostname: Robot's hostname
+            source_path: Local path being pushed
+            dest_path: Destination path on the robot
+            rsync_options: rsync options the push will use
+
+        Returns:
+            PushPlan
+        """
+        key = (robot, dest_path)
+        # Single files and deleting pushes gain nothing from a file list
+        if (not self.enabled or not os.path.isdir(source_path)
+                or any(option.startswith('--del') for option in rsync_options)):
+            return PushPlan(self, key, 'full')
+
+        # rsync semantics: "src/" sends the contents, "src" sends the directory itself
+        source_path = os.path.abspath(source_path) + (os.sep if source_path.endswith(os.sep) else '')
+        if source_path.endswith(os.sep):
+            root, prefix = source_path, ''
+        else:
+            root, prefix = os.path.dirname(source_path) + os.sep, os.path.basename(source_path)
+
+        cached = self.load(key)
+        local = scan_tree(source_path, prefix, cached.get('local') if cached else None)
+        entry = {
+            "version": MANIFEST_VERSION,
+            "hostname": hostname,
+            "source": source_path,
+            "local": local,
+            "confirmed": None,
+            "confirmed_at": None
+        }
+
+        stale = (
+            not cached
+            or cached.get('hostname') != hostname
+            or cached.get('source') != source_path
+            or not isinstance(cached.get('confirmed'), dict)
+            or time.time() - (cached.get('confirmed_at') or 0) > self.max_age
+        )
+        if stale:
+            return PushPlan(self, key, 'full', entry=entry)
+
+        confirmed = cached['confirmed']
+        changed = sorted(path for path, meta in local.items()
+                         if confirmed.get(path, [None] * 3)[2] != meta[2])
+        entry['confirmed'] = confirmed
+        entry['confirmed_at'] = cached['confirmed_at']
+        if not changed:
+            return PushPlan(self, key, 'skip', entry=entry)
+        return PushPlan(self, key, 'partial', root=root, files=changed, entry=entry)
@@ -0,0 +1,314 @@
+"""
+Request, SQL and connection pool metrics for the API
+
+Every request is timed from the moment Flask starts handling it until the
+server closes the response, so streamed listings count in full, and the
+SQL statements it ran are counted and timed. /api/metrics serves the totals in
+the Prometheus text format:
+
+    robots_http_requests_total{method,endpoint,status}       counter
+    robots_http_request_duration_seconds{method,endpoint}    histogram
+    robots_http_request_queries{endpoint}                    histogram
+    robots_db_query_duration_seconds{endpoint}               histogram
+    robots_db_connections_opened_total                       counter
+    robots_db_pool_size, _checked_out, _checked_in, _overflow  gauges
+
+Endpoints are labelled by URL rule (/api/robots/<name>/status), not path,
+so the number of series stays fixed. Statements run outside a request,
+such as the status buffer's flushes, are labelled endpoint="background".
+
+Metrics are kept per process. Under `robots serve` with several workers,
+whichever worker accepts a scrape would otherwise answer with only its
+own counts, so every worker also writes its totals to a shared directory
+every api-metrics-interval seconds, and a scrape reports the sum over all
+of them. Counts from workers that have exited stay in the sum, so
+counters never go backwards; their pool gauges are dropped. Each worker's
+file is named by its pid and a token made when it first writes, so a
+worker that reuses a dead one's pid does not overwrite its counts.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+
+from robots.db.timing import watch_engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+QUERY_DURATION_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# (metric name, QueuePool method, help text)
+POOL_GAUGES = (('size', 'size', 'Connections the pool keeps open'),
+               ('checked_out', 'checkedout', 'Connections in use'),
+               ('checked_in', 'checkedin', 'Idle connections in the pool'),
+               ('overflow', 'overflow', 'Connections open beyond the pool size'))
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{_labels(labels, le=_number(bound))} {count}'
+        yield f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}'
+        yield f'{name}_sum{_labels(labels)} {_number(self.sum)}'
+        yield f'{name}_count{_labels(labels)} {self.count}'
+
+    def state(self):
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+    def add(self, state):
+        """Add the counts of another Histogram's state() with the same buckets"""
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, state['counts'])]
+        self.sum += state['sum']
+        self.count += state['count']
+
+
+class ApiMetrics:
+    """Collects request and database metrics for one Flask app"""
+
+    def __init__(self, config=None):
+        """Initialize ApiMetrics with optional config
+
+        Args:
+            config: Configuration dictionary containing api-metrics-* settings
+        """
+        config = config or {}
+        self.latency_buckets = tuple(config.get('api-metrics-buckets', LATENCY_BUCKETS))
+        self.interval = config.get('api-metrics-interval', 1.0)
+        self.directory = None
+        self.writer_pid = None
+        self.filename = None
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(lambda: Histogram(self.latency_buckets))
+        self.queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.query_duration = defaultdict(lambda: Histogram(QUERY_DURATION_BUCKETS))
+        self.connections = 0
+        self.engine = None
+
+    def init_app(self, app):
+        """Time the app's requests and SQL, and make the metrics available to /api/metrics"""
+        from robots.models.base import db
+
+        with app.app_context():
+            self.engine = db.engine
+        watch_engine(self.engine, on_statement=self.on_statement, on_connect=self.on_connect)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.extensions['metrics'] = self
+
+    def share(self, directory):
+        """Sum the metrics of every process that shares directory
+
+        Call before forking the processes; each one starts writing its own
+        totals there once it handles a request.
+        """
+        self.directory = directory
+
+    def before_request(self):
+        g.metrics = {'started': time.perf_counter(), 'queries': 0}
+
+    def after_request(self, response):
+        state = g.get('metrics')
+        if state is not None:
+            key = (request.method, _endpoint(), response.status_code)
+            # Observed when the server closes the response, once a streamed body has been sent
+            response.call_on_close(lambda: self.observe(key, state))
+        return response
+
+    def observe(self, key, state):
+        method, endpoint, status = key
+        elapsed = time.perf_counter() - state['started']
+        with self.lock:
+            self.requests[key] += 1
+            self.latency[(method, endpoint)].observe(elapsed)
+            self.queries[endpoint].observe(state['queries'])
+        if self.directory and self.writer_pid != os.getpid():
+            self._start_writer()
+
+    def on_statement(self, statement, seconds):
+        state = g.get('metrics') if has_request_context() else None
+        if state is not None:
+            state['queries'] += 1
+            endpoint = _endpoint()
+        else:
+            endpoint = 'background'
+        with self.lock:
+            self.query_duration[endpoint].observe(seconds)
+
+    def on_connect(self, seconds):
+        with self.lock:
+            self.connections += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        state = self.state()
+        if self.directory:
+            self.publish(state)
+            state = self.shared_state()
+        lines = []
+        lines.append('# HELP robots_http_requests_total Requests handled, by response status')
+        lines.append('# TYPE robots_http_requests_total counter')
+        for method, endpoint, status, count in sorted(state['requests']):
+            lines.append(f'robots_http_requests_total'
+                         f'{_labels({"method": method, "endpoint": endpoint, "status": status})} {count}')
+        lines.append('# HELP robots_http_request_duration_seconds Time from request start to the end of its body')
+        lines.append('# TYPE robots_http_request_duration_seconds histogram')
+        for (method, endpoint), histogram in sorted(self._histograms(state['latency'], self.latency_buckets)):
+            lines.extend(histogram.lines('robots_http_request_duration_seconds',
+                                         {'method': method, 'endpoint': endpoint}))
+        lines.append('# HELP robots_http_request_queries SQL statements run per request')
+        lines.append('# TYPE robots_http_request_queries histogram')
+        for (endpoint,), histogram in sorted(self._histograms(state['queries'], QUERY_COUNT_BUCKETS)):
+            lines.extend(histogram.lines('robots_http_request_queries', {'endpoint': endpoint}))
+        lines.append('# HELP robots_db_query_duration_seconds Time each SQL statement took')
+        lines.append('# TYPE robots_db_query_duration_seconds histogram')
+        for (endpoint,), histogram in sorted(self._histograms(state['query_duration'], QUERY_DURATION_BUCKETS)):
+            lines.extend(histogram.lines('robots_db_query_duration_seconds', {'endpoint': endpoint}))
+        lines.append('# HELP robots_db_connections_opened_total New database connections opened')
+        lines.append('# TYPE robots_db_connections_opened_total counter')
+        lines.append(f'robots_db_connections_opened_total {state["connections"]}')
+        for name, _, text in POOL_GAUGES:
+            if name in state['pool']:
+                lines.append(f'# HELP robots_db_pool_{name} {text}')
+                lines.append(f'# TYPE robots_db_pool_{name} gauge')
+                lines.append(f'robots_db_pool_{name} {state["pool"][name]}')
+        return '\n'.join(lines) + '\n'
+
+    def state(self):
+        """This process's metrics as JSON-ready lists, keyed by label values"""
+        with self.lock:
+            return {
+                'requests': [[*key, count] for key, count in self.requests.items()],
+                'latency': [[[*key], histogram.state()] for key, histogram in self.latency.items()],
+                'queries': [[[endpoint], histogram.state()] for endpoint, histogram in self.queries.items()],
+                'query_duration': [[[endpoint], histogram.state()]
+                                   for endpoint, histogram in self.query_duration.items()],
+                'connections': self.connections,
+                'pool': self._pool_state(),
+            }
+
+    def publish(self, state=None):
+        """Write this process's totals to the shared directory"""
+        pid = os.getpid()
+        with self.lock:
+            if self.filename is None or not self.filename.startswith(f'{pid}-'):
+                self.filename = f'{pid}-{uuid.uuid4().hex}.json'
+            path = os.path.join(self.directory, self.filename)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state or self.state(), f)
+        os.replace(path + '.tmp', path)
+
+    def shared_state(self):
+        """The sum of every process's latest totals in the shared directory"""
+        requests = defaultdict(int)
+        buckets = {'latency': self.latency_buckets, 'queries': QUERY_COUNT_BUCKETS,
+                   'query_duration': QUERY_DURATION_BUCKETS}
+        histograms = {name: {} for name in buckets}
+        total = {'connections': 0, 'pool': defaultdict(int)}
+        pools = {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+                written = os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            for *key, count in state['requests']:
+                requests[tuple(key)] += count
+            for name, merged in histograms.items():
+                for key, histogram in state[name]:
+                    merged.setdefault(tuple(key), Histogram(buckets[name])).add(histogram)
+            total['connections'] += state['connections']
+            pid = int(os.path.basename(path).split('-')[0])
+            if pid not in pools or written > pools[pid][0]:
+                pools[pid] = (written, state['pool'])
+        # Gauges describe the present, so only running workers count, and of
+        # files sharing a pid only the newest, since a live worker keeps
+        # rewriting its own
+        for pid, (_, pool) in pools.items():
+            if _running(pid):
+                for name, value in pool.items():
+                    total['pool'][name] += value
+        total['requests'] = [[*key, count] for key, count in requests.items()]
+        for name, merged in histograms.items():
+            total[name] = [[[*key], histogram.state()] for key, histogram in merged.items()]
+        return total
+
+    def _start_writer(self):
+        # Started by the first request in each worker, since threads do not survive fork
+        with self.lock:
+            if self.writer_pid == os.getpid():
+                return
+            self.writer_pid = os.getpid()
+        threading.Thread(target=self._write_periodically, name='metrics-writer', daemon=True).start()
+
+    def _write_periodically(self):
+        while True:
+            try:
+                self.publish()
+            except OSError:
+                logger.exception("Could not write metrics to %s", self.directory)
+            time.sleep(self.interval)
+
+    def _histograms(self, states, buckets):
+        for key, state in states:
+            histogram = Histogram(buckets)
+            histogram.add(state)
+            yield tuple(key), histogram
+
+    def _pool_state(self):
+        """Counts from pools that keep them (QueuePool and its relatives)"""
+        pool = self.engine.pool
+        # QueuePool counts unused overflow capacity as negative overflow
+        return {name: max(getattr(pool, method)(), 0) for name, method, _ in POOL_GAUGES if hasattr(pool, method)}
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value))
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
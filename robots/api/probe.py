@@ -0,0 +1,135 @@
+"""
+Live reachability probes
+
+Probes open a TCP connection to each robot's SSH port and wait for the
+server's identification banner, optionally followed by a short remote
+command over ssh. Every probe runs as a coroutine on one event loop, so a
+thousand hosts cost a thousand sockets rather than a thousand threads; a
+semaphore caps how many are in flight and each host gets its own timeout,
+so the whole sweep takes about (hosts / concurrency) * timeout at worst.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+# Robot.status values written back from probes
+ONLINE = 'online'
+UNREACHABLE = 'unreachable'
+UNRESPONSIVE = 'unresponsive'
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of probing a single robot"""
+    name: str
+    hostname: str
+    reachable: bool = False
+    latency: float = None
+    command_ok: bool = None
+    error: str = ''
+
+    @property
+    def state(self):
+        """online, unreachable (no SSH server answered) or unresponsive
+        (SSH answered but the probe command failed)"""
+        if not self.reachable:
+            return UNREACHABLE
+        if self.command_ok is False:
+            return UNRESPONSIVE
+        return ONLINE
+
+    def to_dict(self):
+        """Convert result to dictionary"""
+        return {
+            "name": self.name,
+            "hostname": self.hostname,
+            "state": self.state,
+            "reachable": self.reachable,
+            "latency_ms": None if self.latency is None else round(self.latency * 1000, 1),
+            "command_ok": self.command_ok,
+            "error": self.error
+        }
+
+
+async def probe_host(name, hostname, port=22, timeout=2.0, ssh_command=None, command_timeout=None):
+    """Probe one robot
+
+    Args:
+        name: Robot's name, used to label the result
+        hostname: Robot's hostname
+        port: SSH port to connect to
+        timeout: Seconds allowed for the connection and banner
+        ssh_command: Full ssh argv to run after the TCP check, or None
+        command_timeout: Seconds allowed for ssh_command (default: timeout)
+
+    Returns:
+        ProbeResult. Never raises for network failures.
+    """
+    result = ProbeResult(name, hostname)
+    start = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(hostname, port), timeout)
+        try:
+            banner = await asyncio.wait_for(reader.readline(), timeout - (time.monotonic() - start))
+        finally:
+            writer.close()
+        if not banner.startswith(b'SSH-'):
+            result.error = 'no SSH banner'
+            return result
+        result.reachable = True
+        result.latency = time.monotonic() - start
+    except asyncio.TimeoutError:
+        result.error = f'timed out after {timeout:g}s'
+        return result
+    except OSError as e:
+        result.error = e.strerror or str(e)
+        return result
+
+    if ssh_command:
+        result.command_ok, result.error = await _run(ssh_command, command_timeout or timeout)
+    return result
+
+
+async def _run(argv, timeout):
+    """(succeeded, error) for a subprocess with a timeout"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    except OSError as e:
+        return False, str(e)
+    try:
+        _, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return False, f'command timed out after {timeout:g}s'
+    if proc.returncode != 0:
+        lines = stderr.decode(errors='replace').strip().splitlines()
+        return False, lines[-1] if lines else f'command exited {proc.returncode}'
+    return True, ''
+
+
+async def probe_many(targets, probe, concurrency=256, on_result=None):
+    """Probe (name, hostname) targets concurrently
+
+    Args:
+        targets: List of (name, hostname) pairs
+        probe: Coroutine function called as probe(name, hostname)
+        concurrency: Most probes in flight at once
+        on_result: Optional callback invoked with each ProbeResult as it completes
+
+    Returns:
+        List of ProbeResult in the same order as targets
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(name, hostname):
+        async with semaphore:
+            result = await probe(name, hostname)
+        if on_result:
+            on_result(result)
+        return result
+
+    return await asyncio.gather(*[bounded(name, hostname) for name, hostname in targets])
@@ -2,10 +2,26 @@
 API routes for the Robots application
 """
 
-from flask import Blueprint, jsonify
+import hashlib
+import json
+import math
+import re
+
+from flask import Blueprint, Response, current_app, jsonify, request, send_file, stream_with_context
+from sqlalchemy import func, select
+from robots.api.ingest import REPORTED_FIELDS, BufferFull
+from robots.build import BuildError, ReleaseStore
+from robots.build.store import release_summary
+from robots.config import load_config
+from robots.db.changes import ChangeFeed, CursorExpired
+from robots.db.pagination import decode_cursor, encode_cursor, keyset_query
+from robots.db.predicates import FilterError
+from robots.db.types import parse_typed
 from robots.models.base import db
 from robots.models.robot import Robot
+from robots.models.robot_aspect import RobotAspect
 from robots.models.user import User
+from robots.telemetry import TelemetryStore, format_time, parse_time
 
 api_bp = Blueprint('api', __name__)
 
@@ -14,6 +30,13 @@ def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy'})
 
+@api_bp.route('/metrics')
+def metrics():
+    """Request latency, SQL and connection pool metrics in Prometheus text format"""
+    if 'metrics' not in current_app.extensions:
+        return _error("Metrics are turned off (api-metrics)", 404)
+    return Response(current_app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
+
 @api_bp.route('/test-db')
 def test_db():
     """Test database connection and models"""
@@ -47,4 +70,352 @@ def test_db():
         return jsonify({
             'status': 'error',
             'message': str(e)
-        }), 500 
\ No newline at end of file
+        }), 500
+
+
+def _error(message, code=400):
+    return jsonify({'status': 'error', 'message': message}), code
+
+
+def _parse_report(name, report):
+    """Validate a status report, returning (name, fields, aspects)
+
+    Raises:
+        ValueError: with a message for the client
+    """
+    if not isinstance(report, dict):
+        raise ValueError("Status report must be a JSON object")
+    unknown = set(report) - set(REPORTED_FIELDS) - {'name', 'aspects'}
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    fields = {}
+    for field in REPORTED_FIELDS:
+        if field not in report:
+            continue
+        value = report[field]
+        if field == 'deployed' and not isinstance(value, bool):
+            raise ValueError("'deployed' must be true or false")
+        if field != 'deployed' and not isinstance(value, str):
+            raise ValueError(f"'{field}' must be a string")
+        _check_length(f"'{field}'", value, Robot.__table__.c[field])
+        fields[field] = value
+
+    aspects = report.get('aspects', {})
+    if not isinstance(aspects, dict):
+        raise ValueError("'aspects' must be an object")
+    aspect_types = load_config().get('aspect-types', {})
+    values = {}
+    for aspect_name, value in aspects.items():
+        if isinstance(value, (dict, list)) or value is None:
+            raise ValueError(f"Aspect '{aspect_name}' must be a string, number or boolean")
+        value = str(value).lower() if isinstance(value, bool) else str(value)
+        _check_length(f"Aspect name '{aspect_name}'", aspect_name, RobotAspect.__table__.c.name)
+        _check_length(f"Aspect '{aspect_name}'", value, RobotAspect.__table__.c.value)
+        if aspect_name in aspect_types:
+            try:
+                parse_typed(value, aspect_types[aspect_name])
+            except ValueError:
+                raise ValueError(f"Aspect '{aspect_name}' is declared {aspect_types[aspect_name]}, "
+                                 f"got '{value}'")
+        values[aspect_name] = value
+
+    if not fields and not values:
+        raise ValueError("Status report is empty")
+    return name, fields, values
+
+
+def _check_length(label, value, column):
+    # Caught here rather than by the database, where one long value would
+    # fail the whole buffered flush it lands in
+    if isinstance(value, str) and column.type.length and len(value) > column.type.length:
+        raise ValueError(f"{label} is longer than {column.type.length} characters")
+
+
+def _submit(reports):
+    try:
+        current_app.extensions['status_buffer'].submit(reports)
+    except BufferFull as e:
+        response, code = _error(str(e), 503)
+        response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+        return response, code
+    return jsonify({'status': 'accepted', 'accepted': len(reports)}), 202
+
+
+@api_bp.route('/robots/<name>/status', methods=['POST'])
+def report_status(name):
+    """Buffer one robot's status and aspect values
+
+    Body: {"status": ..., "location": ..., "deployed": ..., "aspects": {...}},
+    every key optional. Returns 202 once buffered, 503 with Retry-After when
+    the buffer is full. Reports for unknown robots are dropped at flush.
+    """
+    try:
+        report = _parse_report(name, request.get_json(silent=True))
+    except ValueError as e:
+        return _error(str(e))
+    return _submit([report])
+
+
+@api_bp.route('/robots/status', methods=['POST'])
+def report_status_batch():
+    """Buffer status reports for many robots at once
+
+    Body: a list of status reports, each with a "name". The batch is
+    accepted or refused as a whole.
+    """
+    reports = request.get_json(silent=True)
+    if not isinstance(reports, list) or not reports:
+        return _error("Body must be a non-empty JSON list of status reports")
+    parsed = []
+    for index, report in enumerate(reports):
+        name = report.get('name') if isinstance(report, dict) else None
+        if not isinstance(name, str) or not name:
+            return _error(f"Report {index} has no name")
+        try:
+            parsed.append(_parse_report(name, report))
+        except ValueError as e:
+            return _error(f"Report {index} ({name}): {e}")
+    return _submit(parsed)
+
+
+@api_bp.route('/ingest')
+def ingest_stats():
+    """Status buffer counters"""
+    return jsonify(current_app.extensions['status_buffer'].snapshot_stats())
+
+
+@api_bp.route('/robots/<name>/history/<metric>')
+def metric_history(name, metric):
+    """A robot's metric history over a window
+
+    Query parameters: since and until (a duration ago such as 6h, or an ISO
+    time; default the last hour) and points (default 60). Served from the
+    cheapest resolution that covers the window.
+    """
+    try:
+        start = parse_time(request.args.get('since', '1h'))
+        end = parse_time(request.args.get('until', 'now'))
+        points = int(request.args.get('points', 60))
+    except ValueError as e:
+        return _error(f"Invalid query parameter: {e}")
+
+    robot = Robot.query.filter_by(name=name).first()
+    if not robot:
+        return _error(f"Robot '{name}' not found", 404)
+    resolution, rows = TelemetryStore(load_config()).history(
+        db.session, robot.id, metric, start, end, points)
+    return jsonify({'robot': name, 'metric': metric, 'resolution': resolution,
+                    'since': format_time(start), 'until': format_time(end), 'points': rows})
+
+
+def fleet_version():
+    """(ETag, Last-Modified) for the robots table and its aspects
+
+    One round trip of three aggregates, all answered from indexes. The
+    count catches deleted robots, which leave no updated_at behind.
+    """
+    newest_robot, robots, newest_aspect = db.session.execute(select(
+        select(func.max(Robot.updated_at)).scalar_subquery(),
+        select(func.count(Robot.id)).scalar_subquery(),
+        select(func.max(RobotAspect.updated_at)).scalar_subquery(),
+    )).one()
+    changes = [moment for moment in (newest_robot, newest_aspect) if moment is not None]
+    last_modified = max(changes) if changes else None
+    fingerprint = f"{newest_robot}|{robots}|{newest_aspect}|{request.query_string.decode()}"
+    return hashlib.sha1(fingerprint.encode()).hexdigest(), last_modified
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return etag in request.if_none_match
+    if request.if_modified_since and last_modified:
+        # HTTP dates have whole-second precision
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+@api_bp.route('/robots')
+def list_robots():
+    """List robots with `robots list` filter and sort semantics
+
+    Query parameters:
+        filter: NAME:VALUE, repeatable, VALUE as in `robots list --filter`
+        sort: field or aspect, prefixed with - to reverse
+        limit: page size; without it every matching robot is returned
+        cursor: next_cursor from the previous page
+        format: json (default) or ndjson, or send Accept: application/x-ndjson
+
+    The body is streamed, fetching robots from the database in chunks.
+    JSON bodies end with "next_cursor"; NDJSON bodies end with a
+    {"next_cursor": ...} line when there is another page. Responses carry
+    an ETag and Last-Modified so polls of an unchanged fleet get 304
+    without the listing query running.
+    """
+    config = load_config()
+    filters = []
+    for raw in request.args.getlist('filter'):
+        name, sep, value = raw.partition(':')
+        if not sep:
+            return _error(f"Filter '{raw}' must look like NAME:VALUE")
+        filters.append((name, value))
+    sort = request.args.get('sort')
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return _error("limit must be a positive integer")
+    ndjson = (request.args.get('format') == 'ndjson' or
+              request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+              == 'application/x-ndjson')
+
+    try:
+        after = decode_cursor(request.args['cursor']) if 'cursor' in request.args else None
+        # Compile once up front so bad filters fail with a 400, not mid-stream
+        keyset_query(Robot.query, filters, sort, config.get('aspect-types'), after)
+    except FilterError as e:
+        return _error(str(e))
+
+    etag, last_modified = fleet_version()
+    if _not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        chunk_size = config.get('api-stream-batch', 500)
+        rows = _page(filters, sort, config.get('aspect-types'), after, limit, chunk_size)
+        body = _ndjson_body(rows) if ndjson else _json_body(rows)
+        response = Response(stream_with_context(body),
+                            mimetype='application/x-ndjson' if ndjson else 'application/json')
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _page(filters, sort, aspect_types, after, limit, chunk_size):
+    """Yield robot dicts in chunks, then a final ('next_cursor', cursor or None)"""
+    emitted = 0
+    while True:
+        want = chunk_size if limit is None else min(chunk_size, limit - emitted)
+        # Fetch one extra on the last chunk of a page to learn if another follows
+        last_chunk = limit is not None and emitted + want >= limit
+        rows = keyset_query(Robot.query_with_aspects(), filters, sort, aspect_types, after) \
+            .limit(want + 1 if last_chunk else want).all()
+        more = len(rows) > want
+        for robot, sort_value in rows[:want]:
+            yield robot.to_dict()
+            after = (sort_value, robot.id)
+            emitted += 1
+        db.session.expunge_all()
+        if last_chunk or len(rows) < want:
+            yield ('next_cursor', encode_cursor(*after) if more else None)
+            return
+
+
+def _json_body(rows):
+    yield '{"robots": ['
+    separator = ''
+    for row in rows:
+        if isinstance(row, tuple):
+            yield f'], "next_cursor": {json.dumps(row[1])}}}\n'
+            return
+        yield separator + json.dumps(row)
+        separator = ',\n'
+
+
+def _ndjson_body(rows):
+    for row in rows:
+        if isinstance(row, tuple):
+            if row[1]:
+                yield json.dumps({'next_cursor': row[1]}) + '\n'
+            return
+        yield json.dumps(row) + '\n'
+
+
+@api_bp.route('/changes')
+def list_changes():
+    """Robots and aspects created, updated or deleted after a cursor
+
+    Query parameters:
+        since: cursor from the previous response, 0 for all retained
+            changes, or "now" to start from the current position
+        limit: most changes to return (a transaction is never split)
+        wait: seconds to hold the request open when nothing has changed yet
+
+    Changes come in seq order. Upserts carry current values ("fields" for
+    a robot, "value" for an aspect); deletes are tombstones. Returns 410
+    when the changes after since have been pruned, with the cursor to
+    resume from after a full resync.
+    """
+    feed = ChangeFeed(load_config())
+    try:
+        raw_since = request.args.get('since', '0')
+        since = feed.latest(db.session)[0] if raw_since == 'now' else int(raw_since)
+        limit = request.args.get('limit', type=int)
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return _error("since must be a cursor or 'now', and wait a number of seconds")
+    if since < 0 or (limit is not None and limit < 1) or wait < 0:
+        return _error("since, limit and wait must not be negative")
+
+    try:
+        changes, cursor, more = feed.changes(db.session, since, limit)
+        if not changes and wait and feed.wait(db.session, since, wait):
+            changes, cursor, more = feed.changes(db.session, since, limit)
+    except CursorExpired as e:
+        return jsonify({'status': 'error', 'message': str(e),
+                        'cursor': feed.latest(db.session)[0]}), 410
+    return jsonify({'changes': changes, 'cursor': cursor, 'more': more})
+
+
+# Chunks and manifests named by their hash never change
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CHUNK_NAME = re.compile(r'[0-9a-f]{64}\Z')
+
+
+@api_bp.route('/releases')
+def list_releases():
+    """Stored releases, oldest first, without their file lists
+
+    Query parameters:
+        model: only this model's releases
+    """
+    manifests = ReleaseStore(load_config()).releases(request.args.get('model'))
+    return jsonify({'releases': [release_summary(manifest) for manifest in manifests]})
+
+
+@api_bp.route('/releases/<release>')
+def get_release(release):
+    """A release's manifest by id, unique id prefix, MODEL:LABEL or MODEL:latest
+
+    The ETag is the release id. A manifest asked for by its full id never
+    changes and may be cached for good; other names are revalidated, so a
+    robot polling MODEL:latest gets 304 until a newer release is built.
+    """
+    try:
+        manifest = ReleaseStore(load_config()).load(release)
+    except BuildError as e:
+        return _error(str(e), 404)
+    response = jsonify(manifest)
+    response.set_etag(manifest['id'])
+    response.headers['Cache-Control'] = IMMUTABLE if release == manifest['id'] else 'no-cache'
+    return response.make_conditional(request)
+
+
+@api_bp.route('/chunks/<digest>')
+def get_chunk(digest):
+    """Raw bytes of a stored chunk
+
+    Served straight from the chunk file with send_file: Range and If-Range
+    requests resume interrupted downloads, and If-None-Match gets 304. The
+    body is never read into memory whole. Servers that provide
+    wsgi.file_wrapper (gunicorn) hand full responses to sendfile, and with
+    release-x-sendfile the front proxy sends the file instead.
+    """
+    if not CHUNK_NAME.match(digest):
+        return _error(f"'{digest}' is not a chunk digest", 404)
+    path = ReleaseStore(load_config()).chunk_path(digest)
+    try:
+        response = send_file(path, mimetype='application/octet-stream', etag=digest, conditional=True)
+    except FileNotFoundError:
+        return _error(f"Chunk {digest} not found", 404)
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
@@ -0,0 +1,168 @@
+"""
+Pre-fork API server for `robots serve`
+
+The master process builds the app once, checking the schema once, then
+binds the listening socket and forks serve-workers worker processes. Each
+one serves the app from the shared socket with a threaded WSGI server, so
+requests are spread over processes and no single interpreter lock limits
+throughput. Workers inherit the app but not its database connections:
+init_db disposes the engine's pool in every forked child, and the status
+buffer starts its flush thread in each worker on first use. With more
+than one worker, the API metrics of every worker are summed through a
+shared directory, so a scrape answered by any one of them covers all.
+
+The master restarts workers that die. SIGTERM or Ctrl-C stops the workers
+gracefully: each finishes its requests in flight and flushes buffered
+status reports, and any still running after serve-graceful-timeout
+seconds are killed.
+"""
+
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+
+class PreforkServer:
+    """Serves a Flask app from several forked worker processes"""
+
+    def __init__(self, config=None, host=None, port=None, workers=None, access_log=False):
+        """Initialize PreforkServer with optional config
+
+        Args:
+            config: Configuration dictionary containing serve-* settings
+            host: Address to listen on (default: serve-host)
+            port: Port to listen on (default: serve-port)
+            workers: Worker processes (default: serve-workers, or one per CPU)
+            access_log: Log every request to stderr
+        """
+        config = config or {}
+        self.host = host or config.get('serve-host', '127.0.0.1')
+        self.port = port if port is not None else config.get('serve-port', 5000)
+        self.workers = workers or config.get('serve-workers') or os.cpu_count() or 1
+        self.backlog = config.get('serve-backlog', 1024)
+        self.graceful_timeout = config.get('serve-graceful-timeout', 30)
+        self.access_log = access_log
+        self.children = {}
+        self.stopping = False
+
+    def run(self, app):
+        """Serve app until SIGTERM or Ctrl-C
+
+        Returns:
+            Exit status for the process
+        """
+        from robots.models.base import db
+
+        listener = self._bind()
+        # The master never queries again; forked workers open their own connections
+        with app.app_context():
+            db.engine.dispose()
+        metrics = app.extensions.get('metrics')
+        shared = None
+        if metrics is not None and self.workers > 1:
+            shared = tempfile.mkdtemp(prefix='robots-metrics-')
+            metrics.share(shared)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        print(f"Serving on http://{self.host}:{listener.getsockname()[1]} with {self.workers} workers "
+              f"(pid {os.getpid()})", file=sys.stderr, flush=True)
+        for _ in range(self.workers):
+            self._spawn(app, listener)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status
+            print(f"Worker {pid} exited ({code}), starting another", file=sys.stderr, flush=True)
+            if time.monotonic() - started < 1:
+                # Don't spin when workers die as soon as they start
+                time.sleep(1)
+            self._spawn(app, listener)
+        listener.close()
+        if shared:
+            shutil.rmtree(shared, ignore_errors=True)
+        return 0
+
+    def _bind(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(self.backlog)
+        # Every worker waits on this socket; the ones that lose the race to
+        # accept a connection must not block
+        listener.setblocking(False)
+        return listener
+
+    def _spawn(self, app, listener):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        status = 1
+        try:
+            status = self._serve(app, listener)
+        except BaseException:
+            logger.exception("Worker %d failed", os.getpid())
+        finally:
+            # Never return into the master's code, or run its exit handlers
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def _serve(self, app, listener):
+        """Worker process: serve requests until told to stop"""
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if not self.access_log:
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        server = make_server(self.host, self.port, app, threaded=True, fd=listener.fileno())
+        # Requests in flight finish before serve_forever returns
+        server.daemon_threads = False
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        server.serve_forever()
+        server.server_close()
+        app.extensions['status_buffer'].close()
+        metrics = app.extensions.get('metrics')
+        if metrics is not None and metrics.directory:
+            # Requests since the last periodic write still count after this worker is gone
+            metrics.publish()
+        return 0
+
+    def _stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        print("Stopping workers...", file=sys.stderr, flush=True)
+        for pid in self.children:
+            _signal(pid, signal.SIGTERM)
+        threading.Thread(target=self._kill_stragglers, daemon=True).start()
+
+    def _kill_stragglers(self):
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for pid in list(self.children):
+            _signal(pid, signal.SIGKILL)
+
+
+def _signal(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
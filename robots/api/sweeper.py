@@ -0,0 +1,305 @@
+"""
+Background fleet health sweeper
+
+Probes every robot on its own schedule rather than in lockstep rounds.
+Each robot's first probe lands at a random point in the first interval and
+every later one an interval (give or take sweeper-jitter) after the last,
+so probes stay spread out however large the fleet grows. Robots that keep
+failing are probed exponentially less often, up to sweeper-max-backoff.
+
+States are written back to Robot.status in batches every
+sweeper-flush-interval, and only for robots whose probed state changed. A
+robot that reports its own status ("charging", "busy") is left alone while
+it stays reachable; online is only written when it recovers from
+unreachable or unresponsive.
+
+Lag (how late probes start after they fall due) and cycle time (how long
+between two probes of the same robot) show whether the interval and
+concurrency suit the fleet size: lag that keeps growing means the sweeper
+cannot keep up.
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+
+from robots.api.probe import ONLINE, UNREACHABLE, UNRESPONSIVE
+
+logger = logging.getLogger(__name__)
+
+PROBE_STATES = (ONLINE, UNREACHABLE, UNRESPONSIVE)
+
+# Recent lag and cycle samples the percentiles are taken over
+WINDOW = 10000
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+class FleetSweeper:
+    """Probes the fleet continuously and keeps Robot.status current"""
+
+    def __init__(self, app, connector, config=None):
+        """Initialize FleetSweeper
+
+        Args:
+            app: Flask app whose database holds the fleet
+            connector: RobotConnector used to probe robots
+            config: Configuration dictionary containing sweeper-* settings
+        """
+        config = config or {}
+        self.app = app
+        self.connector = connector
+        self.interval = config.get('sweeper-interval', 60)
+        self.jitter = config.get('sweeper-jitter', 0.1)
+        self.max_backoff = config.get('sweeper-max-backoff', 900)
+        self.concurrency = config.get('sweeper-concurrency', connector.probe_concurrency)
+        self.flush_interval = config.get('sweeper-flush-interval', 5)
+        self.refresh_interval = config.get('sweeper-refresh-interval', 60)
+        self.report_interval = config.get('sweeper-report-interval', 60)
+        self.stats_path = os.path.expanduser(config.get('sweeper-stats-path', '~/.robots/sweeper.json'))
+
+        # name -> {'hostname', 'status', 'failures', 'last_probe', 'due'}
+        self.robots = {}
+        # (due, name) heap; entries for robots no longer in the fleet are skipped
+        self.schedule = []
+        self.pending = {}
+        self.lags = deque(maxlen=WINDOW)
+        self.cycles = deque(maxlen=WINDOW)
+        self.durations = deque(maxlen=WINDOW)
+        self.started = time.monotonic()
+        self.counters = {'probes': 0, 'failed': 0, 'written': 0, 'failed_writes': 0, 'in_flight': 0}
+
+    def run(self, once=False, duration=None):
+        """Sweep until interrupted
+
+        Args:
+            once: Probe every robot once, write the results and return
+            duration: Stop after this many seconds
+        """
+        return asyncio.run(self._run_once() if once else self._run(duration))
+
+    async def _run_once(self):
+        await self._refresh()
+        names = list(self.robots)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        now = time.monotonic()
+        await asyncio.gather(*[self._probe(name, now, semaphore) for name in names])
+        await self._flush()
+        return self.stats()
+
+    async def _run(self, duration):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        deadline = time.monotonic() + duration if duration else None
+        await self._refresh()
+        tasks = set()
+        next_refresh = time.monotonic() + self.refresh_interval
+        next_flush = time.monotonic() + self.flush_interval
+        next_report = time.monotonic() + self.report_interval
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                now = time.monotonic()
+                while self.schedule and self.schedule[0][0] <= now:
+                    due, name = heapq.heappop(self.schedule)
+                    if self.robots.get(name, {}).get('due') == due:
+                        task = asyncio.ensure_future(self._probe(name, due, semaphore))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                if now >= next_flush:
+                    await self._flush()
+                    next_flush = now + self.flush_interval
+                if now >= next_refresh:
+                    await self._refresh()
+                    next_refresh = now + self.refresh_interval
+                if now >= next_report:
+                    self._report()
+                    next_report = now + self.report_interval
+                wake = min(next_flush, next_refresh, next_report,
+                           self.schedule[0][0] if self.schedule else next_flush)
+                if deadline is not None:
+                    wake = min(wake, deadline)
+                await asyncio.sleep(max(0.0, wake - time.monotonic()))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._flush()
+            self._report()
+        return self.stats()
+
+    async def _probe(self, name, due, semaphore):
+        async with semaphore:
+            start = time.monotonic()
+            robot = self.robots.get(name)
+            if robot is None:
+                return
+            self.lags.append(start - due)
+            if robot['last_probe'] is not None:
+                self.cycles.append(start - robot['last_probe'])
+            robot['last_probe'] = start
+            self.counters['in_flight'] += 1
+            try:
+                result = await self.connector.probe_one(name, robot['hostname'])
+            except Exception:
+                # A probe that blew up says nothing about the robot, but it
+                # still backs off and gets probed again
+                logger.exception("Probe of %s failed", name)
+                result = None
+            finally:
+                self.counters['in_flight'] -= 1
+            self.durations.append(time.monotonic() - start)
+
+        self.counters['probes'] += 1
+        if self.robots.get(name) is not robot:
+            # Removed from the fleet while being probed
+            return
+        if result is not None and result.state == ONLINE:
+            robot['failures'] = 0
+        else:
+            robot['failures'] += 1
+            self.counters['failed'] += 1
+        if result is not None:
+            self._note_state(name, robot, result.state)
+        self._schedule(name, time.monotonic() + self._delay(robot['failures']))
+
+    def _schedule(self, name, due):
+        # Only the latest entry per robot counts, so a robot dropped and
+        # re-added between refreshes is not probed twice as often
+        self.robots[name]['due'] = due
+        heapq.heappush(self.schedule, (due, name))
+
+    def _note_state(self, name, robot, state):
+        """Queue a status write if the probed state changed"""
+        status = self.pending.get(name, robot['status'])
+        if state == status:
+            return
+        if state == ONLINE and status not in PROBE_STATES:
+            # The robot's own reported status already implies it is up
+            return
+        self.pending[name] = state
+
+    def _delay(self, failures):
+        """Seconds until the next probe: the interval, doubled per consecutive
+        failure up to max-backoff, then spread by the jitter fraction"""
+        delay = min(self.interval * 2 ** failures, max(self.interval, self.max_backoff))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _refresh(self):
+        """Pick up added, removed and renamed-host robots and current statuses"""
+        try:
+            fleet = await asyncio.get_running_loop().run_in_executor(None, self._load_fleet)
+        except Exception:
+            logger.exception("Could not load the fleet, keeping the previous list")
+            return
+        now = time.monotonic()
+        for name in set(self.robots) - set(fleet):
+            del self.robots[name]
+            self.pending.pop(name, None)
+        for name, (hostname, status) in fleet.items():
+            robot = self.robots.get(name)
+            if robot is None:
+                self.robots[name] = {'hostname': hostname, 'status': status, 'failures': 0,
+                                     'last_probe': None}
+                # Spread first probes over one interval instead of all at once
+                self._schedule(name, now + random.uniform(0, self.interval))
+            else:
+                robot['hostname'] = hostname
+                robot['status'] = status
+
+    def _load_fleet(self):
+        from robots.models import db, Robot
+        with self.app.app_context():
+            rows = db.session.execute(
+                db.select(Robot.name, Robot.hostname, Robot.status).where(Robot.hostname != '')
+            ).all()
+            db.session.rollback()
+        return {row.name: (row.hostname, row.status) for row in rows}
+
+    async def _flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, batch)
+        except Exception:
+            logger.exception("Writing %d robot states failed, will retry", len(batch))
+            self.counters['failed_writes'] += 1
+            batch.update(self.pending)
+            self.pending = batch
+            return
+        self.counters['written'] += len(batch)
+        for name, state in batch.items():
+            if name in self.robots:
+                self.robots[name]['status'] = state
+
+    def _write(self, batch):
+        from robots.db.bulk import import_fleet
+        from robots.models import db
+        with self.app.app_context():
+            try:
+                import_fleet(db.session, [({'name': name, 'status': state}, {})
+                                          for name, state in batch.items()],
+                             None, create=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def stats(self):
+        """Counters, state totals, and lag, cycle and probe duration percentiles"""
+        states = {}
+        for robot in self.robots.values():
+            states[robot['status']] = states.get(robot['status'], 0) + 1
+        lags, cycles, durations = list(self.lags), list(self.cycles), list(self.durations)
+        mean_duration = sum(durations) / len(durations) if durations else None
+        return dict(
+            self.counters,
+            robots=len(self.robots),
+            backing_off=sum(1 for robot in self.robots.values() if robot['failures']),
+            pending_writes=len(self.pending),
+            statuses=states,
+            interval=self.interval,
+            concurrency=self.concurrency,
+            uptime=round(time.monotonic() - self.started, 1),
+            lag_p50=_round(_percentile(lags, 0.5)),
+            lag_p99=_round(_percentile(lags, 0.99)),
+            lag_max=_round(max(lags) if lags else None),
+            cycle_p50=_round(_percentile(cycles, 0.5)),
+            cycle_p99=_round(_percentile(cycles, 0.99)),
+            probe_p50=_round(_percentile(durations, 0.5)),
+            probe_p99=_round(_percentile(durations, 0.99)),
+            # Share of the concurrency the fleet needs at this interval; near
+            # or above 1 the sweep falls behind
+            utilization=_round(len(self.robots) * mean_duration / (self.interval * self.concurrency))
+            if mean_duration is not None else None,
+        )
+
+    def _report(self):
+        stats = self.stats()
+        seconds = lambda value: '-' if value is None else f"{value:g}s"
+        print(f"{stats['robots']} robots, {stats['probes']} probes ({stats['failed']} failed), "
+              f"{stats['written']} states written; lag p50 {seconds(stats['lag_p50'])} "
+              f"p99 {seconds(stats['lag_p99'])}, cycle p50 {seconds(stats['cycle_p50'])}, "
+              f"utilization {stats['utilization'] if stats['utilization'] is not None else '-'}",
+              flush=True)
+        try:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            temp_path = self.stats_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(dict(stats, updated_at=time.time()), f, indent=2)
+            os.replace(temp_path, self.stats_path)
+        except OSError as e:
+            logger.warning("Could not write sweeper stats to %s: %s", self.stats_path, e)
@@ -0,0 +1,10 @@
+"""
+Audit log
+
+Who did what to which robot, recorded to a local spool by the CLI and
+shipped to the database in batches by a background flusher. See log.py.
+"""
+
+from robots.audit.log import Action, AuditLog, field_diff
+
+__all__ = ['Action', 'AuditLog', 'field_diff']
@@ -0,0 +1,36 @@
+"""
+Background audit flusher
+
+Started detached by commands that record audit events:
+
+    python -m robots.audit
+
+Ships the spool to the database and exits, doing nothing if another
+flusher is already at work. Events recorded while it runs are picked up
+before it exits. If the database cannot be reached the events stay in the
+spool for the next flush.
+"""
+
+import sys
+
+
+def main():
+    from robots.cli.commands import audit, get_app
+    from robots.models import db
+
+    with get_app().app_context():
+        while audit.spool.pending():
+            try:
+                written = audit.flush(db.session, wait=False)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Audit flush failed, events kept in {audit.directory}: {e}", file=sys.stderr)
+                return 1
+            if written is None:
+                # Another flusher has it
+                return 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
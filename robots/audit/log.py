@@ -0,0 +1,251 @@
+"""
+Audit log of user interactions
+
+Commands that change robots or act on them record who ran them, with
+which arguments, on which robots, what changed (as a field diff), how long
+they took and how they exited. Recording never touches the database:
+events are appended to a local spool (see spool.py) and a background
+flusher process ships them in batches, so no command waits on the network
+to be audited. `robots audit` flushes whatever is left before querying.
+"""
+
+import getpass
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from robots.audit.spool import Spool
+
+logger = logging.getLogger(__name__)
+
+FLUSH_LOCK = 'flush.lock'
+
+
+def field_diff(before, after):
+    """{field: [old, new]} for every field whose value differs
+
+    Args:
+        before: Mapping of field to old value (missing means unset)
+        after: Mapping of field to new value
+    """
+    return {field: [before.get(field), value] for field, value in after.items()
+            if before.get(field) != value}
+
+
+class Action:
+    """One run of an audited command, collecting the robots it touched"""
+
+    def __init__(self, command, args):
+        self.id = uuid.uuid4().hex
+        self.command = command
+        self.args = args
+        self.started_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.robots = []
+        self.error = None
+
+    def note(self, robot, changes=None, status=None, error=None):
+        """Record a robot the command touched
+
+        Args:
+            robot: Robot name
+            changes: Field diff from field_diff, if anything changed
+            status: This robot's own exit status, where it has one
+            error: What went wrong for this robot
+        """
+        self.robots.append((robot, changes or None, status, error))
+
+    def fail(self, error):
+        """Mark the command failed although it exits normally"""
+        self.error = error
+
+
+class AuditLog:
+    """Records audited actions to the spool and ships them to the database"""
+
+    def __init__(self, config=None):
+        """Initialize AuditLog with optional config
+
+        Args:
+            config: Configuration dictionary containing audit-* settings
+        """
+        config = config or {}
+        self.enabled = config.get('audit', True)
+        self.directory = os.path.expanduser(config.get('audit-spool-dir', '~/.robots/audit'))
+        self.batch_size = config.get('audit-batch-size', 500)
+        self.background = config.get('audit-background-flush', True)
+        self.user = config.get('audit-user') or _login()
+        self.host = socket.gethostname()
+        self.spool = Spool(self.directory)
+        self.current = None
+
+    @contextmanager
+    def action(self, command, args=None):
+        """Audit everything run inside the block as one action of command
+
+        The exit status is 0 unless the block raises: SystemExit keeps its
+        code, KeyboardInterrupt is 130 and anything else is 1.
+        """
+        if not self.enabled:
+            yield Action(command, args)
+            return
+        action = self.current = Action(command, args)
+        started = time.monotonic()
+        status = 0
+        try:
+            yield action
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else int(e.code is not None)
+            raise
+        except KeyboardInterrupt:
+            status, action.error = 130, 'interrupted'
+            raise
+        except BaseException as e:
+            status, action.error = 1, action.error or f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.current = None
+            if action.error and not status:
+                status = 1
+            try:
+                self.record(action, status, time.monotonic() - started)
+            except OSError as e:
+                # Auditing must never be the reason a command fails
+                logger.warning("Could not write audit event to %s: %s", self.directory, e)
+
+    def note(self, robot, changes=None, status=None, error=None):
+        """Note a robot on the running action, if there is one; see Action.note"""
+        if self.current:
+            self.current.note(robot, changes, status, error)
+
+    def fail(self, error):
+        """Mark the running action failed, if there is one"""
+        if self.current:
+            self.current.fail(error)
+
+    def record(self, action, status, duration):
+        """Append an action's events to the spool and make sure a flusher will ship them"""
+        base = {
+            'action_id': action.id,
+            'occurred_at': action.started_at.isoformat(),
+            'user': self.user,
+            'host': self.host,
+            'command': action.command,
+            'args': action.args,
+            'duration': round(duration, 3),
+        }
+        robots = action.robots or [(None, None, None, None)]
+        self.spool.append([dict(base, id=uuid.uuid4().hex, robot=robot, changes=changes,
+                                exit_status=status if robot_status is None else robot_status,
+                                error=error or action.error)
+                           for robot, changes, robot_status, error in robots])
+        if self.background:
+            self.start_flusher()
+
+    def start_flusher(self):
+        """Start a detached flusher process unless one is already running"""
+        if self._flusher_running():
+            return
+        from robots.config import config_path
+        env = dict(os.environ)
+        path = config_path()
+        if path:
+            env['ROBOTS_CONFIG'] = os.path.abspath(path)
+        package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+        with open(os.path.join(self.directory, 'flusher.log'), 'ab') as log:
+            subprocess.Popen([sys.executable, '-m', 'robots.audit'], env=env, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL, stderr=log, start_new_session=True)
+
+    def flush(self, session, wait=True):
+        """Ship spooled events to the database in batches
+
+        Events already stored (from a batch shipped before a crash cut its
+        clean-up short) are skipped, so every event is stored once.
+
+        Args:
+            session: Database session
+            wait: Wait for a flush running elsewhere instead of returning at once
+
+        Returns:
+            Number of events written, or None when another flush was running
+            and wait was not set
+        """
+        from sqlalchemy import insert, select
+        from robots.models import AuditEvent
+
+        with self._flush_lock(wait) as locked:
+            if not locked:
+                return None
+            written = 0
+            for path in self.spool.take():
+                events = self.spool.read(path)
+                for start in range(0, len(events), self.batch_size):
+                    batch = events[start:start + self.batch_size]
+                    stored = set(session.scalars(
+                        select(AuditEvent.id).where(AuditEvent.id.in_([event['id'] for event in batch]))))
+                    rows = [dict(event, occurred_at=datetime.fromisoformat(event['occurred_at']))
+                            for event in batch if event['id'] not in stored]
+                    if rows:
+                        session.execute(insert(AuditEvent), rows)
+                    session.commit()
+                    written += len(rows)
+                os.unlink(path)
+            return written
+
+    def query(self, session, robot=None, user=None, command=None, since=None, until=None, limit=50):
+        """Newest events first, narrowed by robot, user, command and time
+
+        Args:
+            session: Database session
+            robot, user, command: Exact values to match
+            since, until: Epoch seconds bounding occurred_at
+            limit: Most events to return
+        """
+        from robots.models import AuditEvent
+
+        query = session.query(AuditEvent)
+        if robot:
+            query = query.filter(AuditEvent.robot == robot)
+        if user:
+            query = query.filter(AuditEvent.user == user)
+        if command:
+            query = query.filter(AuditEvent.command == command)
+        if since is not None:
+            query = query.filter(AuditEvent.occurred_at >= _utc(since))
+        if until is not None:
+            query = query.filter(AuditEvent.occurred_at < _utc(until))
+        return query.order_by(AuditEvent.occurred_at.desc(), AuditEvent.id).limit(limit).all()
+
+    @contextmanager
+    def _flush_lock(self, wait):
+        import fcntl
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, FLUSH_LOCK), 'a') as lock:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+
+    def _flusher_running(self):
+        with self._flush_lock(wait=False) as locked:
+            return not locked
+
+
+def _login():
+    try:
+        return getpass.getuser()
+    except (KeyError, OSError):
+        return str(os.getuid())
+
+
+def _utc(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,97 @@
+"""
+Append-only audit spool
+
+Commands append their events to events.jsonl in the spool directory, one
+JSON object per line, holding an exclusive lock on the file for the length
+of the write. The flusher takes the file away by renaming it to
+batch-<n>.jsonl, then locks the renamed file to wait out any write that was
+already under way. A writer that opened the file before the rename notices
+after locking that the path now names a different file, and appends to the
+new one instead, so no event lands in a batch after it has been read.
+"""
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+EVENTS_FILE = 'events.jsonl'
+
+
+class Spool:
+    """Local append-only queue of audit events"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, EVENTS_FILE)
+
+    def append(self, events):
+        """Append events to the spool in one write"""
+        # fcntl loads on first write rather than when the CLI imports the
+        # audit log, which every command does
+        import fcntl
+
+        data = ''.join(json.dumps(event, default=str) + '\n' for event in events).encode()
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    current = os.stat(self.path)
+                except FileNotFoundError:
+                    current = None
+                if current is None or current.st_ino != os.fstat(fd).st_ino:
+                    # Taken by the flusher between open and lock
+                    continue
+                os.write(fd, data)
+                return
+            finally:
+                os.close(fd)
+
+    def pending(self):
+        """Events waiting to be flushed, counting batches taken but not yet shipped"""
+        count = 0
+        for path in self._batch_paths() + [self.path]:
+            try:
+                with open(path, 'rb') as f:
+                    count += sum(1 for _ in f)
+            except FileNotFoundError:
+                pass
+        return count
+
+    def take(self):
+        """Batch files to ship, oldest first, after moving events.jsonl aside
+
+        Batches left behind by an earlier flush that failed come first.
+        """
+        if os.path.exists(self.path):
+            os.replace(self.path, os.path.join(self.directory, f'batch-{time.time_ns()}.jsonl'))
+        return self._batch_paths()
+
+    def read(self, path):
+        """Events in a batch file, once writes to it have finished"""
+        import fcntl
+
+        with open(path, 'rb') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            lines = f.read().splitlines()
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # A write cut short by a crash
+                logger.warning("Skipping unreadable audit event in %s", path)
+        return events
+
+    def _batch_paths(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        batches = [name for name in names if name.startswith('batch-') and name.endswith('.jsonl')]
+        return [os.path.join(self.directory, name)
+                for name in sorted(batches, key=lambda name: int(name[6:-6]))]
@@ -0,0 +1,12 @@
+"""
+Robot builds
+
+Build output stored as content-defined chunks in a content-addressed
+store, one manifest per release, and delta deploys that send robots only
+the chunks they lack, pushed (deploy.py) or pulled by the robots
+themselves (fetch.py). See store.py.
+"""
+
+from robots.build.store import BuildError, ReleaseStore
+
+__all__ = ['BuildError', 'ReleaseStore']
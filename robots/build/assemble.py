@@ -0,0 +1,144 @@
+"""
+Release assembly
+
+Rebuilds a release's file tree from its manifest and chunks. This module
+uses nothing outside the standard library, because deploys copy it to
+robots and run it there with whatever python3 they have:
+
+    python3 assemble.py STAGING_DIR DEST [--full]
+
+STAGING_DIR holds manifest.json and a chunks/ directory with the chunks
+the robot did not already have. Every other chunk is read back out of the
+release currently in DEST, whose manifest is kept in DEST/.robots-release.json.
+The new tree is written next to DEST and swapped in once every chunk has
+been verified, so a failed deploy leaves the old release in place.
+
+Exit status is 0 on success, 2 for bad arguments and 3 when a chunk is
+missing or does not match its hash (a full deploy fixes both).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+RELEASE_FILE = '.robots-release.json'
+
+
+class AssemblyError(Exception):
+    """Raised when a chunk is missing or corrupt"""
+
+
+def chunk_index(manifest, root):
+    """Mapping of chunk digest to (path, offset, size) within an assembled tree"""
+    index = {}
+    for relpath, entry in manifest['files'].items():
+        offset = 0
+        for digest, size in entry['chunks']:
+            index.setdefault(digest, (os.path.join(root, relpath), offset, size))
+            offset += size
+    return index
+
+
+def installed_manifest(dest):
+    """Manifest of the release assembled in dest, or None"""
+    try:
+        with open(os.path.join(dest, RELEASE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ChunkReader:
+    """Reads chunks from a directory of chunk files, then from an installed tree"""
+
+    def __init__(self, chunk_dir=None, installed=None, installed_root=None):
+        self.chunk_dir = chunk_dir
+        self.index = chunk_index(installed, installed_root) if installed else {}
+
+    def read(self, digest):
+        if self.chunk_dir:
+            path = os.path.join(self.chunk_dir, digest)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        if digest in self.index:
+            path, offset, size = self.index[digest]
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    return f.read(size)
+            except OSError:
+                return None
+        return None
+
+
+def assemble(manifest, dest, reader):
+    """Write a release's tree to dest through a sibling directory and swap it in
+
+    Args:
+        manifest: Release manifest
+        dest: Directory the release ends up in
+        reader: Object whose read(digest) returns chunk bytes or None
+
+    Raises:
+        AssemblyError: if a chunk is missing or corrupt; dest is untouched
+    """
+    dest = os.path.abspath(dest)
+    building = dest + '.robots-new'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    try:
+        for relpath in sorted(manifest['files']):
+            entry = manifest['files'][relpath]
+            path = os.path.join(building, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                for digest, size in entry['chunks']:
+                    data = reader.read(digest)
+                    if data is None:
+                        raise AssemblyError(f"Chunk {digest} for {relpath} is missing")
+                    if len(data) != size or hashlib.sha256(data).hexdigest() != digest:
+                        raise AssemblyError(f"Chunk {digest} for {relpath} is corrupt")
+                    f.write(data)
+            os.chmod(path, entry['mode'])
+        for relpath, target in manifest['links'].items():
+            path = os.path.join(building, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.symlink(target, path)
+        with open(os.path.join(building, RELEASE_FILE), 'w') as f:
+            json.dump(manifest, f)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+    previous = dest + '.robots-old'
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(dest):
+        os.rename(dest, previous)
+    os.rename(building, dest)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def main(argv):
+    args = [arg for arg in argv if arg != '--full']
+    if len(args) != 2:
+        print("usage: assemble.py STAGING_DIR DEST [--full]", file=sys.stderr)
+        return 2
+    staging, dest = args
+    with open(os.path.join(staging, 'manifest.json')) as f:
+        manifest = json.load(f)
+    installed = None if '--full' in argv else installed_manifest(dest)
+    reader = ChunkReader(os.path.join(staging, 'chunks'), installed, dest)
+    try:
+        assemble(manifest, dest, reader)
+    except AssemblyError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 3
+    print(f"assembled release {manifest['id']} in {dest}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,95 @@
+"""
+Content-defined chunking
+
+Splits byte streams where their content says to rather than at fixed
+offsets, so inserting or removing bytes early in a file only changes the
+chunks around the edit and every later chunk keeps its hash. Boundaries
+come from a gear rolling hash with FastCDC's refinements: nothing is hashed
+before the minimum chunk size, a stricter mask applies below the average
+size and a looser one above it (which pulls chunk sizes towards the
+average), and chunks are cut at the maximum size regardless.
+"""
+
+import hashlib
+
+# 256 fixed 32-bit values, one per byte. Derived from sha256 rather than a
+# seeded PRNG so boundaries, and so chunk hashes, never change between
+# Python versions.
+GEAR = [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:4], 'big') for value in range(256)]
+
+# Bytes read from a stream at a time
+READ_SIZE = 8 * 1024 * 1024
+
+
+class Chunker:
+    """Splits data into content-defined chunks of roughly avg_size bytes"""
+
+    def __init__(self, min_size=256 * 1024, avg_size=1024 * 1024, max_size=4 * 1024 * 1024):
+        """Initialize Chunker
+
+        Args:
+            min_size: Smallest chunk, except a stream's last one
+            avg_size: Target chunk size; a power of two
+            max_size: Largest chunk
+        """
+        if not min_size <= avg_size <= max_size:
+            raise ValueError("Chunk sizes must satisfy min <= avg <= max")
+        bits = max(1, avg_size.bit_length() - 1)
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        # Masks test the hash's high bits, which depend on the most bytes
+        self.strict_mask = _high_bits(bits + 2)
+        self.loose_mask = _high_bits(max(1, bits - 2))
+
+    def cut(self, data, start, end):
+        """Offset of the first boundary after start in data[start:end]
+
+        end is returned when no boundary is found before it, so callers must
+        only pass an end short of max_size at the end of the stream.
+        """
+        if end - start <= self.min_size:
+            return end
+        normal = min(start + self.avg_size, end)
+        limit = min(start + self.max_size, end)
+        gear = GEAR
+        h = 0
+        mask = self.strict_mask
+        for i, byte in enumerate(data[start + self.min_size:normal], start + self.min_size):
+            h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+            if not h & mask:
+                return i + 1
+        mask = self.loose_mask
+        for i, byte in enumerate(data[normal:limit], normal):
+            h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+            if not h & mask:
+                return i + 1
+        return limit
+
+    def chunks(self, stream):
+        """Yield the chunks of a binary stream as bytes"""
+        buffer = b''
+        eof = False
+        while True:
+            if not eof and len(buffer) < self.max_size:
+                data = stream.read(READ_SIZE)
+                eof = not data
+                buffer = buffer + data if buffer else data
+                continue
+            if not buffer:
+                return
+            view = memoryview(buffer)
+            start = 0
+            # Without more input, only cut where a full max_size window was seen
+            while start < len(buffer) and (eof or len(buffer) - start >= self.max_size):
+                end = self.cut(view, start, len(buffer))
+                yield bytes(view[start:end])
+                start = end
+            view.release()
+            buffer = buffer[start:]
+            if eof and not buffer:
+                return
+
+
+def _high_bits(count):
+    return ((1 << count) - 1) << (32 - count)
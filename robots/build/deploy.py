@@ -0,0 +1,165 @@
+"""
+Delta deploys of stored releases
+
+A robot's `release` aspect records the release last deployed to it. A
+deploy sends each robot only the chunks of the new release that its
+current release lacks, together with the manifest and assemble.py, then
+runs assemble.py on the robot to rebuild the tree from those chunks plus
+the files already there. Robots with no recorded release, or whose release
+has been garbage collected, get every chunk.
+
+Robots sharing a current release need the same chunks, so they are
+deployed as a group from one staging directory, either pushed to each
+robot with transfer_many's concurrency and per-location limits or, with
+fan-out, seeded once per location and relayed between robots there (see
+fanout.py).
+"""
+
+import json
+import os
+import shlex
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+from robots.build import assemble
+from robots.build.fanout import push_staging
+from robots.build.store import BuildError, chunk_digests, chunk_sizes
+
+# Aspect recording the release deployed to a robot
+RELEASE_ASPECT = 'release'
+
+
+@dataclass
+class DeployResult:
+    """Outcome of deploying a release to a single robot"""
+    name: str
+    hostname: str
+    location: str = None
+    previous: str = None
+    chunks_sent: int = 0
+    bytes_sent: int = 0
+    ok: bool = False
+    error: str = ''
+    relayed_from: str = None
+
+    def to_dict(self):
+        """Convert result to dictionary"""
+        return {
+            "name": self.name,
+            "hostname": self.hostname,
+            "location": self.location,
+            "previous": self.previous,
+            "chunks_sent": self.chunks_sent,
+            "bytes_sent": self.bytes_sent,
+            "ok": self.ok,
+            "error": self.error,
+            "relayed_from": self.relayed_from
+        }
+
+
+def plan_deploy(store, manifest, robots, full=False):
+    """Group robots by the release they have now, with the chunks each group needs
+
+    Args:
+        store: ReleaseStore holding the release
+        manifest: Release to deploy
+        robots: Robot records with name, hostname, location and aspects
+        full: Send every chunk regardless of what robots have
+
+    Returns:
+        List of (previous manifest or None, missing chunk digests, robots)
+    """
+    wanted = chunk_digests(manifest)
+    groups = {}
+    for robot in robots:
+        previous_id = None if full else robot['aspects'].get(RELEASE_ASPECT)
+        groups.setdefault(previous_id, []).append(robot)
+
+    plans = []
+    for previous_id, members in groups.items():
+        previous = None
+        if previous_id:
+            try:
+                previous = store.load(previous_id)
+            except BuildError:
+                previous = None
+        missing = wanted - chunk_digests(previous) if previous else set(wanted)
+        plans.append((previous, missing, members))
+    return plans
+
+
+def stage(store, manifest, missing, directory):
+    """Fill a staging directory with a release's manifest, the missing chunks
+    and assemble.py; chunks are hard links into the store where possible"""
+    chunk_dir = os.path.join(directory, 'chunks')
+    os.makedirs(chunk_dir, exist_ok=True)
+    for digest in missing:
+        source = store.chunk_path(digest)
+        if not os.path.exists(source):
+            raise BuildError(f"Chunk {digest} of release {manifest['id']} is missing from the store")
+        target = os.path.join(chunk_dir, digest)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    shutil.copyfile(assemble.__file__, os.path.join(directory, 'assemble.py'))
+
+
+def deploy(connector, store, manifest, robots, dest, staging_dir='/tmp', full=False, workers=None,
+           fan_out=None):
+    """Deploy a release to robots, sending each only the chunks it lacks
+
+    Args:
+        connector: RobotConnector used for rsync and ssh
+        store: ReleaseStore holding the release
+        manifest: Release to deploy
+        robots: Robot records with name, hostname, location and aspects
+        dest: Directory the release is assembled in on each robot
+        staging_dir: Directory on each robot that chunks are staged under
+        full: Send every chunk and ignore what robots have
+        workers: Maximum concurrent transfers (default: transfer-workers)
+        fan_out: FanOut that seeds each location and relays between robots
+            there; without one every robot is pushed to from here
+
+    Returns:
+        List of DeployResult in the same order as robots
+    """
+    sizes = chunk_sizes(manifest)
+    remote = f"{staging_dir.rstrip('/')}/robots-deploy-{manifest['id']}"
+    command = (f"python3 {shlex.quote(remote + '/assemble.py')} {shlex.quote(remote)} "
+               f"{shlex.quote(dest)}{' --full' if full else ''}; "
+               f"status=$?; rm -rf {shlex.quote(remote)}; exit $status")
+
+    results = {}
+    for previous, missing, members in plan_deploy(store, manifest, robots, full):
+        sent_bytes = sum(sizes[digest] for digest in missing)
+        for robot in members:
+            results[robot['name']] = DeployResult(
+                robot['name'], robot['hostname'], robot.get('location'),
+                previous['id'] if previous else None, len(missing), sent_bytes)
+        local = tempfile.mkdtemp(prefix='robots-deploy-')
+        try:
+            stage(store, manifest, missing, local)
+            if fan_out:
+                staged, errors = fan_out.send(members, local, remote, workers)
+            else:
+                staged, errors = push_staging(connector, members, local, remote, workers)
+                staged = dict.fromkeys(staged)
+        finally:
+            shutil.rmtree(local, ignore_errors=True)
+
+        for name, error in errors.items():
+            results[name].error = error
+        for name, source in staged.items():
+            results[name].relayed_from = source
+        ready = [(robot['name'], robot['hostname']) for robot in members if robot['name'] in staged]
+        for run in connector.execute(ready, command, workers=workers):
+            result = results[run.name]
+            result.ok = run.ok
+            if not run.ok:
+                output = (run.stderr or run.stdout).strip()
+                result.error = output.splitlines()[-1] if output else f'assemble exited {run.exit_code}'
+    return [results[robot['name']] for robot in robots]
@@ -0,0 +1,251 @@
+"""
+Tiered fan-out of deploy staging directories
+
+Pushing a release from the operator's machine to every robot sends the
+same chunks over the WAN once per robot. With fan-out, the origin pushes
+the staging directory once per location, to a seed robot there, and every
+robot that has it relays it on to peers at the same location over the
+local network. Each robot that finishes receiving becomes a relay source
+in turn, so a site of n robots is covered in about log2(n) rounds, and WAN
+traffic grows with the number of sites rather than the number of robots.
+
+Failures fall back in tiers. A seed the origin cannot reach is replaced by
+the next robot at its location. A failed relay is retried from another
+robot that holds the staging directory. Peers that run out of sources to
+try, and every robot at a location with no reachable seed, are pushed to
+from the origin directly. Robots without a location get direct pushes.
+
+Relays run rsync on the source robot to its peer, so robots must be able
+to ssh to one another (deploy-relay-ssh) and need rsync installed.
+"""
+
+import os
+import shlex
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Robot.location values that say nothing about which network a robot is on
+NO_LOCATION = ('', 'no location')
+
+
+def push_staging(connector, robots, local, remote, workers=None):
+    """rsync a local staging directory to robots straight from the origin
+
+    Returns:
+        (names of robots that received it, {name: error} for the rest)
+    """
+    if not robots:
+        return [], {}
+    targets = [(robot['name'], robot['hostname'], robot.get('location')) for robot in robots]
+    staged, errors = [], {}
+    for transfer in connector.transfer_many(targets, local + os.sep, remote + '/',
+                                            workers=workers, use_cache=False):
+        if transfer.ok:
+            staged.append(transfer.name)
+        else:
+            errors[transfer.name] = transfer.error or 'transfer failed'
+    return staged, errors
+
+
+class _SiteProgress:
+    """Per-location relay counts, redrawn as one status line"""
+
+    def __init__(self, sites):
+        self.total = {location: len(members) for location, members in sites.items()}
+        self.staged = defaultdict(int)
+        self.retried = defaultdict(int)
+        self.running = 0
+        self.lock = threading.Lock()
+
+    def line(self):
+        with self.lock:
+            done = sum(1 for location, total in self.total.items() if self.staged[location] >= total)
+            staged = sum(self.staged.values())
+            retried = sum(self.retried.values())
+            return (f"[relay] {done}/{len(self.total)} locations done, {staged}/{sum(self.total.values())} "
+                    f"robots staged, {self.running} relaying, {retried} retried")
+
+
+class FanOut:
+    """Stages deploys through one seed per location and relays between peers"""
+
+    def __init__(self, connector, config=None):
+        """Initialize FanOut with optional config
+
+        Args:
+            connector: RobotConnector used for rsync and ssh
+            config: Configuration dictionary containing deploy-* settings
+        """
+        config = config or {}
+        self.connector = connector
+        self.seed_attempts = config.get('deploy-seed-attempts', 2)
+        self.relay_attempts = config.get('deploy-relay-attempts', 3)
+        self.relay_concurrency = config.get('deploy-relay-concurrency', 2)
+        self.relay_timeout = config.get('deploy-relay-timeout', 600)
+        self.relay_ssh = config.get('deploy-relay-ssh', 'ssh -o BatchMode=yes -o StrictHostKeyChecking=accept-new')
+
+    def send(self, robots, local, remote, workers=None):
+        """Get a local staging directory to every robot, crossing the WAN once per location
+
+        Args:
+            robots: Robot records with name, hostname, location and status
+            local: Local staging directory
+            remote: Directory it should end up in on every robot
+            workers: Maximum concurrent transfers from the origin
+
+        Returns:
+            (staged, errors) where staged maps each robot that received the
+            directory to the robot it was relayed from (None when it came
+            from the origin) and errors maps the rest to why they did not
+        """
+        sites, direct = defaultdict(list), []
+        for robot in robots:
+            if (robot.get('location') or '') in NO_LOCATION:
+                direct.append(robot)
+            else:
+                sites[robot['location']].append(robot)
+        for members in sites.values():
+            # Robots that last reported themselves online make the likeliest seeds
+            members.sort(key=lambda robot: (robot.get('status') != 'online', robot['name']))
+
+        staged, errors = {}, {}
+        sources, pending = self._seed(sites, local, remote, workers, staged, errors)
+        fallback = self._relay(sites, sources, pending, remote, staged, errors)
+
+        # Last tier: whatever seeds and relays could not reach comes from the origin
+        pushed, failed = push_staging(self.connector, direct + fallback, local, remote, workers)
+        for name in pushed:
+            staged[name] = None
+            errors.pop(name, None)
+        for name, error in failed.items():
+            errors[name] = error if name not in errors else f"{errors[name]}; from origin: {error}"
+        return staged, errors
+
+    def _seed(self, sites, local, remote, workers, staged, errors):
+        """Push to one robot per location, trying the next robot where one fails
+
+        Returns:
+            ({location: [seed]}, {location: [robots still to relay to]})
+        """
+        candidates = {location: list(members) for location, members in sites.items()}
+        sources = {}
+        for _ in range(self.seed_attempts):
+            seeds = {location: members.pop(0) for location, members in candidates.items()
+                     if location not in sources and members}
+            if not seeds:
+                break
+            by_name = {robot['name']: location for location, robot in seeds.items()}
+            print(f"Seeding {len(seeds)} locations from the origin...")
+            pushed, failed = push_staging(self.connector, list(seeds.values()), local, remote, workers)
+            for name in pushed:
+                staged[name] = None
+                sources[by_name[name]] = [seeds[by_name[name]]]
+            errors.update(failed)
+        # Locations without a seed keep their unseeded robots in pending; _relay
+        # hands them straight to the origin fallback
+        return sources, candidates
+
+    def _relay(self, sites, sources, pending, remote, staged, errors):
+        """Relay from robots that have the staging directory to their peers
+
+        Returns:
+            Robots to push to from the origin instead
+        """
+        fallback = []
+        for location in list(pending):
+            if location not in sources:
+                fallback.extend(pending.pop(location))
+        if not any(pending.values()):
+            return fallback
+
+        progress = _SiteProgress({location: sites[location] for location in pending})
+        for location in pending:
+            progress.staged[location] = len(sources[location])
+        stop = threading.Event()
+        ticker = threading.Thread(target=self._report_progress, args=(progress, stop), daemon=True)
+        ticker.start()
+
+        busy = defaultdict(int)
+        tried = defaultdict(set)
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.connector.exec_workers)
+        try:
+            while True:
+                for location, peers in pending.items():
+                    for source in list(sources[location]):
+                        while busy[source['name']] < self.relay_concurrency:
+                            peer = next((peer for peer in peers if source['name'] not in tried[peer['name']]), None)
+                            if peer is None:
+                                break
+                            peers.remove(peer)
+                            tried[peer['name']].add(source['name'])
+                            busy[source['name']] += 1
+                            future = executor.submit(self.connector.run, source['name'], source['hostname'],
+                                                     self._relay_command(peer, remote), self.relay_timeout)
+                            running[future] = (location, source, peer)
+                with progress.lock:
+                    progress.running = len(running)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    location, source, peer = running.pop(future)
+                    busy[source['name']] -= 1
+                    result = future.result()
+                    if result.ok:
+                        staged[peer['name']] = source['name']
+                        errors.pop(peer['name'], None)
+                        sources[location].append(peer)
+                        with progress.lock:
+                            progress.staged[location] += 1
+                            finished = progress.staged[location] == progress.total[location]
+                        if finished:
+                            sys.stderr.write(f"\r{location}: {progress.total[location]} robots staged "
+                                             f"({progress.retried[location]} relays retried)\033[K\n")
+                        continue
+                    output = (result.stderr or result.stdout).strip()
+                    errors[peer['name']] = (f"relay from {source['name']}: "
+                                            f"{output.splitlines()[-1] if output else f'exit {result.exit_code}'}")
+                    with progress.lock:
+                        progress.retried[location] += 1
+                    if len(tried[peer['name']]) < self.relay_attempts:
+                        pending[location].append(peer)
+                    else:
+                        fallback.append(peer)
+                # Peers that have tried every source there is go to the origin,
+                # unless a relay still running may yet add a new source
+                for location, peers in pending.items():
+                    if any(entry[0] == location for entry in running.values()):
+                        continue
+                    names = {source['name'] for source in sources[location]}
+                    for peer in [peer for peer in peers if names <= tried[peer['name']]]:
+                        peers.remove(peer)
+                        fallback.append(peer)
+        except KeyboardInterrupt:
+            print("\nRelay terminated by user")
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        finally:
+            stop.set()
+            ticker.join()
+        executor.shutdown()
+        for peers in pending.values():
+            fallback.extend(peers)
+        sys.stderr.write(f"\r{progress.line()}\033[K\n")
+        return fallback
+
+    def _relay_command(self, peer, remote):
+        """Shell command run on a source robot to rsync the staging directory to a peer"""
+        target = f"{self.connector.ssh_user}@{peer['hostname']}:{remote}/"
+        return shlex.join(['rsync', '-a', '-e', self.relay_ssh, remote + '/', target])
+
+    @staticmethod
+    def _report_progress(progress, stop):
+        while not stop.wait(0.5):
+            sys.stderr.write(f"\r{progress.line()}\033[K")
+            sys.stderr.flush()
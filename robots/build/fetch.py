@@ -0,0 +1,208 @@
+"""
+Pull-based release fetching
+
+`robots fetch` runs on a robot and pulls a release from the API server,
+rather than waiting for `robots deploy` to push it. Only the chunks that
+the release installed in DEST lacks are downloaded; the rest are read back
+out of the installed tree, exactly as assemble.py does for a push.
+
+Each chunk is downloaded to DEST.robots-chunks/<digest>.part and hashed as
+it arrives. An interrupted download resumes with a Range request from the
+end of the part file, after re-hashing the bytes already there, and the
+part is renamed to its digest only once the whole chunk matches. Finished
+chunks survive a failed or interrupted fetch, so running it again only
+downloads what is left. Everything here is standard library.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+
+from robots.build import assemble
+from robots.build.deploy import RELEASE_ASPECT
+from robots.build.store import chunk_sizes, release_id
+
+# Suffix of the directory next to DEST that downloaded chunks are kept in
+CHUNK_DIR_SUFFIX = '.robots-chunks'
+
+# Bytes read from a response or part file at a time
+BLOCK_SIZE = 64 * 1024
+
+
+class FetchError(Exception):
+    """Raised when a release cannot be downloaded"""
+
+
+class ReleaseFetcher:
+    """Downloads releases from the API server and assembles them locally"""
+
+    def __init__(self, config=None, server=None, workers=None):
+        """Initialize ReleaseFetcher with optional config
+
+        Args:
+            config: Configuration dictionary containing fetch-* settings
+            server: Base URL of the API server (default: fetch-server)
+            workers: Chunks downloaded at once (default: fetch-workers)
+        """
+        config = config or {}
+        self.server = (server or config.get('fetch-server', 'http://localhost:5000')).rstrip('/')
+        self.workers = workers or config.get('fetch-workers', 4)
+        self.timeout = config.get('fetch-timeout', 30)
+        self.retries = config.get('fetch-retries', 3)
+
+    def manifest(self, release):
+        """Manifest of a release, checked against its id
+
+        Raises:
+            FetchError: if the server has no such release or it is damaged
+        """
+        manifest = self._get_json(f"/api/releases/{urllib.parse.quote(release, safe=':')}")
+        if release_id(manifest) != manifest.get('id'):
+            raise FetchError(f"Manifest for '{release}' does not match its id")
+        return manifest
+
+    def fetch(self, release, dest, full=False):
+        """Download the chunks of a release that dest lacks and assemble it there
+
+        Args:
+            release: Release id, unique id prefix, MODEL:LABEL or MODEL:latest
+            dest: Directory the release is assembled in
+            full: Download every chunk, ignoring the installed release
+
+        Returns:
+            (manifest, stats) where stats counts chunks downloaded, resumed
+            and reused, and bytes downloaded; stats['current'] is set when
+            the release was already installed and nothing was done
+
+        Raises:
+            FetchError: if a chunk cannot be downloaded intact
+            assemble.AssemblyError: if the installed tree no longer matches
+                its manifest (a full fetch fixes this)
+        """
+        manifest = self.manifest(release)
+        dest = os.path.abspath(dest)
+        installed = None if full else assemble.installed_manifest(dest)
+        stats = {'current': False, 'chunks': 0, 'downloaded': 0, 'resumed': 0, 'reused': 0, 'bytes': 0}
+        if installed and installed.get('id') == manifest['id']:
+            stats['current'] = True
+            return manifest, stats
+
+        sizes = chunk_sizes(manifest)
+        have = set(assemble.chunk_index(installed, dest)) if installed else set()
+        chunk_dir = dest + CHUNK_DIR_SUFFIX
+        os.makedirs(chunk_dir, exist_ok=True)
+        missing = [(digest, size) for digest, size in sizes.items()
+                   if digest not in have and not os.path.exists(os.path.join(chunk_dir, digest))]
+        stats['chunks'] = len(sizes)
+        stats['reused'] = len(have.intersection(sizes))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            downloads = executor.map(lambda item: self.fetch_chunk(item[0], item[1], chunk_dir), missing)
+            for received, resumed in downloads:
+                stats['downloaded'] += 1
+                stats['resumed'] += resumed
+                stats['bytes'] += received
+
+        assemble.assemble(manifest, dest, assemble.ChunkReader(chunk_dir, installed, dest))
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        return manifest, stats
+
+    def fetch_chunk(self, digest, size, chunk_dir):
+        """Download one chunk into chunk_dir, resuming and retrying as needed
+
+        Returns:
+            (bytes left to download when it started, whether a partial
+            download from an earlier run was resumed)
+
+        Raises:
+            FetchError: once every retry has failed
+        """
+        path = os.path.join(chunk_dir, digest)
+        try:
+            already = min(os.path.getsize(path + '.part'), size)
+        except OSError:
+            already = 0
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(min(2 ** (attempt - 1), 10))
+            try:
+                self._download(digest, size, path)
+                return size - already, already > 0
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    raise FetchError(f"Chunk {digest} is not on the server")
+                error = e
+            except (OSError, HTTPException, FetchError) as e:
+                error = e
+        raise FetchError(f"Chunk {digest}: {error}")
+
+    def _download(self, digest, size, path):
+        """One attempt at a chunk, resuming from its part file if there is one"""
+        part = path + '.part'
+        hasher = hashlib.sha256()
+        offset = 0
+        try:
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    hasher.update(block)
+                    offset += len(block)
+        except FileNotFoundError:
+            pass
+        if offset > size:
+            os.unlink(part)
+            hasher, offset = hashlib.sha256(), 0
+
+        if offset < size:
+            headers = {'Range': f'bytes={offset}-', 'If-Range': f'"{digest}"'} if offset else {}
+            request = urllib.request.Request(f"{self.server}/api/chunks/{digest}", headers=headers)
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if offset and response.status != 206:
+                    # The server sent the whole chunk rather than the rest of it
+                    hasher, offset = hashlib.sha256(), 0
+                with open(part, 'ab' if offset else 'wb') as f:
+                    for block in iter(lambda: response.read(BLOCK_SIZE), b''):
+                        hasher.update(block)
+                        f.write(block)
+                        offset += len(block)
+                        if offset > size:
+                            break
+
+        if offset < size:
+            # Keep the part file; the next attempt resumes from its end
+            raise FetchError(f"download ended after {offset} of {size} bytes")
+        if offset > size or hasher.hexdigest() != digest:
+            os.unlink(part)
+            raise FetchError("downloaded bytes do not match the chunk's hash")
+        os.replace(part, path)
+
+    def report(self, name, manifest):
+        """Record a fetched release as the robot's release aspect on the server"""
+        body = {'deployed': True, 'aspects': {RELEASE_ASPECT: manifest['id']}}
+        self._request('POST', f"/api/robots/{urllib.parse.quote(name)}/status", body)
+
+    def _get_json(self, path):
+        return self._request('GET', path)
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(f"{self.server}{path}", data=data, method=method,
+                                         headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get('message')
+            except ValueError:
+                message = None
+            raise FetchError(message or f"{method} {path} returned {e.code}")
+        except (OSError, HTTPException, ValueError) as e:
+            raise FetchError(f"{method} {path} failed: {e}")
@@ -0,0 +1,322 @@
+"""
+Content-addressed release store
+
+Build output is split into content-defined chunks, and every chunk is
+stored once under its sha256, however many files, releases and models
+contain it. A release is a manifest: for every file, its mode, size and
+ordered list of chunks. A release's id is the hash of that manifest, so
+building identical output twice yields the same release.
+
+Layout under build-store-dir:
+
+    chunks/ab/abcdef...      raw chunk bytes, named by sha256
+    releases/<id>.json       release manifests
+
+Chunks are written before the manifest that refers to them, and garbage
+collection leaves chunks younger than build-gc-grace alone, so a build
+running alongside a collection never loses chunks.
+"""
+
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from robots.build.chunking import Chunker
+
+MANIFEST_VERSION = 1
+
+
+class BuildError(Exception):
+    """Raised for builds and releases that cannot be made or found"""
+
+
+class ReleaseStore:
+    """Chunk store and release manifests on local disk"""
+
+    def __init__(self, config=None):
+        """Initialize ReleaseStore with optional config
+
+        Args:
+            config: Configuration dictionary containing build-* settings
+        """
+        config = config or {}
+        self.root = os.path.expanduser(config.get('build-store-dir', '~/.robots/store'))
+        self.chunker = Chunker(config.get('build-chunk-min', 256 * 1024),
+                               config.get('build-chunk-avg', 1024 * 1024),
+                               config.get('build-chunk-max', 4 * 1024 * 1024))
+        self.workers = config.get('build-workers') or os.cpu_count() or 1
+        self.gc_grace = config.get('build-gc-grace', 3600)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.root, 'chunks', digest[:2], digest)
+
+    def has_chunk(self, digest):
+        return os.path.exists(self.chunk_path(digest))
+
+    def claim_chunk(self, digest):
+        """Whether a chunk is stored, refreshing its mtime so a concurrent
+        garbage collection leaves it alone while a new manifest is written"""
+        try:
+            os.utime(self.chunk_path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put_chunk(self, data):
+        """Store a chunk unless it is already stored; returns (digest, newly stored)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if self.claim_chunk(digest):
+            return digest, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return digest, True
+
+    def build(self, model, source_dir, label=None, previous=None):
+        """Chunk a build's output into the store and record it as a release
+
+        Args:
+            model: Robot model the build is for
+            source_dir: Directory holding the build output
+            label: Human-readable release name (default: a timestamp)
+            previous: Earlier manifest of the same tree; files whose size and
+                mtime match it reuse its chunk lists without being read
+
+        Returns:
+            (manifest, stats) where stats counts files, bytes and chunks
+            stored new versus already present
+        """
+        if not os.path.isdir(source_dir):
+            raise BuildError(f"Build output '{source_dir}' is not a directory")
+        known = previous['files'] if previous else {}
+        stats = {'files': 0, 'reused_files': 0, 'bytes': 0, 'chunks': 0, 'new_chunks': 0,
+                 'new_bytes': 0}
+        files, links, to_chunk = {}, {}, []
+        for path, relpath, info in _walk(source_dir):
+            if stat.S_ISLNK(info.st_mode):
+                links[relpath] = os.readlink(path)
+                continue
+            entry = {'mode': stat.S_IMODE(info.st_mode), 'size': info.st_size,
+                     'mtime_ns': info.st_mtime_ns}
+            stats['files'] += 1
+            stats['bytes'] += info.st_size
+            old = known.get(relpath)
+            if (old and old['size'] == info.st_size and old['mtime_ns'] == info.st_mtime_ns
+                    and all(self.claim_chunk(digest) for digest, _ in old['chunks'])):
+                entry['chunks'] = old['chunks']
+                stats['reused_files'] += 1
+            else:
+                to_chunk.append((relpath, path))
+            files[relpath] = entry
+
+        # Chunking is CPU bound, so large files are spread over processes
+        small = [(relpath, path) for relpath, path in to_chunk
+                 if files[relpath]['size'] <= self.chunker.min_size or self.workers == 1]
+        large = [(relpath, path) for relpath, path in to_chunk
+                 if files[relpath]['size'] > self.chunker.min_size and self.workers > 1]
+        for relpath, path in small:
+            files[relpath]['chunks'] = _store_file(self, path, stats)
+        if large:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(large))) as executor:
+                for relpath, (chunks, file_stats) in zip(
+                        [relpath for relpath, _ in large],
+                        executor.map(_chunk_file, [(self.root, self.chunker, path) for _, path in large])):
+                    files[relpath]['chunks'] = chunks
+                    for key, value in file_stats.items():
+                        stats[key] += value
+        stats['chunks'] = len({digest for entry in files.values() for digest, _ in entry['chunks']})
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'model': model,
+            'label': label or datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ'),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'source': os.path.abspath(source_dir),
+            'files': files,
+            'links': links,
+        }
+        manifest['id'] = release_id(manifest)
+        if os.path.exists(self._manifest_path(manifest['id'])):
+            # Same content as an earlier release, which keeps its label
+            return self.load(manifest['id']), stats
+        self.save(manifest)
+        return manifest, stats
+
+    def save(self, manifest):
+        path = self._manifest_path(manifest['id'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+
+    def load(self, release, missing_ok=False):
+        """Manifest for a release id, a unique id prefix, model:label, or
+        model:latest for the model's newest release
+
+        Raises:
+            BuildError: if no release (or more than one) matches, unless
+                missing_ok is set and none matches
+        """
+        path = self._manifest_path(release)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        matches = [manifest for manifest in self.releases()
+                   if manifest['id'].startswith(release)
+                   or f"{manifest['model']}:{manifest['label']}" == release]
+        if len(matches) == 1:
+            return matches[0]
+        model, _, label = release.partition(':')
+        if not matches and label == 'latest' and self.latest(model):
+            return self.latest(model)
+        if not matches and missing_ok:
+            return None
+        if not matches:
+            raise BuildError(f"No release '{release}'")
+        raise BuildError(f"'{release}' matches {len(matches)} releases")
+
+    def releases(self, model=None):
+        """Every stored manifest, oldest first, optionally for one model"""
+        directory = os.path.join(self.root, 'releases')
+        manifests = []
+        for filename in os.listdir(directory) if os.path.isdir(directory) else []:
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(directory, filename)) as f:
+                manifest = json.load(f)
+            if model is None or manifest['model'] == model:
+                manifests.append(manifest)
+        return sorted(manifests, key=lambda manifest: manifest['created_at'])
+
+    def latest(self, model):
+        releases = self.releases(model)
+        return releases[-1] if releases else None
+
+    def gc(self, keep=None, protected=(), dry_run=False):
+        """Drop old releases, then every chunk no remaining release uses
+
+        Args:
+            keep: Newest releases to keep per model; None keeps them all
+            protected: Release ids never dropped, such as deployed ones
+            dry_run: Report without deleting anything
+
+        Returns:
+            Dict counting releases and chunks removed and bytes freed
+        """
+        releases = self.releases()
+        dropped = []
+        if keep is not None:
+            by_model = {}
+            for manifest in releases:
+                by_model.setdefault(manifest['model'], []).append(manifest)
+            for manifests in by_model.values():
+                dropped.extend(manifest for manifest in manifests[:max(0, len(manifests) - keep)]
+                               if manifest['id'] not in protected)
+        dropped_ids = {manifest['id'] for manifest in dropped}
+        live = set()
+        for manifest in releases:
+            if manifest['id'] not in dropped_ids:
+                live.update(chunk_digests(manifest))
+
+        stats = {'releases': len(dropped), 'chunks': 0, 'bytes': 0, 'kept_chunks': len(live)}
+        if not dry_run:
+            for manifest in dropped:
+                os.unlink(self._manifest_path(manifest['id']))
+        cutoff = time.time() - self.gc_grace
+        chunk_root = os.path.join(self.root, 'chunks')
+        for dirpath, _, filenames in os.walk(chunk_root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if filename in live:
+                    continue
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # Young chunks may belong to a build whose manifest is not written yet
+                if info.st_mtime > cutoff:
+                    continue
+                stats['chunks'] += 1
+                stats['bytes'] += info.st_size
+                if not dry_run:
+                    os.unlink(path)
+        return stats
+
+    def _manifest_path(self, release_id):
+        return os.path.join(self.root, 'releases', f'{os.path.basename(release_id)}.json')
+
+
+def release_id(manifest):
+    """Hash of what a release contains: its model, files, modes, chunks and links"""
+    content = {
+        'model': manifest['model'],
+        'files': {path: [entry['mode'], [digest for digest, _ in entry['chunks']]]
+                  for path, entry in manifest['files'].items()},
+        'links': manifest['links'],
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def release_summary(manifest):
+    """A release's id, names and sizes without its file list"""
+    sizes = chunk_sizes(manifest)
+    return {
+        'id': manifest['id'],
+        'model': manifest['model'],
+        'label': manifest['label'],
+        'created_at': manifest['created_at'],
+        'files': len(manifest['files']),
+        'size': sum(entry['size'] for entry in manifest['files'].values()),
+        'chunks': len(sizes),
+        'chunk_bytes': sum(sizes.values()),
+    }
+
+
+def chunk_digests(manifest):
+    """Set of every chunk a release uses"""
+    return {digest for entry in manifest['files'].values() for digest, _ in entry['chunks']}
+
+
+def chunk_sizes(manifest):
+    """Mapping of every chunk a release uses to its size"""
+    return {digest: size for entry in manifest['files'].values() for digest, size in entry['chunks']}
+
+
+def _walk(root):
+    """(path, relative path, lstat) for every file and symlink below root, sorted"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames + [name for name in dirnames
+                                            if os.path.islink(os.path.join(dirpath, name))]):
+            path = os.path.join(dirpath, filename)
+            yield path, os.path.relpath(path, root), os.lstat(path)
+
+
+def _store_file(store, path, stats):
+    chunks = []
+    with open(path, 'rb') as f:
+        for data in store.chunker.chunks(f):
+            digest, new = store.put_chunk(data)
+            chunks.append([digest, len(data)])
+            if new:
+                stats['new_chunks'] += 1
+                stats['new_bytes'] += len(data)
+    return chunks
+
+
+def _chunk_file(args):
+    """Process pool entry point: chunk one file into the store"""
+    root, chunker, path = args
+    store = ReleaseStore({'build-store-dir': root})
+    store.chunker = chunker
+    stats = {'new_chunks': 0, 'new_bytes': 0}
+    return _store_file(store, path, stats), stats
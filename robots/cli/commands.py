@@ -4,75 +4,238 @@ Robot CLI
 The command line interface for the Robots tool
 """
 
+# First, so the --profile clock covers loading everything below
+from robots.cli import profile
+
 import click
+import functools
+import json
 import sys
-import tomllib
-from tabulate import tabulate
-from robots.api.connector import RobotConnector
-from robots.models import db, Robot, User, RobotAspect
-from flask import Flask
-from sqlalchemy.exc import OperationalError
+import time
 from contextlib import contextmanager
+from functools import lru_cache
+from robots.api.connector import RobotConnector
+from robots.audit import AuditLog, field_diff
+from robots.cli.formats import (
+    FORMATS, FormatError, RecordWriter, flat_record, guess_format, read_records, split_record
+)
+from robots.cli.snapshot import FleetSnapshot
+from robots.config import load_config
+from robots.db.predicates import FilterError, filter_records
+from robots.db.types import parse_typed
+
+# Flask, SQLAlchemy, the models and tabulate are imported inside the commands
+# that use them. `robots --help`, and reads answered from the snapshot, never
+# pay for loading them.
 
-# Load configuration
-config = {}
-try:
-    with open('robots/config/fleet-config.toml', 'rb') as f:
-        config = tomllib.load(f)
-except FileNotFoundError:
-    print("\033[91mWarning: fleet-config.toml not found, all settings will be default\033[0m")
-except Exception as e:
-    print(f"\033[91mWarning: Error loading fleet-config.toml: {e}\033[0m")
+with profile.early_phase('config load'):
+    config = load_config()
 
 @contextmanager
 def handle_db_connection():
     """Context manager to handle database connection errors gracefully."""
+    from sqlalchemy.exc import OperationalError
     try:
         yield
     except OperationalError as e:
         if "connection to server" in str(e):
             click.echo("\033[91mError: Failed to connect to the Robots database.\033[0m")
             click.echo("Please ensure the database is running and accessible.")
-            click.echo(f"Connection details: {app.config['SQLALCHEMY_DATABASE_URI']}")
+            click.echo(f"Connection details: {get_app().config['SQLALCHEMY_DATABASE_URI']}")
             sys.exit(1)
         raise
 
-# Create a minimal Flask app for database operations
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = config['DATABASE_URL']
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config['SQLALCHEMY_TRACK_MODIFICATIONS']
-db.init_app(app)
+@lru_cache(maxsize=None)
+def get_app():
+    """Create the minimal Flask app for database operations on first use"""
+    with profile.phase('app setup'):
+        from flask import Flask
+        from robots.db import engine_options
+        from robots.models import db
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = config['DATABASE_URL']
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config['SQLALCHEMY_TRACK_MODIFICATIONS']
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config)
+        db.init_app(app)
+    return app
     
 connector = RobotConnector(config)
+audit = AuditLog(config)
+
+def audited(command):
+    """Record every run of a command in the audit log
+
+    The command's parameters, duration and exit status are recorded as
+    one action; the command notes the robots it touched and what changed
+    with audit.note().
+    """
+    @functools.wraps(command)
+    def wrapper(**kwargs):
+        # Files are recorded by name
+        args = {key: value.name if hasattr(value, 'read') else value for key, value in kwargs.items()}
+        with audit.action(click.get_current_context().info_name, args):
+            return command(**kwargs)
+    return wrapper
+
+def select_robots(filters, sort=None, query=None):
+    """Compile --filter pairs and --sort into a Robot query, exiting on bad input"""
+    from robots.db.filters import compile_query
+    from robots.models import Robot
+    try:
+        return compile_query(query or Robot.query, filters, sort, config.get('aspect-types'))
+    except FilterError as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+def check_aspect_value(aspect_name, value):
+    """Exit if a value does not fit the aspect's declared type"""
+    value_type = config.get('aspect-types', {}).get(aspect_name)
+    if not value_type:
+        return
+    try:
+        parse_typed(value, value_type)
+    except ValueError:
+        click.echo(f"Error: Aspect '{aspect_name}' is declared {value_type}, got '{value}'", err=True)
+        sys.exit(1)
+
+def read_fleet(filters=(), sort=None, fresh=False):
+    """Robots matching filters as snapshot records
+
+    Served from the local snapshot while it is within snapshot-max-age,
+    otherwise the snapshot is refreshed incrementally first. --fresh reads
+    straight from the database. If the database cannot be reached, the last
+    snapshot is used and a stale banner is shown.
+    """
+    snapshot = FleetSnapshot(config)
+    if fresh or not snapshot.enabled:
+        with profile.phase('db imports'):
+            from robots.cli.snapshot import robot_record
+            from robots.models import Robot
+        with get_app().app_context():
+            with handle_db_connection():
+                with profile.phase('load rows'):
+                    robots = select_robots(filters, sort, Robot.query_with_aspects()).all()
+                    return [robot_record(robot) for robot in robots]
+
+    if not snapshot.is_fresh():
+        from sqlalchemy.exc import OperationalError
+        try:
+            with profile.phase('snapshot refresh'):
+                with get_app().app_context():
+                    snapshot.refresh()
+                snapshot.save()
+        except OperationalError:
+            if not snapshot.loaded:
+                with handle_db_connection():
+                    raise
+            click.echo(click.style(
+                f"Database unreachable, showing snapshot stale as of {snapshot.stale_as_of()}",
+                fg='yellow'), err=True)
+
+    try:
+        with profile.phase('snapshot'):
+            return filter_records(snapshot.records(), filters, sort, config.get('aspect-types'))
+    except FilterError as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+@contextmanager
+def stream_fleet(filters=(), sort=None, fresh=False, aspects=False):
+    """Robots matching filters as an iterator of snapshot records
+
+    Like read_fleet, but reads from the database (--fresh, or with the
+    snapshot turned off) stream from one cursor, list-batch-size rows at a
+    time, as the caller consumes them, so memory stays flat however many
+    match. Aspects are only read when asked for.
+
+    Args:
+        aspects: Include the robots' aspects, and look up their sorted names
+
+    Yields:
+        (records, aspect names)
+    """
+    snapshot = FleetSnapshot(config)
+    if not fresh and snapshot.enabled:
+        robots = read_fleet(filters, sort)
+        yield robots, sorted({name for robot in robots for name in robot['aspects']}) if aspects else ()
+        return
+
+    with profile.phase('db imports'):
+        from robots.cli.snapshot import stream_records
+        from robots.db.bulk import aspect_names
+        from robots.models import db, Robot
+    with get_app().app_context():
+        with handle_db_connection():
+            # Checks the filters and sort before anything is printed
+            selected = select_robots(filters, sort)
+            if aspects:
+                robot_ids = selected.with_entities(Robot.id).order_by(None).statement if filters else None
+                names = aspect_names(db.session, robot_ids)
+            else:
+                names = ()
+            yield stream_records(selected, aspects, config.get('list-batch-size', 1000)), names
+
+def expire_snapshot():
+    """Make the next read see a write this process just committed"""
+    FleetSnapshot(config).expire()
+
+def read_robot(name, fresh=False):
+    """A single robot's snapshot record, or None"""
+    return next(iter(read_fleet([('name', f'={name}')], fresh=fresh)), None)
+
+def get_default_user(commit=True):
+    """Get or create the default user that owns new robots
+
+    This is temporary until we implement Auth.
+
+    Args:
+        commit: Commit a newly created user. Pass False inside a larger
+            transaction; the user is only flushed, and is rolled back with it.
+    """
+    from robots.models import db, User
+    default_user = User.query.filter_by(email='default@robots.local').first()
+    if not default_user:
+        default_user = User(
+            oauth_id='default',
+            email='default@robots.local',
+            name='Default User'
+        )
+        db.session.add(default_user)
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+    return default_user
 
 @click.group()
-def cli():
+@click.option('--profile', 'profile_enabled', is_flag=True,
+              help='Report where the command spent its time: import, config, database, SQL, render')
+@click.option('--profile-dump', type=click.Path(dir_okay=False),
+              help='Also run the command under cProfile and write the stats to this file')
+@click.pass_context
+def cli(ctx, profile_enabled, profile_dump):
     """Robot Fleet Management Tool"""
-    pass
+    if profile_enabled or profile_dump:
+        run = profile.Profile(' '.join(['robots'] + sys.argv[1:]), profile_dump)
+        run.start()
+        ctx.call_on_close(run.stop)
 
 @cli.command()
 @click.argument('name')
 @click.argument('model')
 @click.argument('hostname')
+@audited
 def create(name, model, hostname):
     """Create a new robot"""
-    with app.app_context():
+    from robots.models import db, Robot
+    with get_app().app_context():
         with handle_db_connection():
             if Robot.query.filter_by(name=name).first():
                 print(f"Error: Robot '{name}' already exists")
+                audit.fail(f"Robot '{name}' already exists")
                 return
             
-            # Get or create default user
-            # This is temporary until we implement Auth.
-            default_user = User.query.filter_by(email='default@robots.local').first()
-            if not default_user:
-                default_user = User(
-                    oauth_id='default',
-                    email='default@robots.local',
-                    name='Default User'
-                )
-                db.session.add(default_user)
-                db.session.commit()
+            default_user = get_default_user()
             
             robot = Robot(
                 name=name, 
@@ -82,136 +245,193 @@ def create(name, model, hostname):
             )
             db.session.add(robot)
             db.session.commit()
+            expire_snapshot()
+            audit.note(name, field_diff({}, {'name': name, 'model': model, 'hostname': hostname}))
             print(f"Created robot '{name}'")
 
 @cli.command()
 @click.argument('name')
-def inspect(name):
+@click.option('--fresh', is_flag=True, help='Read from the database, bypassing the snapshot')
+def inspect(name, fresh):
     """Inspect a robot's details"""
-    with app.app_context():
+    robot = read_robot(name, fresh)
+    if not robot:
+        print(f"Error: Robot '{name}' not found")
+        return
+    
+    print(f"\nRobot: {name}")
+    print(f"Model: {robot['model']}")
+    print(f"Hostname: {robot['hostname']}")
+    print(f"Status: {robot['status']}")
+    print(f"Location: {robot['location']}")
+    print("\nAspects:")
+    for aspect_name, value in robot['aspects'].items():
+        print(f"  {aspect_name}: {value}")
+
+def probe_options(command):
+    """Options shared by commands that can probe robots live"""
+    command = click.option('--update', is_flag=True,
+                           help='With --live, write online/unreachable back to the robot status')(command)
+    command = click.option('--timeout', '-t', type=float,
+                           help='Per-robot probe timeout in seconds')(command)
+    command = click.option('--command', '-c', 'probe_command',
+                           help='With --live, also run this over ssh; it must exit 0')(command)
+    command = click.option('--live', is_flag=True,
+                           help='Probe the robots now instead of trusting the stored status')(command)
+    return command
+
+def probe_robots(robots, probe_command=None, timeout=None, concurrency=None, update=False):
+    """Probe robots concurrently, optionally writing their state back
+
+    Returns:
+        Mapping of robot name to ProbeResult
+    """
+    targets = [(robot['name'], robot['hostname']) for robot in robots]
+    click.echo(f"Probing {len(targets)} robots...", err=True)
+    started = time.monotonic()
+    results = connector.probe(targets, probe_command, concurrency=concurrency, timeout=timeout)
+    online = sum(1 for result in results if result.reachable)
+    click.echo(f"{online}/{len(results)} reachable in {time.monotonic() - started:.2f}s", err=True)
+    if update:
+        write_probe_states(results)
+    return {result.name: result for result in results}
+
+def write_probe_states(results):
+    """Store probe states as robot statuses, touching only robots whose state changed"""
+    from robots.db.bulk import import_fleet
+    from robots.models import db
+    with get_app().app_context():
         with handle_db_connection():
-            robot = Robot.query.filter_by(name=name).first()
-            if not robot:
-                print(f"Error: Robot '{name}' not found")
-                return
-            
-            print(f"\nRobot: {name}")
-            print(f"Model: {robot.model}")
-            print(f"Hostname: {robot.hostname}")
-            print(f"Status: {robot.status}")
-            print(f"Location: {robot.location}")
-            print("\nAspects:")
-            for aspect in robot.aspects:
-                print(f"  {aspect.name}: {aspect.value}")
+            stats = import_fleet(db.session, [({'name': result.name, 'status': result.state}, {})
+                                              for result in results], None, create=False)
+            db.session.commit()
+    expire_snapshot()
+    click.echo(f"Updated status of {stats.updated} robots", err=True)
+
+def format_probe(result):
+    if result.reachable and result.command_ok is not False:
+        return click.style(result.state, fg='green'), f"{result.latency * 1000:.1f}ms"
+    return click.style(result.state, fg='red'), result.error or '-'
+
+def probe_record(result):
+    """Probe result as the live and latency keys of a streamed record"""
+    if result.reachable and result.command_ok is not False:
+        return {'live': result.state, 'latency': round(result.latency * 1000, 1)}
+    return {'live': result.state, 'latency': result.error}
 
 @cli.command()
 @click.argument('name')
-def status(name):
+@click.option('--fresh', is_flag=True, help='Read from the database, bypassing the snapshot')
+@probe_options
+def status(name, fresh, live, probe_command, timeout, update):
     """Check robot status"""
-    with app.app_context():
-        with handle_db_connection():
-            robot = Robot.query.filter_by(name=name).first()
-            if not robot:
-                print(f"Error: Robot '{name}' not found")
-                return
-            
-            print(f"\nRobot: {name}")
-            print(f"Status: {robot.status}")
-            print(f"Location: {robot.location}")
+    robot = read_robot(name, fresh)
+    if not robot:
+        print(f"Error: Robot '{name}' not found")
+        return
+    
+    print(f"\nRobot: {name}")
+    print(f"Status: {robot['status']}")
+    print(f"Location: {robot['location']}")
+    if live:
+        result = probe_robots([robot], probe_command, timeout, update=update)[name]
+        state, detail = format_probe(result)
+        print(f"Live: {state} ({detail})")
+
+LIST_FORMATS = ('simple', 'jsonl', 'csv', 'tsv')
 
 @cli.command()
-@click.option('--filter', '-f', multiple=True, nargs=2, help='Filter by any aspect')
+@click.option('--filter', '-f', multiple=True, nargs=2,
+              help='Filter by any aspect. VALUE may be !value, prefix*, or a,b,c')
 @click.option('--detailed', '-d', is_flag=True, help='Show detailed view including all aspects')
-@click.option('--sort', '-s', help='Sort robots by specified aspect')
-def list(filter, detailed, sort):
-    """List all robots"""
-    with app.app_context():
-        with handle_db_connection():
-            query = Robot.query
-            
-            # Apply filters
-            if filter:
-                for aspect_name, value in filter:
-                    if aspect_name == 'deployed':
-                        value = value.lower() == 'true'
-                    if hasattr(Robot, aspect_name):
-                        query = query.filter(getattr(Robot, aspect_name) == value)
-                    else:
-                        query = query.join(RobotAspect).filter(
-                            RobotAspect.name == aspect_name,
-                            RobotAspect.value == value
-                        )
-            
-            # Apply sorting
-            if sort:
-                if hasattr(Robot, sort):
-                    query = query.order_by(getattr(Robot, sort))
-                else:
-                    query = query.join(RobotAspect).filter(
-                        RobotAspect.name == sort
-                    ).order_by(RobotAspect.value)
-            
-            robots = query.all()
-            
-            if not robots:
-                print("No robots found.")
-                return
-            
-            # Print results using tabulate
-            if not detailed:
-                headers = ["Robot", "Model", "Status", "Location"]
+@click.option('--sort', '-s', help='Sort robots by specified aspect, prefix with - to reverse')
+@click.option('--fresh', is_flag=True, help='Read from the database, bypassing the snapshot')
+@click.option('--format', 'output_format', type=click.Choice(LIST_FORMATS), default='simple',
+              help='Print a table, or stream one record per robot as JSON lines, CSV or TSV')
+@probe_options
+@click.option('--concurrency', type=int, help='With --live, most robots probed at once')
+def list(filter, detailed, sort, fresh, output_format, live, probe_command, timeout, update, concurrency):
+    """List all robots
+
+    Rows are printed as they are read. With --fresh, or the snapshot off,
+    they come from the database a batch at a time, so even very large
+    fleets list in constant memory. The table's column widths are fixed
+    by its first list-sample-size rows, or by list-column-widths.
+    """
+    table = output_format == 'simple'
+    with stream_fleet(filter, sort, fresh, aspects=detailed) as (robots, aspect_names):
+        probes = None
+        if live:
+            # Every robot is probed before any is printed
+            robots = [*robots]
+            if robots:
+                probes = probe_robots(robots, probe_command, timeout, concurrency, update)
+        with profile.phase('render'):
+            if table:
+                count = list_table(robots, detailed, aspect_names, probes)
             else:
-                headers = [
-                    "Robot", 
-                    "Model", 
-                    "Hostname",
-                    "Status",
-                    "Location"
-                ]
-                # Get all unique aspect names from all robots
-                aspect_names = set()
+                extra = (*aspect_names, *(('live', 'latency') if live else ()))
+                writer = RecordWriter(sys.stdout, output_format, extra)
                 for robot in robots:
-                    aspect_names.update(aspect.name for aspect in robot.aspects)
-                headers.extend(sorted(aspect_names))
-            
-            table = []
-            for robot in robots:
-                if not detailed:
-                    row = [robot.name, robot.model, robot.status, robot.location]
-                else:
-                    row = [
-                        robot.name, 
-                        robot.model, 
-                        robot.hostname,
-                        robot.status, 
-                        robot.location
-                    ]
-                    # Create a dictionary of aspect name to value for easy lookup
-                    aspect_dict = {aspect.name: aspect.value for aspect in robot.aspects}
-                    # Add aspect values in the same order as headers
-                    for aspect_name in headers[5:]:  # Skip the first 5 standard columns
-                        row.append(aspect_dict.get(aspect_name, '-'))
-                
-                if robot.status == "online":
-                        row[0] = click.style(robot.name, fg='green')
-                table.append(row)
-            
+                    record = flat_record(robot, aspects=detailed)
+                    if probes is not None:
+                        record.update(probe_record(probes[robot['name']]))
+                    writer.write(record)
+                writer.close()
+                count = writer.count
+
+    if not count and table:
+        print("No robots found.")
+
+def list_table(robots, detailed, aspect_names, probes=None):
+    """Print robots as a table as they arrive
+
+    Returns:
+        The number of robots printed
+    """
+    from robots.cli.table import StreamingTable
+
+    if not detailed:
+        headers = ["Robot", "Model", "Status", "Location"]
+    else:
+        headers = ["Robot", "Model", "Hostname", "Status", "Location", *aspect_names]
+    if probes is not None:
+        headers += ["Live", "Latency / error"]
+
+    output = None
+    for robot in robots:
+        if output is None:
             print("\nRobots:")
-            if detailed:
-                print(tabulate(table, headers, tablefmt="simple"))
-            else:
-                print(tabulate(table, headers, tablefmt="simple"))
+            output = StreamingTable(headers, widths=config.get('list-column-widths'),
+                                    sample_size=config.get('list-sample-size', 100))
+        if not detailed:
+            row = [robot['name'], robot['model'], robot['status'], robot['location']]
+        else:
+            row = [robot['name'], robot['model'], robot['hostname'], robot['status'], robot['location']]
+            row.extend(robot['aspects'].get(aspect_name, '-') for aspect_name in aspect_names)
+        if robot['status'] == "online":
+            row[0] = click.style(robot['name'], fg='green')
+        if probes is not None:
+            row.extend(format_probe(probes[robot['name']]))
+        output.write(row)
+    if output is None:
+        return 0
+    output.close()
+    return output.count
 
 @cli.command()
 @click.argument('name')
 @click.option('--default', help='Default value for the aspect')
+@audited
 def add_aspect(name, default):
     """Add a new aspect to a robot"""
-    with app.app_context():
+    from robots.models import db, Robot, RobotAspect
+    with get_app().app_context():
         with handle_db_connection():
             robot = Robot.query.filter_by(name=name).first()
             if not robot:
                 print(f"Error: Robot '{name}' not found")
+                audit.fail(f"Robot '{name}' not found")
                 return
             
             aspect_name = click.prompt("Enter aspect name")
@@ -219,75 +439,112 @@ def add_aspect(name, default):
                 value = default
             else:
                 value = click.prompt("Enter aspect value")
+            check_aspect_value(aspect_name, value)
             
             aspect = RobotAspect(name=aspect_name, value=value, robot=robot)
             db.session.add(aspect)
             db.session.commit()
+            expire_snapshot()
+            audit.note(name, field_diff({}, {aspect_name: value}))
             print(f"Added aspect '{aspect_name}' to robot '{name}'")
 
 @cli.command()
-@click.argument('name')
+@click.argument('name', required=False)
+@click.option('--filter', '-f', multiple=True, nargs=2,
+              help='Edit every robot matching the filter, as accepted by list')
 @click.option('--model', help='Edit robot model')
 @click.option('--status', help='Edit robot status')
 @click.option('--hostname', help='Edit robot hostname')
 @click.option('--deployed', help='Edit robot deployment status (true/false)')
 @click.option('--location', help='Edit robot location')
 @click.option('--aspect', '-a', multiple=True, nargs=2, help='Edit aspect value')
-def edit(name, model, status, hostname, deployed, location, aspect):
-    """Edit robot attributes"""
-    with app.app_context():
+@click.option('--dry-run', is_flag=True, help='Report what would change without writing anything')
+@audited
+def edit(name, filter, model, status, hostname, deployed, location, aspect, dry_run):
+    """Edit robot attributes
+
+    Edits the robot NAME, or every robot matching --filter. The changes are
+    applied to the whole selection with a few set-based statements in one
+    transaction.
+    """
+    from robots.db.bulk import edit_fleet
+    from robots.models import db, Robot, RobotAspect
+
+    if not name and not filter:
+        click.echo("Error: Give a robot NAME or at least one --filter", err=True)
+        sys.exit(1)
+
+    fields = {}
+    if model is not None:
+        fields['model'] = model
+    if status is not None:
+        fields['status'] = status
+    if hostname is not None:
+        fields['hostname'] = hostname
+    if deployed is not None:
+        fields['deployed'] = deployed.lower() == 'true'
+    if location is not None:
+        fields['location'] = location
+
+    aspects = {}
+    for aspect_name, aspect_value in aspect:
+        check_aspect_value(aspect_name, aspect_value)
+        aspects[aspect_name] = aspect_value
+
+    selector = ([('name', f'={name}')] if name else []) + [tuple(pair) for pair in filter]
+    with get_app().app_context():
         with handle_db_connection():
-            robot = Robot.query.filter_by(name=name).first()
-            if not robot:
-                print(f"Error: Robot '{name}' not found")
+            robot_ids = select_robots(selector).with_entities(Robot.id).statement
+            if audit.enabled and not dry_run:
+                # Old values for the audit diff, read in the edit's own transaction
+                before = {}
+                for row in db.session.execute(db.select(Robot.name, *[getattr(Robot, field) for field in fields])
+                                              .where(Robot.id.in_(robot_ids))):
+                    before[row[0]] = dict(zip(fields, row[1:]))
+                if aspects:
+                    for robot_name, aspect_name, value in db.session.execute(
+                            db.select(Robot.name, RobotAspect.name, RobotAspect.value).join(RobotAspect)
+                            .where(Robot.id.in_(robot_ids), RobotAspect.name.in_(tuple(aspects)))):
+                        before[robot_name][aspect_name] = value
+            stats = edit_fleet(db.session, robot_ids, fields, aspects)
+            if not stats.matched:
+                db.session.rollback()
+                if name and not filter:
+                    print(f"Error: Robot '{name}' not found")
+                    audit.fail(f"Robot '{name}' not found")
+                else:
+                    print("No robots found.")
+                return
+            if dry_run:
+                db.session.rollback()
+                print(f"Dry run: {stats}. Nothing was written.")
                 return
-            
-            # Edit core attributes
-            if model is not None:
-                robot.model = model
-            if status is not None:
-                robot.status = status
-            if hostname is not None:
-                robot.hostname = hostname
-            if deployed is not None:
-                robot.deployed = deployed.lower() == 'true'
-            if location is not None:
-                robot.location = location
-            
-            # Edit aspects
-            if aspect:
-                for aspect_name, aspect_value in aspect:
-                    # Check if aspect exists
-                    existing_aspect = RobotAspect.query.filter_by(
-                        robot_id=robot.id,
-                        name=aspect_name
-                    ).first()
-                    
-                    if existing_aspect:
-                        # Update existing aspect
-                        existing_aspect.value = aspect_value
-                    else:
-                        # Create new aspect
-                        new_aspect = RobotAspect(
-                            name=aspect_name,
-                            value=aspect_value,
-                            robot=robot
-                        )
-                        db.session.add(new_aspect)
-            
             db.session.commit()
-            print(f"Updated robot '{name}'")
+    expire_snapshot()
+    if audit.enabled:
+        for robot_name, values in before.items():
+            changes = field_diff(values, dict(fields, **aspects))
+            if changes:
+                audit.note(robot_name, changes)
+    if name and not filter:
+        print(f"Updated robot '{name}'")
+    else:
+        print(f"Updated robots: {stats}")
 
 @cli.command()
 @click.argument('name')
 @click.option('--force', '-f', is_flag=True, help='Skip confirmation prompt')
+@audited
 def remove_aspect(name, force):
     """Remove an aspect from a robot"""
-    with app.app_context():
+    from datetime import datetime
+    from robots.models import db, Robot, RobotAspect
+    with get_app().app_context():
         with handle_db_connection():
             robot = Robot.query.filter_by(name=name).first()
             if not robot:
                 print(f"Error: Robot '{name}' not found")
+                audit.fail(f"Robot '{name}' not found")
                 return
             
             aspect_name = click.prompt("Enter aspect name to remove")
@@ -298,6 +555,7 @@ def remove_aspect(name, force):
             
             if not aspect:
                 print(f"Error: Aspect '{aspect_name}' not found on robot '{name}'")
+                audit.fail(f"Aspect '{aspect_name}' not found on robot '{name}'")
                 return
             
             if not force:
@@ -305,50 +563,765 @@ def remove_aspect(name, force):
                     return
             
             db.session.delete(aspect)
+            # Deleting an aspect leaves no row behind to carry an updated_at,
+            # so bump the robot's for snapshot refreshes to notice
+            robot.updated_at = datetime.utcnow()
+            removed = aspect.value
             db.session.commit()
+            expire_snapshot()
+            audit.note(name, field_diff({aspect_name: removed}, {aspect_name: None}))
             print(f"Removed aspect '{aspect_name}' from robot '{name}'")
 
 @cli.command()
 @click.argument('name')
 @click.option('--remote-command', '-c', help='Command to run on the robot')
+@audited
 def connect(name, remote_command):
     """Connect to a robot via SSH"""
-    with app.app_context():
-        robot = Robot.query.filter_by(name=name).first()
-        if not robot:
-            click.echo(f"Error: Robot '{name}' not found", err=True)
-            sys.exit(1)
-        
-        click.echo(f"Connecting to {name} via hostname:{robot.hostname}...")
-        connector.connect(robot.hostname, remote_command)
+    robot = read_robot(name)
+    if not robot:
+        click.echo(f"Error: Robot '{name}' not found", err=True)
+        sys.exit(1)
+    
+    click.echo(f"Connecting to {name} via hostname:{robot['hostname']}...")
+    connected = connector.connect(robot['hostname'], remote_command)
+    audit.note(name, status=0 if connected else 1)
+
+@cli.command(name='exec')
+@click.argument('remote_command')
+@click.option('--filter', '-f', multiple=True, nargs=2, help='Select robots by any aspect')
+@click.option('--workers', '-w', type=int, help='Maximum number of robots to run on at once')
+@click.option('--timeout', '-t', type=float, help='Per-robot timeout in seconds')
+@click.option('--format', 'output_format', type=click.Choice(['table', 'jsonl']), default='table',
+              help='Summary table or one JSON object per robot')
+@click.option('--yes', '-y', is_flag=True, help='Skip confirmation when no filter is given')
+@audited
+def exec_command(remote_command, filter, workers, timeout, output_format, yes):
+    """Run a command on every matching robot in parallel"""
+    from tabulate import tabulate
+    robots = read_fleet(filter, 'name')
+    targets = [(robot['name'], robot['hostname']) for robot in robots]
+
+    if not targets:
+        print("No robots found.")
+        return
+
+    if not filter and not yes:
+        if not click.confirm(f"Run '{remote_command}' on all {len(targets)} robots?"):
+            return
+
+    on_result = None
+    if output_format == 'jsonl':
+        # Stream each result as soon as its robot finishes
+        on_result = lambda result: click.echo(json.dumps(result.to_dict()))
+    else:
+        click.echo(f"Running '{remote_command}' on {len(targets)} robots...", err=True)
+
+    results = connector.execute(targets, remote_command, workers=workers, timeout=timeout,
+                                on_result=on_result)
+    for result in results:
+        audit.note(result.name, status=result.exit_code if result.exit_code is not None else 1,
+                   error='timed out' if result.timed_out else None)
+
+    if output_format == 'table':
+        table = []
+        for result in results:
+            if result.timed_out:
+                exit_code = click.style('timeout', fg='red')
+            elif result.ok:
+                exit_code = click.style('0', fg='green')
+            else:
+                exit_code = click.style(str(result.exit_code), fg='red')
+            output = (result.stdout if result.ok else result.stderr or result.stdout).strip()
+            last_line = output.splitlines()[-1] if output else ''
+            table.append([result.name, result.hostname, exit_code, f"{result.duration:.2f}s", last_line[:80]])
+        print(tabulate(table, ["Robot", "Hostname", "Exit", "Time", "Output"],
+                       tablefmt="simple", disable_numparse=True))
+        failed = sum(1 for result in results if not result.ok)
+        print(f"\n{len(results) - failed} succeeded, {failed} failed")
+
+    if any(not result.ok for result in results):
+        sys.exit(1)
 
 @cli.command()
 @click.argument('name')
-@click.argument('source_dir')
-@click.argument('dest_dir')
-def push(name, source_dir, dest_dir):
-    """Push files to a robot using rsync"""
-    with app.app_context():
-        robot = Robot.query.filter_by(name=name).first()
-        if not robot:
-            click.echo(f"Error: Robot '{name}' not found", err=True)
+@click.argument('metric')
+@click.option('--since', default='1h', help='Start of the window: a duration ago (90s, 15m, 6h, 7d) or ISO time')
+@click.option('--until', default='now', help='End of the window, in the same forms as --since')
+@click.option('--points', type=int, default=60, help='Roughly how many points to show')
+@click.option('--format', 'output_format', type=click.Choice(['table', 'json']), default='table',
+              help='Table or a JSON document')
+def history(name, metric, since, until, points, output_format):
+    """Show a robot's metric history
+
+    The answer comes from the cheapest resolution (raw samples, minute or
+    hour rollups) that covers the window at the requested detail.
+    """
+    from tabulate import tabulate
+    from robots.models import db
+    from robots.telemetry import TelemetryStore, format_time, parse_time
+
+    try:
+        start, end = parse_time(since), parse_time(until)
+    except ValueError as e:
+        click.echo(f"Error: Invalid time: {e}", err=True)
+        sys.exit(1)
+    robot = read_robot(name)
+    if not robot:
+        click.echo(f"Error: Robot '{name}' not found", err=True)
+        sys.exit(1)
+
+    with get_app().app_context():
+        with handle_db_connection():
+            resolution, rows = TelemetryStore(config).history(
+                db.session, robot['id'], metric, start, end, points)
+
+    if output_format == 'json':
+        click.echo(json.dumps({"robot": name, "metric": metric, "resolution": resolution,
+                               "since": format_time(start), "until": format_time(end),
+                               "points": rows}, indent=2))
+        return
+    if not rows:
+        print(f"No {metric} history for {name} between {format_time(start)} and {format_time(end)}")
+        return
+    print(f"\n{name} {metric} ({resolution} resolution)")
+    print(tabulate(
+        [[row['time'], row['resolution'], row['count'], row['avg'], row['min'], row['max'], row['last']]
+         for row in rows],
+        ["Time (UTC)", "Resolution", "Samples", "Avg", "Min", "Max", "Last"],
+        tablefmt="simple", floatfmt=".2f", missingval="-"
+    ))
+
+@cli.command()
+@click.option('--every', type=float, help='Keep running, once every this many seconds')
+def rollup(every):
+    """Roll telemetry up into minute and hour aggregates and apply retention
+
+    Change log entries older than changes-retention are pruned too.
+    """
+    from robots.db.changes import ChangeFeed
+    from robots.models import db
+    from robots.telemetry import TelemetryStore
+
+    store = TelemetryStore(config)
+    feed = ChangeFeed(config)
+    while True:
+        with get_app().app_context():
+            with handle_db_connection():
+                written = store.rollup(db.session)
+                deleted = store.retain(db.session)
+                pruned = feed.prune(db.session)
+                db.session.commit()
+        print(f"Rolled up {written['minute']} minute and {written['hour']} hour buckets; "
+              f"deleted {deleted['raw']} samples, {deleted['minute']} minute and "
+              f"{deleted['hour']} hour buckets, and {pruned} old change log entries")
+        if not every:
+            return
+        time.sleep(every)
+
+@cli.command()
+@click.option('--interval', '-i', type=float, help='Seconds between probes of each robot')
+@click.option('--concurrency', type=int, help='Most robots probed at once')
+@click.option('--once', is_flag=True, help='Probe every robot once, write the results and exit')
+@click.option('--duration', type=float, help='Stop after this many seconds')
+@click.option('--stats', 'show_stats', is_flag=True, help="Print the running sweeper's latest stats and exit")
+def sweeper(interval, concurrency, once, duration, show_stats):
+    """Probe the whole fleet continuously and keep robot statuses current
+
+    Each robot is probed every sweeper-interval seconds, with jitter, and
+    less often while it keeps failing. Robots whose state changes are
+    written back to their status in batches.
+    """
+    from robots.api.sweeper import FleetSweeper
+
+    sweeper_config = dict(config)
+    if interval:
+        sweeper_config['sweeper-interval'] = interval
+    if concurrency:
+        sweeper_config['sweeper-concurrency'] = concurrency
+    fleet_sweeper = FleetSweeper(get_app(), connector, sweeper_config)
+    if show_stats:
+        try:
+            with open(fleet_sweeper.stats_path) as f:
+                print(json.dumps(json.load(f), indent=2))
+        except (OSError, ValueError) as e:
+            print(f"Error: No sweeper stats at {fleet_sweeper.stats_path} ({e})")
             sys.exit(1)
-        
-        connector.transfer(robot.hostname, source_dir, dest_dir, pull=False)
+        return
+
+    if not once:
+        click.echo(f"Sweeping every {fleet_sweeper.interval:g}s with up to "
+                   f"{fleet_sweeper.concurrency} probes at once; Ctrl-C to stop", err=True)
+    try:
+        stats = fleet_sweeper.run(once=once, duration=duration)
+    except KeyboardInterrupt:
+        return
+    expire_snapshot()
+    if once:
+        print(json.dumps(stats, indent=2))
 
 @cli.command()
-@click.argument('name')
-@click.argument('source_dir')
-@click.argument('dest_dir')
-def pull(name, source_dir, dest_dir):
-    """Pull files from a robot using rsync"""
-    with app.app_context():
-        robot = Robot.query.filter_by(name=name).first()
-        if not robot:
-            click.echo(f"Error: Robot '{name}' not found", err=True)
+@click.option('--host', help='Address to listen on (default: serve-host)')
+@click.option('--port', '-p', type=int, help='Port to listen on (default: serve-port)')
+@click.option('--workers', '-w', type=int, help='Worker processes (default: serve-workers, or one per CPU)')
+@click.option('--access-log', is_flag=True, help='Log every request to stderr')
+def serve(host, port, workers, access_log):
+    """Serve the API from pre-forked worker processes
+
+    The app is built and the schema checked once, then every worker serves
+    it from the same listening socket with its own database connections.
+    Workers that die are restarted; SIGTERM or Ctrl-C stops them after
+    their requests in flight.
+    """
+    import os
+    from robots.api.server import PreforkServer
+    from robots.config import config_path
+
+    path = config_path()
+    if path:
+        # Workers, and processes they start, read this file wherever they run
+        os.environ['ROBOTS_CONFIG'] = os.path.abspath(path)
+    server = PreforkServer(config, host, port, workers, access_log)
+    with handle_db_connection():
+        from robots.api.app import create_app
+        app = create_app()
+    try:
+        sys.exit(server.run(app))
+    except OSError as e:
+        click.echo(f"Error: Cannot listen on {server.host}:{server.port}: {e.strerror or e}", err=True)
+        sys.exit(1)
+
+@cli.command()
+@click.option('--since', default='now',
+              help="Change cursor to start after, 0 for all retained changes (default: now)")
+@click.option('--format', 'output_format', type=click.Choice(['table', 'jsonl']), default='table',
+              help='Print changes as aligned lines or one JSON object per line')
+@click.option('--once', is_flag=True, help='Print the changes waiting and exit')
+def watch(since, output_format, once):
+    """Follow robots and aspects as they are created, updated and deleted
+
+    Long-polls the change log, so an idle fleet costs one cheap query per
+    changes-poll-interval. Ends with the cursor to pass to --since to pick
+    up where it left off.
+    """
+    from robots.db.changes import ChangeFeed, CursorExpired
+    from robots.models import db
+
+    feed = ChangeFeed(config)
+    with get_app().app_context():
+        with handle_db_connection():
+            if since == 'now':
+                cursor = feed.latest(db.session)[0]
+            else:
+                try:
+                    cursor = int(since)
+                except ValueError:
+                    print(f"Error: --since must be a cursor or 'now', not '{since}'")
+                    sys.exit(1)
+            try:
+                while True:
+                    changes, cursor, more = feed.changes(db.session, cursor)
+                    for change in changes:
+                        print(json.dumps(change) if output_format == 'jsonl' else format_change(change),
+                              flush=True)
+                    if more:
+                        continue
+                    if once:
+                        break
+                    feed.wait(db.session, cursor, feed.max_wait)
+            except CursorExpired as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            except KeyboardInterrupt:
+                pass
+    print(f"Cursor: {cursor}", file=sys.stderr)
+
+def format_change(change):
+    target = change['robot'] + (f" [{change['aspect']}]" if change['aspect'] else '')
+    if change['op'] == 'delete':
+        detail = 'deleted'
+    elif change['aspect']:
+        detail = f"= {change['value']}" if change['value'] is not None else 'gone'
+    elif change['fields']:
+        detail = ' '.join(f"{field}={value}" for field, value in change['fields'].items())
+    else:
+        detail = 'gone'
+    return f"{change['seq']:>8}  {change['changed_at'][:19]}  {target}  {detail}"
+
+@cli.command()
+@click.option('--close', '-c', 'close', multiple=True, help='Close masters for a robot name or hostname')
+@click.option('--close-all', is_flag=True, help='Close every master connection')
+@click.option('--prune', is_flag=True, help='Remove sockets left behind by dead masters')
+def sessions(close, close_all, prune):
+    """List and close persistent SSH sessions"""
+    from tabulate import tabulate
+    if close_all:
+        close = sorted({session["hostname"] for session in connector.sessions()})
+
+    if close:
+        known = {session["hostname"] for session in connector.sessions()}
+        for target in close:
+            hostname = target
+            if target not in known:
+                # Not a hostname with a master, so try it as a robot name
+                robot = read_robot(target)
+                if robot:
+                    hostname = robot['hostname']
+            closed = connector.close_session(hostname)
+            print(f"Closed {closed} session(s) to {hostname}")
+        return
+
+    if prune:
+        print(f"Removed {connector.prune_sessions()} stale socket(s)")
+        return
+
+    sessions = connector.sessions()
+    if not sessions:
+        print("No open sessions.")
+        return
+
+    now = time.time()
+    table = []
+    for session in sessions:
+        state = click.style('alive', fg='green') if session["alive"] else click.style('dead', fg='red')
+        age = int(now - session["opened"])
+        table.append([session["hostname"], session["user"], session["port"], state, f"{age}s"])
+    print(tabulate(table, ["Hostname", "User", "Port", "State", "Age"], tablefmt="simple",
+                   disable_numparse=True))
+
+def transfer_options(command):
+    """Options shared by push and pull"""
+    options = [
+        click.argument('names', nargs=-1),
+        click.argument('source_dir'),
+        click.argument('dest_dir'),
+        click.option('--filter', '-f', multiple=True, nargs=2, help='Select robots by any aspect'),
+        click.option('--workers', '-w', type=int, help='Maximum concurrent transfers'),
+        click.option('--bwlimit', type=int, help='Aggregate bandwidth budget in KB/s'),
+        click.option('--location-limit', '-l', multiple=True, nargs=2, type=(str, int),
+                     help='Maximum concurrent transfers for a location'),
+        click.option('--full', is_flag=True, help='Ignore the manifest cache and rsync everything'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+def select_targets(names, filter):
+    """Robot records for NAMES and/or --filter pairs, exiting on unknown names"""
+    if not names and not filter:
+        click.echo("Error: Provide robot names or --filter", err=True)
+        sys.exit(1)
+
+    robots = read_fleet(filter, 'name')
+    if names:
+        robots = [robot for robot in robots if robot['name'] in names]
+
+    missing = set(names) - {robot['name'] for robot in robots}
+    if missing and not filter:
+        click.echo(f"Error: Robot '{sorted(missing)[0]}' not found", err=True)
+        sys.exit(1)
+    if not robots:
+        print("No robots found.")
+    return robots
+
+def run_transfer(names, filter, source_dir, dest_dir, pull, workers, bwlimit, location_limit, full):
+    """Resolve the selected robots and transfer to or from them"""
+    robots = select_targets(names, filter)
+    if not robots:
+        return
+
+    # A single robot keeps rsync's own progress bar
+    if len(robots) == 1 and not (workers or bwlimit or location_limit):
+        transferred = connector.transfer(robots[0]['hostname'], source_dir, dest_dir, pull=pull,
+                                         name=robots[0]['name'], use_cache=not full)
+        audit.note(robots[0]['name'], status=0 if transferred else 1)
+        if not transferred:
+            sys.exit(1)
+        return
+
+    results = connector.transfer_many(
+        [(robot['name'], robot['hostname'], robot['location']) for robot in robots],
+        source_dir, dest_dir, pull=pull, workers=workers, bwlimit=bwlimit,
+        location_limits=dict(location_limit), use_cache=not full
+    )
+    for result in results:
+        audit.note(result.name, status=result.exit_code if result.exit_code is not None else 1,
+                   error=result.error.splitlines()[-1] if result.error else None)
+    failures = [result for result in results if not result.ok]
+    for result in failures:
+        error = result.error.splitlines()[-1] if result.error else f"exit code {result.exit_code}"
+        click.echo(f"{click.style('FAILED', fg='red')} {result.name} ({result.hostname}): {error}", err=True)
+    if failures:
+        sys.exit(1)
+
+@cli.command()
+@transfer_options
+@audited
+def push(names, source_dir, dest_dir, filter, workers, bwlimit, location_limit, full):
+    """Push files to one or more robots using rsync
+
+    Unchanged trees are detected locally from the manifest cache, so only
+    changed files are sent. Use --full to bypass it.
+    """
+    run_transfer(names, filter, source_dir, dest_dir, False, workers, bwlimit, location_limit, full)
+
+@cli.command()
+@transfer_options
+@audited
+def pull(names, source_dir, dest_dir, filter, workers, bwlimit, location_limit, full):
+    """Pull files from one or more robots using rsync
+
+    When pulling from several robots each one's files land in DEST_DIR/<robot name>.
+    """
+    run_transfer(names, filter, source_dir, dest_dir, True, workers, bwlimit, location_limit, full)
+
+def format_size(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024:
+            return f"{count:.1f}{unit}" if unit != 'B' else f"{count}B"
+        count /= 1024
+    return f"{count:.1f}TB"
+
+@cli.command()
+@click.argument('model')
+@click.option('--output', '-o', 'output_dir', help="Build output directory (default: the model's build definition)")
+@click.option('--command', '-c', 'build_command', help="Command that produces the output (default: the model's build definition)")
+@click.option('--skip-command', is_flag=True, help='Store the output as it is without running the build command')
+@click.option('--label', '-l', help='Release name (default: a UTC timestamp)')
+def build(model, output_dir, build_command, skip_command, label):
+    """Build a release for a robot model into the chunk store
+
+    Runs the model's build command, then splits its output into
+    content-defined chunks. Chunks already stored by any earlier build are
+    not stored again.
+    """
+    import subprocess
+    from robots.build import BuildError, ReleaseStore
+
+    definition = config.get('build-definitions', {}).get(model, {})
+    output_dir = output_dir or definition.get('output')
+    build_command = build_command or definition.get('command')
+    if not output_dir:
+        print(f"Error: No build definition for '{model}'; give --output")
+        sys.exit(1)
+
+    if build_command and not skip_command:
+        click.echo(f"Running '{build_command}'...", err=True)
+        if subprocess.run(build_command, shell=True).returncode != 0:
+            print(f"Error: Build command for '{model}' failed")
+            sys.exit(1)
+
+    store = ReleaseStore(config)
+    started = time.monotonic()
+    try:
+        manifest, stats = store.build(model, output_dir, label, store.latest(model))
+    except BuildError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Release {manifest['id']} ({manifest['model']}:{manifest['label']}): "
+          f"{stats['files']} files, {format_size(stats['bytes'])} in {stats['chunks']} chunks; "
+          f"{stats['new_chunks']} new chunks ({format_size(stats['new_bytes'])} stored), "
+          f"{stats['reused_files']} files unchanged, {time.monotonic() - started:.1f}s")
+
+@cli.command()
+@click.argument('model', required=False)
+def releases(model):
+    """List stored releases, optionally for one model"""
+    from tabulate import tabulate
+    from robots.build import ReleaseStore
+    from robots.build.store import release_summary
+
+    manifests = ReleaseStore(config).releases(model)
+    if not manifests:
+        print("No releases found.")
+        return
+    table = []
+    for summary in map(release_summary, manifests):
+        table.append([summary['id'], summary['model'], summary['label'], summary['created_at'][:19],
+                      summary['files'], format_size(summary['size']),
+                      summary['chunks'], format_size(summary['chunk_bytes'])])
+    print(tabulate(table, ["Release", "Model", "Label", "Created (UTC)", "Files", "Size", "Chunks", "Unique"],
+                   tablefmt="simple", disable_numparse=True))
+
+@cli.command()
+@click.option('--keep', '-k', type=int, help='Newest releases to keep per model (default: build-keep-releases)')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without removing it')
+def gc(keep, dry_run):
+    """Remove old releases and the chunks no remaining release uses
+
+    Releases recorded as deployed on any robot are always kept.
+    """
+    from robots.build import ReleaseStore
+    from robots.build.deploy import RELEASE_ASPECT
+    from robots.models import db, RobotAspect
+
+    keep = keep if keep is not None else config.get('build-keep-releases')
+    with get_app().app_context():
+        with handle_db_connection():
+            deployed = set(db.session.scalars(
+                db.select(RobotAspect.value).where(RobotAspect.name == RELEASE_ASPECT).distinct()))
+    stats = ReleaseStore(config).gc(keep, deployed, dry_run)
+    prefix = "Would remove" if dry_run else "Removed"
+    print(f"{prefix} {stats['releases']} releases and {stats['chunks']} chunks "
+          f"({format_size(stats['bytes'])}); {stats['kept_chunks']} chunks in use")
+
+@cli.command()
+@click.argument('release')
+@click.argument('names', nargs=-1)
+@click.option('--filter', '-f', multiple=True, nargs=2, help='Select robots by field or aspect, as in list')
+@click.option('--dest', '-d', help='Directory the release is assembled in on each robot (default: deploy-dest)')
+@click.option('--workers', '-w', type=int, help='Maximum number of concurrent transfers')
+@click.option('--full', is_flag=True, help="Send every chunk, ignoring what robots already have")
+@click.option('--any-model', is_flag=True, help='Deploy to robots of other models too')
+@click.option('--fan-out/--no-fan-out', default=None,
+              help='Push once per location and relay between robots there (default: deploy-fan-out)')
+@audited
+def deploy(release, names, filter, dest, workers, full, any_model, fan_out):
+    """Deploy a stored release to robots
+
+    RELEASE is a release id (or a unique prefix of one), MODEL:LABEL or
+    MODEL:latest. Each robot is sent only the chunks its current release lacks, and the
+    new tree is assembled on the robot next to the old one before being
+    swapped in.
+
+    With --fan-out the chunks cross the WAN once per location, to a seed
+    robot that relays them to its peers, which relay them on in turn.
+    """
+    from robots.build import BuildError, ReleaseStore
+    from robots.build.deploy import RELEASE_ASPECT, deploy as deploy_release
+    from robots.build.fanout import FanOut
+    from robots.db.bulk import import_fleet
+    from robots.models import db
+
+    store = ReleaseStore(config)
+    try:
+        manifest = store.load(release)
+    except BuildError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    robots = select_targets(names, filter)
+    if not robots:
+        return
+    if not any_model:
+        others = [robot['name'] for robot in robots if robot['model'] != manifest['model']]
+        if others:
+            print(f"Error: {len(others)} robots are not {manifest['model']} "
+                  f"(e.g. {', '.join(others[:3])}); use --any-model to deploy anyway")
             sys.exit(1)
-        
-        connector.transfer(robot.hostname, source_dir, dest_dir, pull=True)
+
+    dest = dest or config.get('deploy-dest', '/opt/payload')
+    fan_out = config.get('deploy-fan-out', False) if fan_out is None else fan_out
+    try:
+        results = deploy_release(connector, store, manifest, robots, dest,
+                                 config.get('deploy-staging-dir', '/tmp'), full, workers,
+                                 FanOut(connector, config) if fan_out else None)
+    except BuildError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    succeeded = [result for result in results if result.ok]
+    if succeeded:
+        with get_app().app_context():
+            with handle_db_connection():
+                import_fleet(db.session, [({'name': result.name, 'deployed': True},
+                                           {RELEASE_ASPECT: manifest['id']}) for result in succeeded],
+                             None, create=False)
+                db.session.commit()
+        expire_snapshot()
+
+    for result in results:
+        audit.note(result.name, field_diff({RELEASE_ASPECT: result.previous}, {RELEASE_ASPECT: manifest['id']})
+                   if result.ok else None, status=0 if result.ok else 1, error=result.error or None)
+        state = click.style('ok', fg='green') if result.ok else click.style('FAILED', fg='red')
+        sent = f"{result.chunks_sent} chunks, {format_size(result.bytes_sent)}"
+        detail = f" from {result.previous}" if result.previous else " (full)"
+        relay = f" via {result.relayed_from}" if result.relayed_from else ""
+        error = f": {result.error}" if result.error else ""
+        print(f"{state} {result.name}{detail}, {sent}{relay}{error}")
+    if fan_out:
+        print()
+        locations = {}
+        for result in results:
+            locations.setdefault(result.location or 'no location', []).append(result)
+        for location, members in sorted(locations.items()):
+            direct = [result for result in members if result.ok and not result.relayed_from]
+            print(f"{location}: {sum(result.ok for result in members)}/{len(members)} deployed, "
+                  f"{len(direct)} sent from here ({format_size(sum(result.bytes_sent for result in direct))})")
+    print(f"\nDeployed {manifest['id']} to {len(succeeded)}/{len(results)} robots")
+    if len(succeeded) < len(results):
+        sys.exit(1)
+
+@cli.command()
+@click.argument('release')
+@click.option('--server', '-s', help='API server to fetch from (default: fetch-server)')
+@click.option('--dest', '-d', help='Directory to assemble the release in (default: deploy-dest)')
+@click.option('--workers', '-w', type=int, help='Chunks downloaded at once (default: fetch-workers)')
+@click.option('--full', is_flag=True, help='Download every chunk, ignoring the installed release')
+@click.option('--report', 'report_as', metavar='NAME', help='Report the release to the server as robot NAME')
+def fetch(release, server, dest, workers, full, report_as):
+    """Fetch a release from the API server and install it here
+
+    The pull-based counterpart of deploy, run on the robot itself. RELEASE
+    is as for deploy; MODEL:latest suits a cron job. Only chunks the
+    installed release lacks are downloaded, each checked against its hash.
+    An interrupted fetch resumes where it stopped when run again.
+    """
+    from robots.build.assemble import AssemblyError
+    from robots.build.fetch import FetchError, ReleaseFetcher
+
+    fetcher = ReleaseFetcher(config, server, workers)
+    dest = dest or config.get('deploy-dest', '/opt/payload')
+    started = time.monotonic()
+    try:
+        manifest, stats = fetcher.fetch(release, dest, full)
+        if report_as:
+            fetcher.report(report_as, manifest)
+    except (FetchError, AssemblyError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if stats['current']:
+        print(f"Release {manifest['id']} ({manifest['model']}:{manifest['label']}) is already installed in {dest}")
+        return
+    resumed = f", {stats['resumed']} resumed" if stats['resumed'] else ""
+    print(f"Installed {manifest['id']} ({manifest['model']}:{manifest['label']}) in {dest}: "
+          f"downloaded {stats['downloaded']} of {stats['chunks']} chunks ({format_size(stats['bytes'])}{resumed}), "
+          f"{stats['reused']} reused, {time.monotonic() - started:.1f}s")
+
+@cli.command(name='import')
+@click.argument('source', type=click.File('r'), default='-')
+@click.option('--format', 'input_format', type=click.Choice(FORMATS),
+              help='Input format, guessed from the file extension if not given')
+@click.option('--dry-run', is_flag=True, help='Show what would change without writing anything')
+@click.option('--batch-size', type=int, help='Robots written per round of bulk statements')
+@audited
+def import_command(source, input_format, dry_run, batch_size):
+    """Create or update robots and their aspects from a JSON, JSONL, CSV or TSV file
+
+    Robots are matched by name. Fields and aspects in the file overwrite
+    the stored ones; anything the file leaves out is kept. The whole import
+    runs in one transaction, so a bad record leaves the database untouched.
+    """
+    from robots.db.bulk import BulkImportError, import_fleet
+    from robots.models import db
+
+    input_format = input_format or guess_format(source.name)
+    if not input_format:
+        click.echo("Error: Cannot tell the input format, pass --format", err=True)
+        sys.exit(1)
+
+    def show_change(name, changes, created):
+        if created:
+            click.echo(click.style(f"+ {name}", fg='green'))
+        else:
+            click.echo(click.style(f"~ {name}", fg='yellow'))
+        for field, (old, new) in changes.items():
+            click.echo(f"    {field}: {new}" if created else f"    {field}: {old} -> {new}")
+
+    changed = []
+
+    def note_change(name, changes, created):
+        changed.append((name, {field: [*change] for field, change in changes.items()}))
+
+    records = (split_record(record) for record in read_records(source, input_format))
+    with get_app().app_context():
+        with handle_db_connection():
+            try:
+                stats = import_fleet(
+                    db.session, records, None if dry_run else get_default_user(commit=False).id,
+                    batch_size=batch_size or config.get('import-batch-size', 1000),
+                    dry_run=dry_run, on_change=show_change if dry_run else note_change if audit.enabled else None
+                )
+            except (BulkImportError, FormatError) as e:
+                db.session.rollback()
+                click.echo(f"Error: {e}", err=True)
+                sys.exit(1)
+            if dry_run:
+                db.session.rollback()
+                click.echo(f"\nDry run: {stats}. Nothing was written.")
+                return
+            db.session.commit()
+    expire_snapshot()
+    for name, changes in changed:
+        audit.note(name, changes)
+    click.echo(f"Imported robots: {stats}")
+
+@cli.command()
+@click.argument('dest', type=click.File('w'), default='-')
+@click.option('--format', 'output_format', type=click.Choice(FORMATS),
+              help='Output format, guessed from the file extension (default json)')
+@click.option('--filter', '-f', multiple=True, nargs=2, help='Export only matching robots')
+@click.option('--batch-size', type=int, help='Rows fetched from the database at a time')
+def export(dest, output_format, filter, batch_size):
+    """Write robots and their aspects to a JSON, JSONL, CSV or TSV file
+
+    Robots are streamed from the database, so exports of any size run in
+    constant memory. The output can be read back with `robots import`.
+    """
+    from robots.db.bulk import aspect_names, export_fleet
+    from robots.models import db, Robot
+
+    output_format = output_format or guess_format(dest.name) or 'json'
+    with get_app().app_context():
+        with handle_db_connection():
+            robot_ids = select_robots(filter).with_entities(Robot.id).statement if filter else None
+            columns = aspect_names(db.session, robot_ids) if output_format in ('csv', 'tsv') else ()
+            writer = RecordWriter(dest, output_format, columns)
+            for record in export_fleet(db.session, robot_ids,
+                                       batch_size=batch_size or config.get('export-batch-size', 1000)):
+                writer.write(record)
+            writer.close()
+    if dest.name != '<stdout>':
+        click.echo(f"Exported {writer.count} robots to {dest.name}", err=True)
+
+@cli.command(name='audit')
+@click.option('--robot', '-r', help='Only events on this robot')
+@click.option('--user', '-u', help='Only events by this user')
+@click.option('--command', '-c', help='Only runs of this command')
+@click.option('--since', help='Start of the window: a duration ago (90s, 15m, 6h, 7d) or ISO time')
+@click.option('--until', help='End of the window, in the same forms as --since')
+@click.option('--limit', '-n', type=int, default=50, help='Most events to show (default 50)')
+@click.option('--format', 'output_format', type=click.Choice(['table', 'jsonl']), default='table',
+              help='Print events as a table or one JSON object per line')
+def audit_command(robot, user, command, since, until, limit, output_format):
+    """Show who did what to which robots, newest first
+
+    Events still waiting in the local spool are flushed first, so the
+    answer includes commands that have only just finished.
+    """
+    from tabulate import tabulate
+    from robots.models import db
+    from robots.telemetry import parse_time
+
+    try:
+        start = parse_time(since) if since else None
+        end = parse_time(until) if until else None
+    except ValueError as e:
+        click.echo(f"Error: Invalid time: {e}", err=True)
+        sys.exit(1)
+
+    with get_app().app_context():
+        with handle_db_connection():
+            audit.flush(db.session)
+            events = [event.to_dict() for event in audit.query(
+                db.session, robot=robot, user=user, command=command, since=start, until=end, limit=limit)]
+
+    if output_format == 'jsonl':
+        for event in events:
+            click.echo(json.dumps(event))
+        return
+    if not events:
+        print("No audit events found.")
+        return
+    print(tabulate(
+        [[event['occurred_at'][:19], event['user'], event['command'], event['robot'] or '-',
+          format_audit_changes(event['changes']) or event['error'] or '-',
+          event['exit_status'], f"{event['duration']:.2f}s"] for event in events],
+        ["Time (UTC)", "User", "Command", "Robot", "Changes", "Exit", "Duration"],
+        tablefmt="simple", missingval="-"
+    ))
+
+def format_audit_changes(changes):
+    return '\n'.join(f"{field}: {old} -> {new}" for field, (old, new) in (changes or {}).items())
 
 if __name__ == '__main__':
     cli() 
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Fleet file formats
+
+Reads and writes flat robot records (core fields plus one key per aspect,
+the shape of Robot.to_dict and robots.json) as JSON, JSONL, CSV or TSV.
+Readers and writers work one record at a time, so JSONL, CSV and TSV never
+hold a whole fleet in memory.
+"""
+
+import csv
+import json
+import os
+
+FORMATS = ('json', 'jsonl', 'csv', 'tsv')
+
+# Delimited formats, by delimiter
+_DELIMITERS = {'csv': ',', 'tsv': '\t'}
+
+# Robot fields carried in a record; every other key is an aspect
+CORE_FIELDS = ('name', 'model', 'hostname', 'status', 'deployed', 'location')
+
+# Bookkeeping columns that exports never write and imports ignore
+IGNORED_FIELDS = ('id', 'created_at', 'updated_at', 'user_id')
+
+_EXTENSIONS = {
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+    '.tsv': 'tsv',
+}
+
+
+class FormatError(ValueError):
+    """Raised for input that cannot be read as robot records"""
+
+
+def guess_format(path):
+    """Format for a file name, from its extension, or None"""
+    return _EXTENSIONS.get(os.path.splitext(path or '')[1].lower())
+
+
+def read_records(stream, fmt):
+    """Yield flat robot records from a JSON, JSONL, CSV or TSV stream
+
+    JSON may be a list of records or an object keyed by robot name, like
+    robots.json. Empty CSV and TSV cells are treated as absent.
+    """
+    if fmt == 'json':
+        try:
+            data = json.load(stream)
+        except ValueError as e:
+            raise FormatError(f"Invalid JSON: {e}")
+        if isinstance(data, dict):
+            for name, record in data.items():
+                if isinstance(record, dict):
+                    record = dict({'name': name}, **record)
+                yield _check_record(record, name)
+        elif isinstance(data, list):
+            for index, record in enumerate(data):
+                yield _check_record(record, f'item {index}')
+        else:
+            raise FormatError("JSON input must be a list of robots or an object keyed by name")
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise FormatError(f"Invalid JSON on line {line_no}: {e}")
+            yield _check_record(record, f'line {line_no}')
+    elif fmt in _DELIMITERS:
+        for line_no, row in enumerate(csv.DictReader(stream, delimiter=_DELIMITERS[fmt]), 2):
+            yield _check_record({key: value for key, value in row.items()
+                                 if key and value not in (None, '')}, f'line {line_no}')
+    else:
+        raise FormatError(f"Unknown format '{fmt}' (expected one of {', '.join(FORMATS)})")
+
+
+def split_record(record):
+    """Split a flat record into (core fields, aspects)
+
+    Core fields are normalized (deployed becomes a bool) and aspect values
+    become strings, as they are stored.
+    """
+    fields, aspects = {}, {}
+    for key, value in record.items():
+        if key in IGNORED_FIELDS:
+            continue
+        if key in CORE_FIELDS:
+            fields[key] = parse_deployed(value) if key == 'deployed' else value
+        elif value is not None:
+            aspects[key] = str(value)
+    return fields, aspects
+
+
+def flat_record(record, aspects=True):
+    """Flat record from a snapshot record, which keeps aspects in their own mapping
+
+    Args:
+        record: Snapshot record (see robots.cli.snapshot.robot_record)
+        aspects: Include the robot's aspects, not just its core fields
+    """
+    flat = {field: record[field] for field in CORE_FIELDS}
+    if aspects:
+        flat.update(record['aspects'])
+    return flat
+
+
+def parse_deployed(value):
+    """Read a deployed flag from JSON or CSV"""
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ('true', '1', 'yes'):
+        return True
+    if str(value).strip().lower() in ('false', '0', 'no'):
+        return False
+    raise FormatError(f"Invalid deployed value {value!r} (expected true or false)")
+
+
+class RecordWriter:
+    """Writes flat robot records to a stream one at a time
+
+    CSV and TSV need every column up front, so pass the aspect names (or
+    other extra keys) that will appear. Call close() to finish the document.
+    """
+
+    def __init__(self, stream, fmt, aspect_names=()):
+        if fmt not in FORMATS:
+            raise FormatError(f"Unknown format '{fmt}' (expected one of {', '.join(FORMATS)})")
+        self.stream = stream
+        self.fmt = fmt
+        self.count = 0
+        if fmt in _DELIMITERS:
+            self.csv = csv.DictWriter(stream, fieldnames=CORE_FIELDS + tuple(aspect_names),
+                                      delimiter=_DELIMITERS[fmt], lineterminator='\n')
+            self.csv.writeheader()
+        elif fmt == 'json':
+            stream.write('{')
+
+    def write(self, record):
+        if self.fmt == 'jsonl':
+            self.stream.write(json.dumps(record) + '\n')
+        elif self.fmt in _DELIMITERS:
+            row = dict(record)
+            if isinstance(row.get('deployed'), bool):
+                row['deployed'] = 'true' if row['deployed'] else 'false'
+            self.csv.writerow(row)
+        else:
+            separator = ',\n' if self.count else '\n'
+            self.stream.write(f'{separator}  {json.dumps(record["name"])}: {json.dumps(record)}')
+        self.count += 1
+
+    def close(self):
+        if self.fmt == 'json':
+            self.stream.write('\n}\n' if self.count else '}\n')
+        self.stream.flush()
+
+
+def _check_record(record, where):
+    if not isinstance(record, dict):
+        raise FormatError(f"Expected an object for {where}")
+    if not record.get('name'):
+        raise FormatError(f"Robot at {where} has no name")
+    return record
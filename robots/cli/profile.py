@@ -0,0 +1,151 @@
+"""
+Phase breakdown for `robots --profile`
+
+Reports where a command's time went: importing the CLI, loading the
+config, connecting to the database, each SQL statement, rendering the
+output and everything else. Code marks its phases with `phase(name)`,
+which costs nothing unless profiling is on. `--profile-dump FILE` also
+runs the command under cProfile and writes the stats to FILE for
+`python -m pstats` or snakeviz.
+"""
+
+import itertools
+import sys
+import time
+from contextlib import contextmanager
+
+# Imported first by commands.py, so this clock covers loading the CLI
+STARTED = time.perf_counter()
+
+# Phases timed before profiling was switched on, such as the config load
+_early = []
+
+# The Profile of the running command, when --profile is given
+current = None
+
+
+@contextmanager
+def phase(name):
+    """Time the block as phase `name` of the running command's profile
+
+    Time the block spends connecting or in SQL is left out: it is reported
+    under db connect and sql, so no time is counted twice.
+    """
+    if current is None:
+        yield
+        return
+    profile = current
+    started, database = time.perf_counter(), profile.database_time
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started - (profile.database_time - database))
+
+
+@contextmanager
+def early_phase(name):
+    """Time the block as a phase of loading the CLI, before any command runs"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _early.append((name, time.perf_counter() - started))
+
+
+class Profile:
+    """Phase and SQL timings of one command"""
+
+    def __init__(self, command, dump=None, statements=20):
+        """Start profiling a command
+
+        Args:
+            command: Command line being profiled, for the report
+            dump: File to write cProfile stats to, if any
+            statements: Most distinct SQL statements to list
+        """
+        self.command = command
+        self.started = time.perf_counter()
+        self.loaded = self.started - STARTED
+        self.phases = {}
+        self.statements = []
+        self.connects = []
+        self.database_time = 0.0
+        self.top = statements
+        self.dump = dump
+        self.profiler = None
+        self.remove_hooks = None
+
+    def start(self):
+        """Hook the database and, with a dump file, cProfile"""
+        global current
+        from robots.db.timing import watch_engine
+        started = time.perf_counter()
+        self.remove_hooks = watch_engine(on_statement=self.on_statement, on_connect=self.on_connect)
+        # Hooking loads SQLAlchemy, which commands that use the database load anyway
+        self.add('db imports', time.perf_counter() - started)
+        if self.dump:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        current = self
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def on_statement(self, statement, seconds):
+        self.statements.append((statement, seconds))
+        self.database_time += seconds
+
+    def on_connect(self, seconds):
+        self.connects.append(seconds)
+        self.database_time += seconds
+
+    def stop(self):
+        """Unhook everything, write the dump and print the report"""
+        global current
+        elapsed = time.perf_counter() - self.started
+        current = None
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.dump)
+        if self.remove_hooks:
+            self.remove_hooks()
+        self.report(elapsed)
+
+    def report(self, elapsed, file=None):
+        """Print the phase breakdown and the slowest statements to stderr"""
+        file = file or sys.stderr
+        early = dict(_early)
+        sql = sum(seconds for _, seconds in self.statements)
+        connect = sum(self.connects)
+        marked = sum(self.phases.values())
+        rows = [('import', self.loaded - sum(early.values()), '')]
+        rows.extend((name, seconds, '') for name, seconds in early.items())
+        rows.append(('db connect', connect, _plural(len(self.connects), 'connection')))
+        rows.append(('sql', sql, _plural(len(self.statements), 'statement')))
+        rows.extend((name, seconds, '') for name, seconds in self.phases.items())
+        rows.append(('other', max(elapsed - connect - sql - marked, 0.0), 'everything else'))
+        total = self.loaded + elapsed
+
+        print(f"\nProfile of `{self.command}`: {total * 1000:.1f}ms after interpreter start-up", file=file)
+        for name, seconds, note in rows:
+            print(f"  {name:<12}{seconds * 1000:>10.1f}ms {seconds / total * 100:>5.1f}%  {note}".rstrip(),
+                  file=file)
+        if self.statements:
+            # Repeats of one statement are grouped, so an N+1 shows up as one line run N times
+            grouped = {}
+            for statement, seconds in self.statements:
+                text = ' '.join(statement.split())
+                count, spent = grouped.get(text, (0, 0.0))
+                grouped[text] = (count + 1, spent + seconds)
+            print("\nSQL statements, in order of first run:", file=file)
+            for text, (count, spent) in itertools.islice(grouped.items(), self.top):
+                print(f"  {spent * 1000:>8.2f}ms {count:>5}x  {text[:110]}", file=file)
+            if len(grouped) > self.top:
+                print(f"  ... and {len(grouped) - self.top} more", file=file)
+        if self.dump:
+            print(f"\ncProfile stats written to {self.dump} (python -m pstats {self.dump})", file=file)
+
+
+def _plural(count, noun):
+    return f"{count} {noun}{'' if count == 1 else 's'}"
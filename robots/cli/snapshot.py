@@ -0,0 +1,198 @@
+"""
+Fleet snapshot
+
+An on-disk copy of the robots table and their aspects that the CLI reads
+from instead of the database. It is refreshed incrementally from the
+`updated_at` high-water mark, and still answers reads when the database
+cannot be reached.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from itertools import groupby
+
+SNAPSHOT_VERSION = 1
+
+
+def robot_record(robot):
+    """Snapshot record for a Robot with its aspects"""
+    return {
+        "id": robot.id,
+        "name": robot.name,
+        "model": robot.model,
+        "hostname": robot.hostname,
+        "status": robot.status,
+        "deployed": robot.deployed,
+        "location": robot.location,
+        "created_at": _isoformat(robot.created_at),
+        "updated_at": _isoformat(robot.updated_at),
+        "aspects": {aspect.name: aspect.value for aspect in robot.aspects}
+    }
+
+
+def stream_records(query, aspects=False, batch_size=1000):
+    """Yield a record like robot_record's for each robot a Robot query matches
+
+    The query runs as one statement, read from a server-side cursor
+    batch_size rows at a time, so memory stays flat and the statement
+    count is the same for any fleet size. With aspects, each robot's
+    aspects come from the same statement through an outer join; without,
+    no aspect rows are read and every record's aspects are empty.
+
+    Must run inside an app context.
+    """
+    from sqlalchemy.orm import aliased
+    from robots.models import Robot, RobotAspect
+
+    columns = [Robot.id, Robot.name, Robot.model, Robot.hostname, Robot.status, Robot.deployed,
+               Robot.location, Robot.created_at, Robot.updated_at]
+    if aspects:
+        aspect = aliased(RobotAspect)
+        query = query.outerjoin(aspect, aspect.robot_id == Robot.id)
+        columns += [aspect.name.label('aspect_name'), aspect.value.label('aspect_value')]
+    # Keeps each robot's aspect rows together; sorted queries already end with Robot.id
+    rows = query.with_entities(*columns).order_by(Robot.id).yield_per(batch_size)
+    for _, robot_rows in groupby(rows, key=lambda row: row.id):
+        first = next(robot_rows)
+        record = {
+            "id": first.id,
+            "name": first.name,
+            "model": first.model,
+            "hostname": first.hostname,
+            "status": first.status,
+            "deployed": first.deployed,
+            "location": first.location,
+            "created_at": _isoformat(first.created_at),
+            "updated_at": _isoformat(first.updated_at),
+            "aspects": {}
+        }
+        if aspects:
+            record["aspects"] = {row.aspect_name: row.aspect_value for row in (first, *robot_rows)
+                                 if row.aspect_name is not None}
+        yield record
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+class FleetSnapshot:
+    """JSON snapshot of the fleet, keyed by robot id"""
+
+    def __init__(self, config=None):
+        """Initialize FleetSnapshot with optional config
+
+        Args:
+            config: Configuration dictionary containing snapshot-* settings
+                and DATABASE_URL
+        """
+        config = config or {}
+        self.enabled = config.get('snapshot', True)
+        self.path = os.path.expanduser(config.get('snapshot-path', '~/.robots/snapshot.json'))
+        self.max_age = config.get('snapshot-max-age', 30)
+        # A snapshot only ever answers for the database it was taken from
+        self.database = hashlib.sha1(str(config.get('DATABASE_URL')).encode()).hexdigest()
+        self.refreshed_at = None
+        self.expired = False
+        self.high_water = None
+        self.robots = {}
+        self.loaded = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != SNAPSHOT_VERSION or data.get('database') != self.database:
+            return False
+        self.refreshed_at = data['refreshed_at']
+        self.expired = data.get('expired', False)
+        self.high_water = data['high_water']
+        self.robots = {int(robot_id): record for robot_id, record in data['robots'].items()}
+        return True
+
+    def save(self):
+        """Atomically write the snapshot to disk"""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                "version": SNAPSHOT_VERSION,
+                "database": self.database,
+                "refreshed_at": self.refreshed_at,
+                "expired": self.expired,
+                "high_water": self.high_water,
+                "robots": self.robots
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def is_fresh(self):
+        """True if the snapshot was refreshed within the staleness window"""
+        return self.loaded and not self.expired and time.time() - self.refreshed_at <= self.max_age
+
+    def expire(self):
+        """Force the next read to refresh, keeping the data for offline use"""
+        if self.loaded:
+            self.expired = True
+            self.save()
+
+    def stale_as_of(self):
+        """Human readable time of the last refresh"""
+        return datetime.fromtimestamp(self.refreshed_at).strftime('%Y-%m-%d %H:%M:%S')
+
+    def refresh(self):
+        """Bring the snapshot up to date with the database
+
+        Must run inside an app context. Only robots changed since the
+        high-water mark (directly or through an aspect) are fetched; a cheap
+        id scan drops robots that were deleted.
+
+        Raises:
+            sqlalchemy.exc.OperationalError: if the database is unreachable
+        """
+        from sqlalchemy import func, or_, select
+        from robots.models import db, Robot, RobotAspect
+
+        started_at = time.time()
+        high_water = max(
+            db.session.scalar(select(func.max(Robot.updated_at))) or datetime.min,
+            db.session.scalar(select(func.max(RobotAspect.updated_at))) or datetime.min
+        )
+
+        query = Robot.query_with_aspects()
+        if self.loaded and self.high_water:
+            # >= rather than > so rows written in the same tick as the last
+            # refresh are fetched again instead of missed
+            since = datetime.fromisoformat(self.high_water)
+            changed_aspects = select(RobotAspect.robot_id).where(RobotAspect.updated_at >= since)
+            query = query.filter(or_(Robot.updated_at >= since, Robot.id.in_(changed_aspects)))
+            live_ids = set(db.session.scalars(select(Robot.id)))
+            self.robots = {robot_id: record for robot_id, record in self.robots.items()
+                           if robot_id in live_ids}
+        else:
+            self.robots = {}
+
+        for robot in query:
+            self.robots[robot.id] = robot_record(robot)
+
+        self.high_water = high_water.isoformat() if high_water != datetime.min else None
+        self.refreshed_at = started_at
+        self.expired = False
+        self.loaded = True
+
+    def records(self):
+        """All robot records, ordered by id"""
+        return [self.robots[robot_id] for robot_id in sorted(self.robots)]
+
+    def find(self, name):
+        """Record for a robot name, or None"""
+        for record in self.robots.values():
+            if record['name'] == name:
+                return record
+        return None
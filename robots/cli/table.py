@@ -0,0 +1,101 @@
+"""
+Incremental plain-text tables
+
+Renders tables in tabulate's "simple" layout without holding every row.
+Column widths come from declared widths, or from the first rows written:
+rows are buffered until the sample is full, then the header and the sample
+are printed and every later row is printed as soon as it is written. Values
+wider than their column are cut short with an ellipsis, so columns stay
+aligned. Tables with no more rows than the sample look just like
+tabulate's.
+"""
+
+import sys
+
+import click
+
+_ELLIPSIS = '…'
+
+
+class StreamingTable:
+    """Prints a table row by row once its column widths are known"""
+
+    def __init__(self, headers, stream=None, widths=None, sample_size=100):
+        """Start a table
+
+        Args:
+            headers: Column headings
+            stream: Text stream to print to (default: stdout)
+            widths: Mapping of heading to a fixed column width
+            sample_size: Rows to measure columns without a declared width on
+        """
+        self.headers = [str(header) for header in headers]
+        self.stream = stream or sys.stdout
+        self.declared = {header: widths[header] for header in self.headers if header in (widths or {})}
+        self.sample_size = sample_size if len(self.declared) < len(self.headers) else 0
+        self.sample = []
+        self.widths = None
+        self.decimals = None
+        self.count = 0
+
+    def write(self, row):
+        """Add a row of values; styled (ANSI) values are measured without their styling"""
+        row = ['-' if value is None else str(value) for value in row]
+        self.count += 1
+        if self.widths is None:
+            self.sample.append(row)
+            if len(self.sample) < self.sample_size:
+                return
+            self._start()
+        else:
+            self._line(row)
+
+    def close(self):
+        """Print anything still buffered"""
+        if self.widths is None:
+            self._start()
+        self.stream.flush()
+
+    def _start(self):
+        """Fix the column widths and print the header and the sample"""
+        columns = [[click.unstyle(row[index]) for row in self.sample] for index in range(len(self.headers))]
+        # Columns of numbers are right-aligned on the decimal point, as tabulate does
+        self.decimals = [max(map(_fraction, values)) if values and all(map(_is_number, values)) else None
+                         for values in columns]
+        self.widths = [
+            self.declared.get(header)
+            or max([len(header) + 2, *(len(value) if decimals is None else len(value) - _fraction(value) + decimals
+                                       for value in values)])
+            for header, values, decimals in zip(self.headers, columns, self.decimals)
+        ]
+        self._line(self.headers, header=True)
+        self._line(['-' * width for width in self.widths], header=True)
+        for row in self.sample:
+            self._line(row)
+        self.sample = []
+
+    def _line(self, cells, header=False):
+        parts = []
+        for cell, width, decimals in zip(cells, self.widths, self.decimals):
+            if decimals is not None and not header:
+                cell += ' ' * (decimals - _fraction(click.unstyle(cell)))
+            shown = len(click.unstyle(cell))
+            if shown > width:
+                cell = click.unstyle(cell)[:max(width - 1, 0)] + _ELLIPSIS
+                shown = width
+            padding = ' ' * (width - shown)
+            parts.append(cell + padding if decimals is None else padding + cell)
+        self.stream.write('  '.join(parts).rstrip() + '\n')
+
+
+def _fraction(value):
+    """Width of a number's decimal point and the digits after it"""
+    return len(value) - value.index('.') if '.' in value else 0
+
+
+def _is_number(value):
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
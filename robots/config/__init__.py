@@ -0,0 +1,61 @@
+"""
+Fleet configuration
+
+Single loader for fleet-config.toml, shared by the CLI and the API app.
+"""
+
+import os
+import sys
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+# Searched in order; the first file that exists wins
+CONFIG_PATHS = (
+    'robots/config/fleet-config.toml',
+    'fleet-config.toml',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fleet-config.toml'),
+)
+
+_config = None
+
+
+def config_path():
+    """Path of the fleet-config.toml in use, or None
+
+    ROBOTS_CONFIG overrides the search.
+    """
+    override = os.environ.get('ROBOTS_CONFIG')
+    if override:
+        return override
+    for path in CONFIG_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_config(reload=False):
+    """Load fleet-config.toml once per process and return it as a dictionary
+
+    Missing or unreadable files produce a warning and an empty config, so
+    commands that need no settings still run.
+    """
+    global _config
+    if _config is not None and not reload:
+        return _config
+
+    _config = {}
+    path = config_path()
+    if path is None:
+        print("\033[91mWarning: fleet-config.toml not found, all settings will be default\033[0m")
+        return _config
+    try:
+        with open(path, 'rb') as f:
+            _config = tomllib.load(f)
+    except FileNotFoundError:
+        print("\033[91mWarning: fleet-config.toml not found, all settings will be default\033[0m")
+    except Exception as e:
+        print(f"\033[91mWarning: Error loading fleet-config.toml: {e}\033[0m")
+    return _config
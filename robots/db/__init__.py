@@ -2,31 +2,62 @@
 Database initialization
 """
 
-from flask import Flask
-from flask_migrate import Migrate
-from robots.models.base import db
-import sys
+import os
+import weakref
 
-def init_db(app: Flask):
+from robots.config import load_config
+
+# fleet-config.toml keys for SQLAlchemy's engine and connection pool options
+ENGINE_OPTIONS = {
+    'db-pool-size': 'pool_size',
+    'db-max-overflow': 'max_overflow',
+    'db-pool-timeout': 'pool_timeout',
+    'db-pool-recycle': 'pool_recycle',
+    'db-pool-pre-ping': 'pool_pre_ping',
+}
+
+# Engines of every app init_db has set up; a forked child (a `robots serve`
+# worker) must open its own connections rather than share the parent's
+# pooled ones, so one fork hook disposes the pools of all of them
+_engines = weakref.WeakSet()
+
+def _dispose_engines():
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_engines)
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the pool settings present in config"""
+    return {option: config[key] for key, option in ENGINE_OPTIONS.items() if key in config}
+
+def schema_ready(engine, metadata):
+    """Whether every table in metadata already exists, checked with one query"""
+    from sqlalchemy import inspect
+    return set(metadata.tables) <= set(inspect(engine).get_table_names())
+
+def init_db(app):
     """Initialize database with Flask app"""
-    # Load TOML config based on Python version
-    if sys.version_info >= (3, 11):
-        import tomllib
-        with open('fleet-config.toml', 'rb') as f:
-            config = tomllib.load(f)
-    else:
-        import tomli
-        with open('fleet-config.toml', 'rb') as f:
-            config = tomli.load(f)
+    # Flask extensions load here rather than at import so that importing
+    # robots.db.* helpers stays cheap for the CLI
+    from flask_migrate import Migrate
+    from robots.models.base import db
+
+    config = load_config()
 
     # Configure SQLAlchemy
     app.config['SQLALCHEMY_DATABASE_URI'] = config['DATABASE_URL']
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config['SQLALCHEMY_TRACK_MODIFICATIONS']
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config)
 
     # Initialize extensions
     db.init_app(app)
     Migrate(app, db)
 
-    # Create tables
     with app.app_context():
-        db.create_all()
+        engine = db.engine
+        _engines.add(engine)
+        # Create tables, unless this is a warm start and they all exist
+        if config.get('db-create-schema', True) and not schema_ready(engine, db.metadata):
+            db.create_all()
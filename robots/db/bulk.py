@@ -0,0 +1,334 @@
+"""
+Bulk fleet import and export
+
+Imports upsert robots and their aspects in batches. Each batch costs two
+SELECTs to load the robots and aspects it touches, then one executemany per
+kind of write. SQLAlchemy sends each executemany as multi-row INSERTs or a
+single prepared UPDATE. Nothing is committed here, so the caller can run a
+whole import in one transaction.
+
+Edits apply the same field and aspect changes to every robot in a
+selection as a few set-based UPDATE and INSERT ... SELECT statements per
+batch of ids.
+
+Both record what they write in the fleet change log (see
+robots.models.fleet_change), since Core statements bypass the session's
+own tracking.
+
+Exports stream robots joined to their aspects through a server-side cursor
+(yield_per), so memory stays flat however large the fleet is.
+"""
+
+from itertools import groupby, islice
+
+from sqlalchemy import and_, bindparam, exists, insert, literal, null, or_, select, update
+
+from robots.db.types import typed_values
+from robots.models.fleet_change import UPSERT, note_changes
+from robots.models.robot import Robot
+from robots.models.robot_aspect import RobotAspect
+
+# Robot columns an import may set, besides name
+UPSERT_COLUMNS = ('model', 'hostname', 'status', 'deployed', 'location')
+
+# Columns a new robot cannot be created without
+REQUIRED_COLUMNS = ('model', 'hostname')
+
+
+class BulkImportError(ValueError):
+    """Raised for input that cannot be imported; nothing should be committed"""
+
+
+class ImportStats:
+    """Counts of what an import created, changed and left alone"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.aspects_written = 0
+
+    def __str__(self):
+        skipped = f", {self.skipped} unknown skipped" if self.skipped else ""
+        return (f"{self.created} new, {self.updated} changed, {self.unchanged} unchanged{skipped} "
+                f"({self.aspects_written} aspect values written)")
+
+
+def import_fleet(session, records, user_id, batch_size=1000, dry_run=False, on_change=None,
+                 create=True):
+    """Upsert robots and aspects from (fields, aspects) pairs
+
+    Fields missing from a record keep their current value (or the column
+    default for new robots). Aspects in a record are inserted or updated;
+    aspects it does not mention are left alone.
+
+    Args:
+        session: SQLAlchemy session; the caller commits or rolls back
+        records: Iterable of (fields, aspects) dicts, fields including name
+        user_id: Owner for new robots
+        batch_size: Robots loaded and written per round of statements
+        dry_run: Compute the diff without writing anything
+        on_change: Called as on_change(name, changes, created) for every
+            robot that would change, where changes maps a field or aspect
+            name to (old, new)
+        create: Create robots that do not exist yet; when False they are
+            skipped and counted
+
+    Returns:
+        ImportStats
+
+    Raises:
+        BulkImportError: for duplicate names or new robots lacking a
+            required field
+    """
+    stats = ImportStats()
+    seen = set()
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return stats
+        for fields, _ in batch:
+            if fields['name'] in seen:
+                raise BulkImportError(f"Robot '{fields['name']}' appears more than once")
+            seen.add(fields['name'])
+        _import_batch(session, batch, user_id, dry_run, on_change, create, stats)
+
+
+def _import_batch(session, batch, user_id, dry_run, on_change, create, stats):
+    robots = Robot.__table__
+    aspects = RobotAspect.__table__
+
+    names = [fields['name'] for fields, _ in batch]
+    existing = {row.name: row for row in session.execute(
+        select(robots.c.id, robots.c.name, *[robots.c[column] for column in UPSERT_COLUMNS])
+        .where(robots.c.name.in_(names))
+    )}
+    current_aspects = {}
+    if existing:
+        for row in session.execute(
+            select(aspects.c.id, aspects.c.robot_id, aspects.c.name, aspects.c.value)
+            .where(aspects.c.robot_id.in_([row.id for row in existing.values()]))
+        ):
+            current_aspects[(row.robot_id, row.name)] = row
+
+    new_robots, robot_updates, aspect_inserts, aspect_updates = [], [], [], []
+    for fields, record_aspects in batch:
+        name = fields['name']
+        row = existing.get(name)
+        if row is None and not create:
+            stats.skipped += 1
+            continue
+        if row is None:
+            missing = [column for column in REQUIRED_COLUMNS if not fields.get(column)]
+            if missing:
+                raise BulkImportError(f"New robot '{name}' has no {' or '.join(missing)}")
+            values = {column: fields.get(column, _column_default(column)) for column in UPSERT_COLUMNS}
+            new_robots.append(dict(values, name=name, user_id=user_id))
+            changes = {column: (None, value) for column, value in values.items()}
+            changes.update({aspect: (None, value) for aspect, value in record_aspects.items()})
+            aspect_inserts.extend((name, aspect, value) for aspect, value in record_aspects.items())
+            stats.created += 1
+            stats.aspects_written += len(record_aspects)
+            if on_change:
+                on_change(name, changes, True)
+            continue
+
+        changes = {column: (row._mapping[column], fields[column]) for column in UPSERT_COLUMNS
+                   if column in fields and fields[column] != row._mapping[column]}
+        if changes:
+            values = {column: row._mapping[column] for column in UPSERT_COLUMNS}
+            values.update({column: new for column, (_, new) in changes.items()})
+            robot_updates.append(dict(values, b_id=row.id))
+        for aspect, value in record_aspects.items():
+            current = current_aspects.get((row.id, aspect))
+            if current is None:
+                aspect_inserts.append((name, aspect, value))
+            elif current.value != value:
+                aspect_updates.append(dict(_aspect_values(value), b_id=current.id))
+            else:
+                continue
+            changes[aspect] = (current.value if current else None, value)
+            stats.aspects_written += 1
+
+        if changes:
+            stats.updated += 1
+            if on_change:
+                on_change(name, changes, False)
+        else:
+            stats.unchanged += 1
+
+    if dry_run:
+        return
+
+    if new_robots:
+        session.execute(insert(robots), new_robots)
+        # The new ids are needed for their aspects; one more SELECT fetches them all
+        existing.update({row.name: row for row in session.execute(
+            select(robots.c.id, robots.c.name)
+            .where(robots.c.name.in_([robot['name'] for robot in new_robots]))
+        )})
+    if robot_updates:
+        session.execute(update(robots).where(robots.c.id == bindparam('b_id')), robot_updates)
+    if aspect_inserts:
+        session.execute(insert(aspects), [
+            dict(_aspect_values(value), robot_id=existing[name].id, name=aspect)
+            for name, aspect, value in aspect_inserts
+        ])
+    if aspect_updates:
+        session.execute(update(aspects).where(aspects.c.id == bindparam('b_id')), aspect_updates)
+
+    names = {row.id: name for name, row in existing.items()}
+    changed_aspects = {row.id: row for row in current_aspects.values()}
+    changes = [(existing[robot['name']].id, robot['name'], None, UPSERT) for robot in new_robots]
+    changes.extend((row['b_id'], names[row['b_id']], None, UPSERT) for row in robot_updates)
+    changes.extend((existing[name].id, name, aspect, UPSERT) for name, aspect, _ in aspect_inserts)
+    for row in aspect_updates:
+        aspect = changed_aspects[row['b_id']]
+        changes.append((aspect.robot_id, names[aspect.robot_id], aspect.name, UPSERT))
+    note_changes(session, changes)
+
+
+def _aspect_values(value):
+    """Column values for an aspect row, typed copies included
+
+    Core inserts and updates skip RobotAspect's validator, so the typed
+    columns are filled here the same way.
+    """
+    return dict(typed_values(value), value=value)
+
+
+def _column_default(column):
+    default = Robot.__table__.c[column].default
+    return default.arg if default is not None and not callable(default.arg) else None
+
+
+class EditStats:
+    """Counts of what a bulk edit matched and changed"""
+
+    def __init__(self):
+        self.matched = 0
+        self.robots_updated = 0
+        self.aspects_updated = 0
+        self.aspects_added = 0
+
+    def __str__(self):
+        return (f"{self.matched} matched, {self.robots_updated} robots updated, "
+                f"{self.aspects_updated} aspects updated, {self.aspects_added} aspects added")
+
+
+def edit_fleet(session, robot_ids, fields, aspects, batch_size=1000):
+    """Apply the same field and aspect values to a selection of robots
+
+    The selection is resolved to ids first, so edits that change the
+    filtered columns still reach every robot that matched. Rows that already
+    hold the new value are left alone and not counted.
+
+    Args:
+        session: SQLAlchemy session; the caller commits or rolls back
+        robot_ids: Select of the ids of the robots to edit
+        fields: Mapping of Robot column to new value
+        aspects: Mapping of aspect name to new value, set or added
+        batch_size: Ids per round of statements
+
+    Returns:
+        EditStats
+    """
+    robots = Robot.__table__
+    stats = EditStats()
+    ids = [robot_id for robot_id in session.scalars(robot_ids)]
+    stats.matched = len(ids)
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        if fields:
+            changed = or_(*[_differs(robots.c[column], value) for column, value in fields.items()])
+            updated = session.scalars(
+                update(robots).where(robots.c.id.in_(batch), changed).values(**fields)
+                .returning(robots.c.id)
+            ).all()
+            stats.robots_updated += len(updated)
+            note_changes(session, [(robot_id, None, None, UPSERT) for robot_id in updated])
+        for name, value in aspects.items():
+            updated, added = _set_aspect(session, batch, name, value)
+            stats.aspects_updated += len(updated)
+            stats.aspects_added += len(added)
+            note_changes(session, [(robot_id, None, name, UPSERT) for robot_id in updated + added])
+    return stats
+
+
+def _set_aspect(session, robot_ids, name, value):
+    """Set an aspect on robots, adding it where missing
+
+    Returns:
+        (ids of robots whose aspect changed, ids of robots it was added to)
+    """
+    robots = Robot.__table__
+    aspects = RobotAspect.__table__
+    values = _aspect_values(value)
+
+    updated = session.scalars(
+        update(aspects)
+        .where(aspects.c.robot_id.in_(robot_ids), aspects.c.name == name,
+               _differs(aspects.c.value, value))
+        .values(**values)
+        .returning(aspects.c.robot_id)
+    ).all()
+
+    has_aspect = exists().where(and_(aspects.c.robot_id == robots.c.id, aspects.c.name == name))
+    columns = ['robot_id', 'name'] + [column for column in values]
+    added = session.scalars(
+        insert(aspects).from_select(columns, select(
+            robots.c.id,
+            literal(name, aspects.c.name.type),
+            *[null() if values[column] is None else literal(values[column], aspects.c[column].type)
+              for column in values]
+        ).where(robots.c.id.in_(robot_ids), ~has_aspect))
+        .returning(aspects.c.robot_id)
+    ).all()
+    return updated, added
+
+
+def _differs(column, value):
+    if value is None:
+        return column.is_not(None)
+    return or_(column != value, column.is_(None))
+
+
+def aspect_names(session, robot_ids=None):
+    """Distinct aspect names, sorted, optionally limited to a subquery of robot ids"""
+    query = select(RobotAspect.name).distinct().order_by(RobotAspect.name)
+    if robot_ids is not None:
+        query = query.where(RobotAspect.robot_id.in_(robot_ids))
+    return [name for name in session.scalars(query)]
+
+
+def export_fleet(session, robot_ids=None, batch_size=1000):
+    """Yield flat robot records (core fields plus aspects), ordered by id
+
+    Args:
+        session: SQLAlchemy session
+        robot_ids: Optional select of robot ids to limit the export to
+        batch_size: Rows fetched from the server-side cursor at a time
+    """
+    robots = Robot.__table__
+    aspects = RobotAspect.__table__
+    query = (
+        select(robots.c.id, robots.c.name, *[robots.c[column] for column in UPSERT_COLUMNS],
+               aspects.c.name.label('aspect_name'), aspects.c.value.label('aspect_value'))
+        .select_from(robots.outerjoin(aspects, aspects.c.robot_id == robots.c.id))
+        .order_by(robots.c.id, aspects.c.name)
+    )
+    if robot_ids is not None:
+        query = query.where(robots.c.id.in_(robot_ids))
+
+    rows = session.execute(query.execution_options(yield_per=batch_size))
+    for _, robot_rows in groupby(rows, key=lambda row: row.id):
+        first = next(robot_rows)
+        record = {'name': first.name}
+        record.update({column: first._mapping[column] for column in UPSERT_COLUMNS})
+        for row in [first, *robot_rows]:
+            if row.aspect_name is not None:
+                record[row.aspect_name] = row.aspect_value
+        yield record
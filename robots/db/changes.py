@@ -0,0 +1,165 @@
+"""
+Fleet change feed
+
+Reads the change log kept by robots.models.fleet_change in sequence order,
+so a client holding the last seq it saw can fetch exactly what changed
+since. A page never ends part way through a transaction's changes, which
+keeps the seq a client resumes from unambiguous. Upserts carry the
+robot's or aspect's current values; deletes are tombstones.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+
+from robots.db.bulk import UPSERT_COLUMNS
+from robots.models.fleet_change import DELETE, FleetChange, FleetChangeCounter
+from robots.models.robot import Robot
+from robots.models.robot_aspect import RobotAspect
+
+
+class CursorExpired(Exception):
+    """Raised when the changes after a cursor have been pruned"""
+
+    def __init__(self, since, pruned_seq):
+        super().__init__(f"Changes after {since} have been pruned (up to {pruned_seq}); "
+                         f"resync and continue from the current seq")
+        self.pruned_seq = pruned_seq
+
+
+class ChangeFeed:
+    """Change log queries, long-polling and pruning"""
+
+    def __init__(self, config=None):
+        """Initialize ChangeFeed with optional config
+
+        Args:
+            config: Configuration dictionary containing changes-* settings
+        """
+        config = config or {}
+        self.page_size = config.get('changes-page-size', 1000)
+        self.max_wait = config.get('changes-max-wait', 30)
+        self.poll_interval = config.get('changes-poll-interval', 0.5)
+        self.retention = config.get('changes-retention', 7 * 86400)
+
+    def latest(self, session):
+        """(last seq handed out, last seq pruned)"""
+        row = session.execute(select(FleetChangeCounter.seq, FleetChangeCounter.pruned_seq)
+                              .where(FleetChangeCounter.id == 1)).first()
+        return (row.seq, row.pruned_seq) if row else (0, 0)
+
+    def changes(self, session, since, limit=None):
+        """Changes with a seq after since
+
+        Args:
+            session: SQLAlchemy session
+            since: Last seq the client has seen, or 0 for every change
+                still retained
+            limit: Most changes to return, though a single transaction's
+                changes are never split; defaults to changes-page-size
+
+        Returns:
+            (list of change dicts, seq to pass as since next, more waiting)
+
+        Raises:
+            CursorExpired: if changes after a nonzero since were pruned
+        """
+        limit = limit or self.page_size
+        _, pruned_seq = self.latest(session)
+        if since == 0:
+            # A client starting from scratch gets the retained tail
+            since = pruned_seq
+        elif since < pruned_seq:
+            raise CursorExpired(since, pruned_seq)
+
+        rows = session.execute(
+            select(FleetChange).where(FleetChange.seq > since)
+            .order_by(FleetChange.seq, FleetChange.id).limit(limit + 1)
+        ).scalars().all()
+        more = len(rows) > limit
+        if more:
+            last_seq = rows[limit - 1].seq
+            if rows[limit].seq != last_seq:
+                rows = rows[:limit]
+            elif rows[0].seq != last_seq:
+                rows = [row for row in rows[:limit] if row.seq != last_seq]
+            else:
+                # One transaction bigger than a page goes out whole
+                rows = session.execute(
+                    select(FleetChange).where(FleetChange.seq == last_seq).order_by(FleetChange.id)
+                ).scalars().all()
+                more = session.execute(
+                    select(FleetChange.id).where(FleetChange.seq > last_seq).limit(1)
+                ).first() is not None
+
+        cursor = rows[-1].seq if rows else since
+        return self._with_values(session, rows), cursor, more
+
+    def wait(self, session, since, timeout):
+        """Block until there are changes after since or timeout seconds pass
+
+        The session's transaction is ended between checks so each one sees
+        newly committed changes and no connection is held while sleeping.
+
+        Returns:
+            True if changes are waiting
+        """
+        deadline = time.monotonic() + min(timeout, self.max_wait)
+        while True:
+            seq, _ = self.latest(session)
+            session.rollback()
+            if seq > since:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+
+    def prune(self, session, now=None):
+        """Delete changes older than changes-retention; returns rows deleted
+
+        Whole transactions are pruned, and the counter remembers the last
+        pruned seq so clients behind it are told to resync.
+        """
+        cutoff = (now or datetime.utcnow()) - timedelta(seconds=self.retention)
+        last = session.execute(select(func.max(FleetChange.seq))
+                               .where(FleetChange.changed_at < cutoff)).scalar()
+        if last is None:
+            return 0
+        deleted = session.execute(delete(FleetChange).where(FleetChange.seq <= last)).rowcount
+        session.execute(update(FleetChangeCounter)
+                        .where(FleetChangeCounter.id == 1, FleetChangeCounter.pruned_seq < last)
+                        .values(pruned_seq=last))
+        return deleted
+
+    def _with_values(self, session, rows):
+        robot_ids = {row.robot_id for row in rows if row.op != DELETE}
+        robots, aspects = {}, {}
+        if robot_ids:
+            ids = list(robot_ids)
+            robots = {row.id: row for row in session.execute(
+                select(Robot.id, *[getattr(Robot, field) for field in UPSERT_COLUMNS])
+                .where(Robot.id.in_(ids))
+            )}
+            names = list({row.aspect for row in rows if row.aspect is not None and row.op != DELETE})
+            if names:
+                aspects = {(row.robot_id, row.name): row.value for row in session.execute(
+                    select(RobotAspect.robot_id, RobotAspect.name, RobotAspect.value)
+                    .where(RobotAspect.robot_id.in_(ids), RobotAspect.name.in_(names))
+                )}
+
+        changes = []
+        for row in rows:
+            change = {'seq': row.seq, 'op': row.op, 'robot': row.robot_name, 'aspect': row.aspect,
+                      'changed_at': row.changed_at.isoformat()}
+            if row.op != DELETE:
+                if row.aspect is None:
+                    robot = robots.get(row.robot_id)
+                    change['fields'] = {field: robot._mapping[field] for field in UPSERT_COLUMNS} \
+                        if robot else None
+                else:
+                    change['value'] = aspects.get((row.robot_id, row.aspect))
+            changes.append(change)
+        return changes
+
@@ -0,0 +1,116 @@
+"""
+Robot filter and sort compiler
+
+Turns `--filter NAME VALUE` pairs and a `--sort` key into a single Robot
+query. Core columns are compared directly; every aspect predicate becomes its
+own `robots.id IN (SELECT robot_id ...)` semi-join on robot_aspects, answered
+from the (name, value, robot_id) index, so any number of aspect filters can be
+combined with an aspect sort without the joins colliding.
+
+The filter syntax and typing rules live in robots/db/predicates.py, which
+evaluates the same predicates against snapshot records.
+"""
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import aliased
+
+from robots.db.predicates import (
+    COLUMN_TYPES, FilterError, TYPED_COLUMNS, parse_filter, parse_sort, validate_aspect_types
+)
+from robots.models.robot import Robot
+from robots.models.robot_aspect import RobotAspect
+
+
+def predicate_clause(predicate, aspect_types=None):
+    """SQL expression selecting robots that satisfy a predicate
+
+    Args:
+        predicate: Predicate from parse_filter
+        aspect_types: Mapping of aspect name to declared type
+    """
+    value = predicate.operand(aspect_types)
+    if predicate.is_column:
+        return _compare(getattr(Robot, predicate.name), predicate.op, value)
+
+    value_type = predicate.value_type(aspect_types)
+    column = getattr(RobotAspect, TYPED_COLUMNS.get(value_type, 'value'))
+    if predicate.op == '!=':
+        # "not X" includes robots that never had the aspect
+        return Robot.id.not_in(_aspect_robots(predicate.name, column == value))
+    return Robot.id.in_(_aspect_robots(predicate.name, _compare(column, predicate.op, value)))
+
+
+def apply_filters(query, filters, aspect_types=None):
+    """Apply `--filter` pairs to a Robot query"""
+    for name, raw in filters or ():
+        query = query.filter(predicate_clause(parse_filter(name, raw), aspect_types))
+    return query
+
+
+def sort_key(query, sort, aspect_types=None):
+    """Expression a `--sort` key orders by, joining the aspect if needed
+
+    Returns:
+        (query, key, descending); without a sort the key is Robot.id
+    """
+    if not sort:
+        return query, Robot.id, False
+    name, descending, value_type = parse_sort(sort, aspect_types)
+
+    if name in COLUMN_TYPES:
+        return query, getattr(Robot, name), descending
+
+    # One aspect per (robot, name), so the outer join never duplicates robots
+    sort_aspect = aliased(RobotAspect)
+    query = query.outerjoin(sort_aspect, and_(
+        sort_aspect.robot_id == Robot.id,
+        sort_aspect.name == name
+    ))
+    return query, getattr(sort_aspect, TYPED_COLUMNS.get(value_type, 'value')), descending
+
+
+def order_by_key(query, key, descending):
+    """Order by key with missing values last, then Robot.id so the order is stable"""
+    return query.order_by(key.is_(None), key.desc() if descending else key, Robot.id)
+
+
+def apply_sort(query, sort, aspect_types=None):
+    """Order a Robot query by a column or aspect
+
+    A leading "-" sorts descending. Robots without a sorted aspect are kept
+    and listed last. Robot.id breaks ties so the order is stable.
+    """
+    if not sort:
+        return query
+    return order_by_key(*sort_key(query, sort, aspect_types))
+
+
+def compile_query(query, filters=(), sort=None, aspect_types=None):
+    """Apply filters and sort to a Robot query in one step"""
+    aspect_types = validate_aspect_types(aspect_types)
+    return apply_sort(apply_filters(query, filters, aspect_types), sort, aspect_types)
+
+
+def _aspect_robots(name, condition):
+    """Ids of robots having an aspect that satisfies condition"""
+    return select(RobotAspect.robot_id).where(RobotAspect.name == name, condition)
+
+
+def _compare(column, op, value):
+    if op == '=':
+        return column == value
+    if op == '!=':
+        return or_(column != value, column.is_(None))
+    if op == 'in':
+        return column.in_(value)
+    if op == 'prefix':
+        return column.startswith(value, autoescape=True)
+    if op == '<':
+        return column < value
+    if op == '<=':
+        return column <= value
+    if op == '>':
+        return column > value
+    if op == '>=':
+        return column >= value
+    raise FilterError(f"Unsupported operator '{op}'")
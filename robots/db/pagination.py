@@ -0,0 +1,77 @@
+"""
+Keyset pagination for robot queries
+
+Pages continue from the last row's sort key and id rather than skipping
+OFFSET rows, so every page costs the same however deep it is, and robots
+added or removed between requests do not shift the pages. Ordering matches
+apply_sort: sorted values first, robots missing the value last, Robot.id
+breaking ties.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from robots.db.filters import apply_filters, order_by_key, sort_key
+from robots.db.predicates import FilterError, validate_aspect_types
+from robots.models.robot import Robot
+
+
+def encode_cursor(value, robot_id):
+    """Opaque cursor for the row with this sort value and id"""
+    if isinstance(value, datetime):
+        payload = {'t': value.isoformat(), 'id': robot_id}
+    else:
+        payload = {'v': value, 'id': robot_id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(sort value, robot id) from encode_cursor
+
+    Raises:
+        FilterError: if the cursor was not made by encode_cursor
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if 't' in payload:
+            return datetime.fromisoformat(payload['t']), int(payload['id'])
+        return payload['v'], int(payload['id'])
+    except (ValueError, KeyError, TypeError):
+        raise FilterError(f"Invalid cursor '{cursor}'")
+
+
+def keyset_query(query, filters=(), sort=None, aspect_types=None, after=None):
+    """Filtered, sorted Robot query that starts after a cursor position
+
+    Args:
+        query: Base Robot query
+        filters: `--filter` pairs
+        sort: `--sort` key
+        aspect_types: Mapping of aspect name to declared type
+        after: (sort value, robot id) of the last row already returned
+
+    Returns:
+        Query yielding (Robot, sort value) rows
+    """
+    aspect_types = validate_aspect_types(aspect_types)
+    query = apply_filters(query, filters, aspect_types)
+    query, key, descending = sort_key(query, sort, aspect_types)
+    if after is not None:
+        query = query.filter(_after(key, descending, *after))
+    return order_by_key(query.add_columns(key.label('sort_value')), key, descending)
+
+
+def _after(key, descending, value, robot_id):
+    """Rows that come after (value, robot_id) in order_by_key order"""
+    if value is None:
+        # Already among the robots missing the value, which only go by id
+        return and_(key.is_(None), Robot.id > robot_id)
+    beyond = key < value if descending else key > value
+    return or_(
+        key.is_(None),
+        beyond,
+        and_(key == value, Robot.id > robot_id)
+    )
@@ -0,0 +1,218 @@
+"""
+Robot filter predicates
+
+Parses `--filter NAME VALUE` pairs and evaluates them, with `--sort`, against
+snapshot records in plain Python. robots/db/filters.py compiles the same
+predicates to SQL. This module has no SQLAlchemy dependency so the CLI can
+answer reads from the snapshot without loading the database stack.
+
+Filter values understand a few operators:
+
+    value       equal
+    !value      not equal (for aspects: robots without that value, including
+                robots that lack the aspect entirely)
+    value*      starts with
+    a,b,c       any of
+    <v, <=v     less than (or equal)
+    >v, >=v     greater than (or equal)
+    =value      equal, taking the rest literally (for values that start with
+                "!", "<" or ">", contain "," or end in "*")
+
+Aspects declared in fleet-config.toml `aspect-types` (int, float, bool,
+timestamp) compare and sort on their typed value, so `battery-level <20`
+and `--sort battery-level` are numeric. Range filters on undeclared aspects
+are typed by their literal: numbers compare numerically, ISO timestamps as
+times, anything else as text.
+"""
+
+from robots.db.types import ASPECT_TYPES, parse_typed
+
+RANGE_OPERATORS = ('<=', '>=', '<', '>')
+
+# Robot columns that filters and sorts address directly, with their types
+COLUMN_TYPES = {
+    'id': 'int',
+    'name': 'string',
+    'model': 'string',
+    'hostname': 'string',
+    'status': 'string',
+    'deployed': 'bool',
+    'location': 'string',
+    'created_at': 'timestamp',
+    'updated_at': 'timestamp',
+}
+
+# Typed storage column on RobotAspect for each declared type
+TYPED_COLUMNS = {
+    'int': 'value_int',
+    'float': 'value_float',
+    'bool': 'value_bool',
+    'timestamp': 'value_time',
+}
+
+
+class FilterError(ValueError):
+    """Raised for a filter or sort the compiler cannot express"""
+
+
+class Predicate:
+    """A single parsed filter: name, operator and value"""
+
+    def __init__(self, name, op, value):
+        self.name = name
+        self.op = op
+        self.value = value
+
+    def __repr__(self):
+        return f'<Predicate {self.name} {self.op} {self.value!r}>'
+
+    @property
+    def is_column(self):
+        return self.name in COLUMN_TYPES
+
+    def value_type(self, aspect_types=None):
+        """Type the comparison runs in, or None to compare as text"""
+        if self.op == 'prefix':
+            return None
+        if self.is_column:
+            return COLUMN_TYPES[self.name]
+        value_type = (aspect_types or {}).get(self.name)
+        if not value_type and self.op in RANGE_OPERATORS:
+            value_type = _infer_type(self.value)
+        return value_type if value_type in TYPED_COLUMNS else None
+
+    def operand(self, aspect_types=None):
+        """The filter value converted to value_type()"""
+        value_type = self.value_type(aspect_types)
+        if not value_type or value_type == 'string':
+            return self.value
+        try:
+            if isinstance(self.value, list):
+                return [parse_typed(value, value_type) for value in self.value]
+            return parse_typed(self.value, value_type)
+        except ValueError:
+            raise FilterError(f"Invalid {value_type} value {self.value!r} for '{self.name}'")
+
+    def matches(self, record, aspect_types=None):
+        """Evaluate this predicate against a snapshot record"""
+        value = self.operand(aspect_types)
+        if self.is_column:
+            return compare_values(record_value(record, self.name), self.op, value)
+
+        actual = record_value(record, self.name, self.value_type(aspect_types))
+        if self.op == '!=':
+            # "not X" includes robots that never had the aspect
+            return actual != value
+        return actual is not None and compare_values(actual, self.op, value)
+
+
+def parse_filter(name, raw):
+    """Parse a `--filter NAME VALUE` pair into a Predicate"""
+    if not name:
+        raise FilterError("Filter name cannot be empty")
+    if raw.startswith('='):
+        return Predicate(name, '=', raw[1:])
+    if raw.startswith('!') and len(raw) > 1:
+        return Predicate(name, '!=', raw[1:])
+    for op in RANGE_OPERATORS:
+        if raw.startswith(op) and len(raw) > len(op):
+            return Predicate(name, op, raw[len(op):].strip())
+    if ',' in raw:
+        return Predicate(name, 'in', [value.strip() for value in raw.split(',')])
+    if raw.endswith('*') and len(raw) > 1:
+        return Predicate(name, 'prefix', raw[:-1])
+    return Predicate(name, '=', raw)
+
+
+def parse_sort(sort, aspect_types=None):
+    """Split a `--sort` key into (name, descending, value_type)"""
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name in COLUMN_TYPES:
+        return name, descending, COLUMN_TYPES[name]
+    value_type = (aspect_types or {}).get(name)
+    return name, descending, value_type if value_type in TYPED_COLUMNS else None
+
+
+def validate_aspect_types(aspect_types):
+    """Check an `aspect-types` mapping, returning it unchanged"""
+    for name, value_type in (aspect_types or {}).items():
+        if value_type not in ASPECT_TYPES:
+            raise FilterError(f"Aspect '{name}' has unknown type '{value_type}' "
+                              f"(expected one of {', '.join(ASPECT_TYPES)})")
+    return aspect_types or {}
+
+
+def filter_records(records, filters=(), sort=None, aspect_types=None):
+    """Apply filters and sort to snapshot records in Python
+
+    Gives the same robots, in the same order, as compile_query does in SQL.
+    """
+    aspect_types = validate_aspect_types(aspect_types)
+    predicates = [parse_filter(name, raw) for name, raw in filters or ()]
+    records = [record for record in records
+               if all(predicate.matches(record, aspect_types) for predicate in predicates)]
+    records.sort(key=lambda record: record['id'])
+    if not sort:
+        return records
+
+    name, descending, value_type = parse_sort(sort, aspect_types)
+    key = lambda record: record_value(record, name, value_type)
+    present = [record for record in records if key(record) is not None]
+    missing = [record for record in records if key(record) is None]
+    # sort() is stable, so ties keep id order; missing values always go last
+    present.sort(key=key, reverse=descending)
+    return present + missing
+
+
+def record_value(record, name, value_type=None):
+    """A column or aspect value from a snapshot record, typed when requested
+
+    Aspect values that do not parse as their type count as missing, like a
+    NULL typed column in the database.
+    """
+    if name in COLUMN_TYPES:
+        value = record.get(name)
+        if value is not None and COLUMN_TYPES[name] == 'timestamp':
+            return parse_typed(value, 'timestamp')
+        return value
+    value = record['aspects'].get(name)
+    if value is None or not value_type or value_type == 'string':
+        return value
+    try:
+        return parse_typed(value, value_type)
+    except ValueError:
+        return None
+
+
+def compare_values(actual, op, value):
+    """Apply a filter operator in Python"""
+    if op == '=':
+        return actual == value
+    if op == '!=':
+        return actual != value
+    if op == 'in':
+        return actual in value
+    if actual is None:
+        return False
+    if op == 'prefix':
+        return str(actual).startswith(value)
+    if op == '<':
+        return actual < value
+    if op == '<=':
+        return actual <= value
+    if op == '>':
+        return actual > value
+    if op == '>=':
+        return actual >= value
+    raise FilterError(f"Unsupported operator '{op}'")
+
+
+def _infer_type(value):
+    for value_type in ('float', 'timestamp'):
+        try:
+            parse_typed(value, value_type)
+            return value_type
+        except ValueError:
+            pass
+    return None
@@ -0,0 +1,63 @@
+"""
+SQL statement and connection timing
+
+Hooks SQLAlchemy's engine and pool events so callers can see how long each
+statement and each new database connection took. `robots --profile` and the
+API metrics both build on this.
+"""
+
+import time
+
+
+def watch_engine(engine=None, on_statement=None, on_connect=None):
+    """Call back with the duration of every statement and new connection
+
+    Args:
+        engine: Engine to watch (default: every engine in the process)
+        on_statement: Called with (statement, seconds) after each statement
+        on_connect: Called with (seconds) after each new DBAPI connection
+
+    Returns:
+        A function that removes the hooks again
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.pool import Pool
+
+    listeners = []
+
+    def listen(target, name, fn):
+        event.listen(target, name, fn)
+        listeners.append((target, name, fn))
+
+    if on_statement:
+        # Start times live on each statement's execution context, so one that
+        # raises (and never reaches after_cursor_execute) leaves nothing behind
+        def before_execute(conn, cursor, statement, parameters, context, executemany):
+            if context is not None:
+                context.robots_started = time.perf_counter()
+
+        def after_execute(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, 'robots_started', None)
+            if started is not None:
+                on_statement(statement, time.perf_counter() - started)
+
+        listen(engine or Engine, 'before_cursor_execute', before_execute)
+        listen(engine or Engine, 'after_cursor_execute', after_execute)
+
+    if on_connect:
+        def before_connect(dialect, record, cargs, cparams):
+            record.info['robots_connect_started'] = time.perf_counter()
+
+        def after_connect(dbapi_connection, record):
+            started = record.info.pop('robots_connect_started', None)
+            if started is not None:
+                on_connect(time.perf_counter() - started)
+
+        listen(engine or Engine, 'do_connect', before_connect)
+        listen(engine.pool if engine else Pool, 'connect', after_connect)
+
+    def remove():
+        for target, name, fn in listeners:
+            event.remove(target, name, fn)
+    return remove
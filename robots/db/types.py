@@ -0,0 +1,64 @@
+"""
+Aspect value types
+
+Parsing shared by the typed aspect columns, the filter compiler and the
+snapshot evaluator. Kept free of SQLAlchemy so the CLI can use it without
+loading the database stack.
+"""
+
+from datetime import datetime, timezone
+
+# Aspect types that can be declared in fleet-config.toml `aspect-types`
+ASPECT_TYPES = ('string', 'int', 'float', 'bool', 'timestamp')
+
+_TRUE = ('true', 'yes', 'on')
+_FALSE = ('false', 'no', 'off')
+
+
+def parse_typed(value, value_type):
+    """Convert an aspect string to a declared type
+
+    Raises:
+        ValueError: if the value is not valid for the type
+    """
+    value = value.strip()
+    if value_type == 'int':
+        return int(value)
+    if value_type == 'float':
+        return float(value)
+    if value_type == 'bool':
+        if value.lower() in _TRUE:
+            return True
+        if value.lower() in _FALSE:
+            return False
+        raise ValueError(f"invalid boolean: {value!r}")
+    if value_type == 'timestamp':
+        parsed = datetime.fromisoformat(value)
+        # Stored naive in UTC, like created_at/updated_at
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    if value_type == 'string':
+        return value
+    raise ValueError(f"unknown aspect type: {value_type!r}")
+
+
+def typed_values(value):
+    """Typed storage columns for an aspect value
+
+    Every type the string parses as is filled in, so an aspect can be declared
+    (or re-declared) as any compatible type without rewriting its rows.
+    """
+    typed = {'value_int': None, 'value_float': None, 'value_bool': None, 'value_time': None}
+    if value is None:
+        return typed
+    for column, value_type in (('value_int', 'int'), ('value_float', 'float'),
+                               ('value_bool', 'bool'), ('value_time', 'timestamp')):
+        try:
+            typed[column] = parse_typed(value, value_type)
+        except (ValueError, OverflowError):
+            pass
+    # Keep out of range integers out of BIGINT
+    if typed['value_int'] is not None and not -2**63 <= typed['value_int'] < 2**63:
+        typed['value_int'] = None
+    return typed
@@ -6,5 +6,9 @@ from robots.models.base import db
 from robots.models.user import User
 from robots.models.robot import Robot
 from robots.models.robot_aspect import RobotAspect
+from robots.models.telemetry import TelemetrySample, TelemetryRollup, TelemetryRollupMark
+from robots.models.fleet_change import FleetChange, FleetChangeCounter
+from robots.models.audit_event import AuditEvent
 
-__all__ = ['db', 'User', 'Robot', 'RobotAspect']
+__all__ = ['db', 'User', 'Robot', 'RobotAspect', 'TelemetrySample', 'TelemetryRollup', 'TelemetryRollupMark',
+           'FleetChange', 'FleetChangeCounter', 'AuditEvent']
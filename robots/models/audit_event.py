@@ -0,0 +1,55 @@
+"""
+Audit log model
+
+One row per robot an interaction touched (or one row with no robot for
+interactions that touched none), grouped by action_id. Rows are written in
+batches from the local audit spool, never by the command being audited, so
+their ids are generated where the event happened and a batch that is
+shipped twice is only stored once.
+"""
+
+from robots.models.base import db
+
+
+class AuditEvent(db.Model):
+    """A user's interaction with a robot: who, what, what changed, and how it ended"""
+    __tablename__ = 'audit_events'
+    __table_args__ = (
+        db.Index('ix_audit_events_robot_occurred_at', 'robot', 'occurred_at'),
+        db.Index('ix_audit_events_user_occurred_at', 'user', 'occurred_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)
+    action_id = db.Column(db.String(32), nullable=False, index=True)
+    occurred_at = db.Column(db.DateTime, nullable=False, index=True)
+    user = db.Column(db.String(255), nullable=False)
+    host = db.Column(db.String(255))
+    command = db.Column(db.String(64), nullable=False)
+    # No foreign key: the log outlives the robots it mentions
+    robot = db.Column(db.String(255))
+    args = db.Column(db.JSON)
+    # {field or aspect name: [old, new]}, as import_fleet reports changes
+    changes = db.Column(db.JSON)
+    duration = db.Column(db.Float)
+    exit_status = db.Column(db.Integer)
+    error = db.Column(db.Text)
+
+    def to_dict(self):
+        """Convert event to dictionary"""
+        return {
+            "id": self.id,
+            "action_id": self.action_id,
+            "occurred_at": self.occurred_at.isoformat(),
+            "user": self.user,
+            "host": self.host,
+            "command": self.command,
+            "robot": self.robot,
+            "args": self.args,
+            "changes": self.changes,
+            "duration": self.duration,
+            "exit_status": self.exit_status,
+            "error": self.error
+        }
+
+    def __repr__(self):
+        return f'<AuditEvent {self.command} {self.robot or ""} by {self.user}>'
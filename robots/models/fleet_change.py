@@ -0,0 +1,145 @@
+"""
+Fleet change log models
+
+Every transaction that creates, updates or deletes robots or aspects appends
+rows here, all sharing one sequence number taken from a counter row just
+before commit. Taking the counter's row lock at that point orders committing
+writers, so sequence numbers become visible in increasing order and a reader
+that has seen seq N can never later find a smaller one. The counter row is
+created along with its table, by the migration or by db.create_all().
+Deleted robots and aspects stay behind as tombstones.
+
+ORM writes are picked up from the session automatically; Core bulk writes
+call note_changes() with what they touched.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from robots.models.base import db
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+
+class FleetChange(db.Model):
+    """One robot or aspect created, updated or deleted in a transaction"""
+    __tablename__ = 'fleet_changes'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False, index=True)
+    # No foreign key: tombstones outlive their robot
+    robot_id = db.Column(db.Integer, nullable=False)
+    robot_name = db.Column(db.String(255), nullable=False)
+    # NULL for a change to the robot itself
+    aspect = db.Column(db.String(255))
+    op = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<FleetChange {self.seq} {self.op} {self.robot_name} {self.aspect or ""}>'
+
+
+class FleetChangeCounter(db.Model):
+    """Single row holding the last sequence number handed out"""
+    __tablename__ = 'fleet_change_counter'
+
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False, default=0)
+    # Changes up to this seq have been pruned; older cursors must resync
+    pruned_seq = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+def note_changes(session, changes):
+    """Queue changes made with Core statements for the next commit
+
+    Args:
+        session: Session the changes were made in
+        changes: Iterable of (robot_id, robot_name or None, aspect or None, op)
+    """
+    session.info.setdefault('fleet_changes', []).extend(changes)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_orm_changes(session, flush_context, instances):
+    from robots.models.robot import Robot
+    from robots.models.robot_aspect import RobotAspect
+
+    # Objects are kept until commit because new ones have no ids yet
+    touched = session.info.setdefault('fleet_change_objects', [])
+    for objects, op in ((session.new, UPSERT), (session.dirty, UPSERT), (session.deleted, DELETE)):
+        for obj in objects:
+            if not isinstance(obj, (Robot, RobotAspect)):
+                continue
+            if op == UPSERT and obj in session.dirty \
+                    and not session.is_modified(obj, include_collections=False):
+                continue
+            touched.append((obj, op))
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_changes(session):
+    # Flush first so pending ORM changes are collected and have ids
+    session.flush()
+    changes = session.info.pop('fleet_changes', [])
+    objects = session.info.pop('fleet_change_objects', [])
+
+    from robots.models.robot import Robot
+    for obj, op in objects:
+        if isinstance(obj, Robot):
+            changes.append((obj.id, obj.name, None, op))
+        else:
+            changes.append((obj.robot_id, None, obj.name, op))
+    if not changes:
+        return
+
+    # The last change to a robot or aspect in a transaction wins
+    rows = {}
+    names = {}
+    for robot_id, name, aspect, op in changes:
+        rows[(robot_id, aspect)] = {'robot_id': robot_id, 'aspect': aspect, 'op': op}
+        if name is not None:
+            names[robot_id] = name
+    unnamed = {robot_id for robot_id, _ in rows if robot_id not in names}
+    if unnamed:
+        names.update(session.execute(select(Robot.id, Robot.name).where(Robot.id.in_(unnamed))).all())
+
+    next_seq = (update(FleetChangeCounter).where(FleetChangeCounter.id == 1)
+                .values(seq=FleetChangeCounter.seq + 1).returning(FleetChangeCounter.seq))
+    seq = session.execute(next_seq).scalar()
+    if seq is None:
+        # No counter row, on a schema that was not made by create_all or the
+        # migration. Concurrent first writers may all get here, so the row is
+        # inserted only if missing and then taken like any other time.
+        session.execute(_seed_counter(session.get_bind().dialect.name))
+        seq = session.execute(next_seq).scalar()
+    changed_at = datetime.utcnow()
+    session.execute(insert(FleetChange), [
+        dict(row, seq=seq, robot_name=names.get(row['robot_id'], ''), changed_at=changed_at)
+        for row in rows.values()
+    ])
+
+
+def _seed_counter(dialect_name):
+    """INSERT of the counter row that does nothing when it already exists"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(FleetChangeCounter).values(id=1, seq=0, pruned_seq=0)
+    return dialect_insert(FleetChangeCounter).values(id=1, seq=0, pruned_seq=0).on_conflict_do_nothing()
+
+
+@event.listens_for(FleetChangeCounter.__table__, 'after_create')
+def _create_counter_row(table, connection, **kw):
+    # db.create_all() seeds the row like the migration does
+    connection.execute(table.insert().values(id=1, seq=0, pruned_seq=0))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('fleet_changes', None)
+    session.info.pop('fleet_change_objects', None)
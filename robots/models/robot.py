@@ -2,6 +2,7 @@
 Robot model for database storage
 """
 
+from sqlalchemy.orm import subqueryload
 from robots.models.base import BaseModel, db
 
 class Robot(BaseModel):
@@ -9,19 +10,36 @@ class Robot(BaseModel):
     __tablename__ = 'robots'
 
     name = db.Column(db.String(255), unique=True, nullable=False)
-    model = db.Column(db.String(255), nullable=False)
+    model = db.Column(db.String(255), nullable=False, index=True)
     hostname = db.Column(db.String(255), nullable=False)
-    status = db.Column(db.String(50), default='idle')
+    status = db.Column(db.String(50), default='idle', index=True)
     deployed = db.Column(db.Boolean, default=False)
-    location = db.Column(db.String(255), default='no location')
+    location = db.Column(db.String(255), default='no location', index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     # Relationship to aspects
     aspects = db.relationship('RobotAspect', backref='robot', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # max(updated_at) and "changed since" scans for the snapshot, the
+        # API's ETag and the change feed
+        db.Index('ix_robots_updated_at', 'updated_at'),
+    )
+
     def __repr__(self):
         return f'<Robot {self.name}>'
 
+    @classmethod
+    def query_with_aspects(cls):
+        """Query that loads every matched robot's aspects in one extra SELECT
+
+        Use this whenever aspects (or to_dict) are read for more than one
+        robot, otherwise each robot lazily fires its own query. subqueryload
+        re-runs the robot query as a subquery rather than batching ids into
+        IN lists, so the count stays at two however large the fleet is.
+        """
+        return cls.query.options(subqueryload(cls.aspects))
+
     def to_dict(self):
         """Convert robot instance to dictionary"""
         data = {
@@ -2,6 +2,8 @@
 RobotAspect model for storing dynamic robot aspects
 """
 
+from sqlalchemy.orm import validates
+from robots.db.types import typed_values
 from robots.models.base import BaseModel, db
 
 class RobotAspect(BaseModel):
@@ -12,10 +14,31 @@ class RobotAspect(BaseModel):
     name = db.Column(db.String(255), nullable=False)
     value = db.Column(db.String(255))
 
+    # Typed copies of value, kept in step by the validator below so numeric,
+    # boolean and time predicates and sorts can run in the database
+    value_int = db.Column(db.BigInteger)
+    value_float = db.Column(db.Float)
+    value_bool = db.Column(db.Boolean)
+    value_time = db.Column(db.DateTime)
+
     # Ensure unique aspect names per robot
     __table_args__ = (
         db.UniqueConstraint('robot_id', 'name', name='uix_robot_aspect'),
+        # Serves aspect filters without touching the table
+        db.Index('ix_robot_aspects_name_value', 'name', 'value', 'robot_id'),
+        db.Index('ix_robot_aspects_name_value_int', 'name', 'value_int', 'robot_id'),
+        db.Index('ix_robot_aspects_name_value_float', 'name', 'value_float', 'robot_id'),
+        db.Index('ix_robot_aspects_name_value_time', 'name', 'value_time', 'robot_id'),
+        # max(updated_at) and "changed since" scans
+        db.Index('ix_robot_aspects_updated_at', 'updated_at'),
     )
 
+    @validates('value')
+    def _sync_typed_values(self, key, value):
+        value = None if value is None else str(value)
+        for column, typed in typed_values(value).items():
+            setattr(self, column, typed)
+        return value
+
     def __repr__(self):
-        return f'<RobotAspect {self.name}={self.value}>' 
\ No newline at end of file
+        return f'<RobotAspect {self.name}={self.value}>'
@@ -0,0 +1,81 @@
+"""
+Telemetry models for robot metric history
+"""
+
+from robots.models.base import db
+
+# Rollup resolutions in seconds
+MINUTE = 60
+HOUR = 3600
+
+
+class TelemetrySample(db.Model):
+    """One reported value of a robot metric
+
+    Append-only and kept compact: no created/updated columns, timestamps as
+    epoch milliseconds so time buckets are integer arithmetic on every
+    database. Numeric values go in value, anything else in text.
+    """
+    __tablename__ = 'telemetry_samples'
+
+    # BIGINT primary keys don't autoincrement on SQLite, INTEGER does
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    robot_id = db.Column(db.Integer, db.ForeignKey('robots.id', ondelete='CASCADE'), nullable=False)
+    metric = db.Column(db.String(64), nullable=False)
+    ts = db.Column(db.BigInteger, nullable=False)
+    value = db.Column(db.Float)
+    text = db.Column(db.String(255))
+
+    __table_args__ = (
+        # Range queries for one robot's metric
+        db.Index('ix_telemetry_samples_robot_metric_ts', 'robot_id', 'metric', 'ts'),
+        # Rollups and retention scan by time across the fleet
+        db.Index('ix_telemetry_samples_ts', 'ts'),
+    )
+
+    def __repr__(self):
+        return f'<TelemetrySample {self.robot_id} {self.metric}@{self.ts}>'
+
+
+class TelemetryRollup(db.Model):
+    """Aggregate of a robot metric over one time bucket
+
+    resolution is the bucket size in seconds (MINUTE or HOUR) and bucket
+    its start in epoch seconds. Text metrics only carry count and last_text.
+    """
+    __tablename__ = 'telemetry_rollups'
+
+    robot_id = db.Column(db.Integer, db.ForeignKey('robots.id', ondelete='CASCADE'), primary_key=True)
+    metric = db.Column(db.String(64), primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float)
+    minimum = db.Column(db.Float)
+    maximum = db.Column(db.Float)
+    last = db.Column(db.Float)
+    last_text = db.Column(db.String(255))
+
+    __table_args__ = (
+        # Rollup watermarks and retention go by (resolution, bucket)
+        db.Index('ix_telemetry_rollups_resolution_bucket', 'resolution', 'bucket'),
+    )
+
+    def __repr__(self):
+        return f'<TelemetryRollup {self.robot_id} {self.metric}@{self.bucket}/{self.resolution}s>'
+
+
+class TelemetryRollupMark(db.Model):
+    """Highest raw sample id already rolled up, per rollup resolution
+
+    Samples with a higher id were recorded since the last rollup, so the
+    earliest of them is the oldest bucket the next rollup has to redo,
+    however late it was reported.
+    """
+    __tablename__ = 'telemetry_rollup_marks'
+
+    resolution = db.Column(db.Integer, primary_key=True)
+    sample_id = db.Column(db.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f'<TelemetryRollupMark {self.resolution}s@{self.sample_id}>'
@@ -0,0 +1,10 @@
+"""
+Robot telemetry
+
+Metric history for robots: raw samples recorded from status reports,
+per-minute and per-hour rollups, and retention. See store.py.
+"""
+
+from robots.telemetry.store import TelemetryStore, format_time, now_ms, parse_time
+
+__all__ = ['TelemetryStore', 'format_time', 'now_ms', 'parse_time']
@@ -0,0 +1,378 @@
+"""
+Telemetry store
+
+Records metric samples, rolls them up into per-minute and per-hour
+aggregates, applies retention, and answers range queries from the
+cheapest resolution that still covers the requested window.
+"""
+
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, insert, literal, select
+
+from robots.db.types import parse_typed
+from robots.models.robot import Robot
+from robots.models.telemetry import HOUR, MINUTE, TelemetryRollup, TelemetryRollupMark, TelemetrySample
+
+RAW = 0
+
+RESOLUTION_NAMES = {RAW: 'raw', MINUTE: 'minute', HOUR: 'hour'}
+
+# Source rows are aggregated this many seconds at a time, which bounds the
+# number of open buckets held in memory during a long catch-up
+ROLLUP_CHUNK = 6 * HOUR
+
+NAME_BATCH = 1000
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def sample_value(value):
+    """Split a reported value into (numeric value, text)"""
+    if isinstance(value, bool):
+        return float(value), None
+    try:
+        return float(value), None
+    except (TypeError, ValueError):
+        return None, str(value)[:255]
+
+
+def format_time(seconds):
+    """ISO 8601 UTC string for epoch seconds"""
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_time(value, now=None):
+    """Epoch seconds for a time given as an ISO timestamp or as a duration
+    before now, such as 90s, 15m, 6h or 7d
+
+    Raises:
+        ValueError: for anything else
+    """
+    now = time.time() if now is None else now
+    units = {'s': 1, 'm': MINUTE, 'h': HOUR, 'd': 86400, 'w': 7 * 86400}
+    value = value.strip()
+    if value == 'now':
+        return now
+    if value[-1:] in units:
+        try:
+            return now - float(value[:-1]) * units[value[-1]]
+        except ValueError:
+            pass
+    moment = parse_typed(value, 'timestamp')
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TelemetryStore:
+    """Telemetry recording, rollups, retention and queries"""
+
+    def __init__(self, config=None):
+        """Initialize TelemetryStore with optional config
+
+        Args:
+            config: Configuration dictionary containing telemetry-* settings
+        """
+        config = config or {}
+        self.metrics = set(config.get('telemetry-metrics', ['status', 'battery-level']))
+        self.retention = {
+            RAW: config.get('telemetry-raw-retention', 2 * 86400),
+            MINUTE: config.get('telemetry-minute-retention', 14 * 86400),
+            HOUR: config.get('telemetry-hour-retention', 365 * 86400),
+        }
+        self.rollup_delay = config.get('telemetry-rollup-delay', 60)
+
+    def tracks(self, metric):
+        """True if samples of this metric are kept"""
+        return metric in self.metrics
+
+    def record(self, session, samples):
+        """Append samples for robots given by name
+
+        Args:
+            session: SQLAlchemy session; the caller commits
+            samples: List of (robot name, metric, ts in epoch ms, value)
+
+        Returns:
+            (written, unknown) sample counts
+        """
+        names = sorted({name for name, _, _, _ in samples})
+        ids = {}
+        for start in range(0, len(names), NAME_BATCH):
+            ids.update(session.execute(
+                select(Robot.name, Robot.id).where(Robot.name.in_(names[start:start + NAME_BATCH]))
+            ).all())
+
+        rows = []
+        for name, metric, ts, raw in samples:
+            if name not in ids:
+                continue
+            value, text = sample_value(raw)
+            rows.append({'robot_id': ids[name], 'metric': metric, 'ts': ts, 'value': value, 'text': text})
+        if rows:
+            session.execute(insert(TelemetrySample), rows)
+        return len(rows), len(samples) - len(rows)
+
+    def rollup(self, session, now=None):
+        """Roll completed minutes of raw samples into minute rollups, then
+        completed hours of minute rollups into hour rollups
+
+        Buckets are only rolled once rollup-delay seconds have passed since
+        they ended, so buffered reports have landed. The newest rolled
+        bucket is rolled again each time, and so is every older one that
+        samples recorded since the last rollup fall in, back as far as the
+        finer resolution is still retained.
+
+        Returns:
+            {resolution name: rollup rows written}
+        """
+        now = time.time() if now is None else now
+        newest = session.scalar(select(func.max(TelemetrySample.id)))
+        mark = session.get(TelemetryRollupMark, MINUTE)
+        late = None
+        if mark is not None and newest is not None:
+            late = session.scalar(select(func.min(TelemetrySample.ts)).where(
+                TelemetrySample.id > mark.sample_id, TelemetrySample.id <= newest))
+        minutes, touched = self._rollup_level(session, RAW, MINUTE, now,
+                                              None if late is None else late // 1000)
+        hours, _ = self._rollup_level(session, MINUTE, HOUR, now, touched)
+        if newest is not None:
+            session.merge(TelemetryRollupMark(resolution=MINUTE, sample_id=newest))
+        return {'minute': minutes, 'hour': hours}
+
+    def _rollup_level(self, session, source, resolution, now, touched=None):
+        """Roll source rows into resolution buckets
+
+        Args:
+            touched: Earliest time (epoch seconds) of source rows written
+                since the last rollup, or None
+
+        Returns:
+            (rollup rows written, start of the first bucket rewritten or None)
+        """
+        end = _floor(now - self.rollup_delay, resolution)
+        start = self._watermark(session, resolution)
+        if start is None:
+            start = self._earliest(session, source)
+            if start is None:
+                return 0, None
+            start = _floor(start, resolution)
+        elif touched is not None:
+            # Re-rolling a bucket whose source rows were partly deleted by
+            # retention would lose them, so stop at the first complete one
+            complete = -_floor(-(now - self.retention[source]), resolution)
+            start = min(start, max(_floor(touched, resolution), complete))
+        if start >= end:
+            return 0, None
+
+        session.execute(delete(TelemetryRollup).where(
+            TelemetryRollup.resolution == resolution,
+            TelemetryRollup.bucket >= start,
+            TelemetryRollup.bucket < end
+        ))
+        written = 0
+        for chunk_start in range(start, end, ROLLUP_CHUNK):
+            chunk_end = min(chunk_start + ROLLUP_CHUNK, end)
+            buckets = {}
+            for row in self._source_rows(session, source, chunk_start, chunk_end):
+                key = (row.robot_id, row.metric, _floor(row.time, resolution))
+                aggregate = buckets.get(key)
+                if aggregate is None:
+                    buckets[key] = aggregate = _Aggregate()
+                aggregate.add(row)
+            if buckets:
+                session.execute(insert(TelemetryRollup), [
+                    aggregate.row(robot_id, metric, resolution, bucket)
+                    for (robot_id, metric, bucket), aggregate in buckets.items()
+                ])
+                written += len(buckets)
+        return written, start
+
+    def _source_rows(self, session, source, start, end):
+        """Rows between start and end (epoch seconds) shaped like rollups, oldest first
+
+        A raw sample reads as a rollup of one.
+        """
+        if source == RAW:
+            samples = TelemetrySample
+            query = select(
+                samples.robot_id, samples.metric, (samples.ts // 1000).label('time'),
+                literal(1).label('samples'), samples.value.label('total'),
+                samples.value.label('minimum'), samples.value.label('maximum'),
+                samples.value.label('last'), samples.text.label('last_text')
+            ).where(samples.ts >= start * 1000, samples.ts < end * 1000).order_by(samples.ts, samples.id)
+        else:
+            rollups = TelemetryRollup
+            query = select(
+                rollups.robot_id, rollups.metric, rollups.bucket.label('time'),
+                rollups.count.label('samples'), rollups.total, rollups.minimum, rollups.maximum,
+                rollups.last, rollups.last_text
+            ).where(
+                rollups.resolution == source, rollups.bucket >= start, rollups.bucket < end
+            ).order_by(rollups.bucket)
+        return session.execute(query.execution_options(yield_per=10000))
+
+    def _watermark(self, session, resolution):
+        """Start of the newest rolled bucket, or None"""
+        return session.scalar(select(func.max(TelemetryRollup.bucket))
+                              .where(TelemetryRollup.resolution == resolution))
+
+    def _earliest(self, session, resolution):
+        if resolution == RAW:
+            earliest = session.scalar(select(func.min(TelemetrySample.ts)))
+            return None if earliest is None else earliest // 1000
+        return session.scalar(select(func.min(TelemetryRollup.bucket))
+                              .where(TelemetryRollup.resolution == resolution))
+
+    def retain(self, session, now=None):
+        """Delete samples and rollups older than their retention
+
+        Nothing is deleted before it has been rolled up into the next
+        resolution.
+
+        Returns:
+            {resolution name: rows deleted}
+        """
+        now = time.time() if now is None else now
+        minute_mark = self._watermark(session, MINUTE)
+        hour_mark = self._watermark(session, HOUR)
+
+        raw_cutoff = min(now - self.retention[RAW], minute_mark if minute_mark is not None else 0)
+        minute_cutoff = min(now - self.retention[MINUTE], hour_mark if hour_mark is not None else 0)
+        return {
+            'raw': session.execute(delete(TelemetrySample).where(
+                TelemetrySample.ts < int(raw_cutoff * 1000))).rowcount,
+            'minute': session.execute(delete(TelemetryRollup).where(
+                TelemetryRollup.resolution == MINUTE, TelemetryRollup.bucket < minute_cutoff)).rowcount,
+            'hour': session.execute(delete(TelemetryRollup).where(
+                TelemetryRollup.resolution == HOUR,
+                TelemetryRollup.bucket < now - self.retention[HOUR])).rowcount,
+        }
+
+    def resolution_for(self, start, end, points, now=None):
+        """Cheapest resolution that covers start..end with about `points` points
+
+        That is the coarsest resolution no coarser than the window divided
+        by points, among those whose retention still reaches start.
+        """
+        now = time.time() if now is None else now
+        step = (end - start) / max(points, 1)
+        covering = [resolution for resolution in (HOUR, MINUTE, RAW)
+                    if start >= now - self.retention[resolution]]
+        if not covering:
+            return HOUR
+        for resolution in covering:
+            if resolution <= step:
+                return resolution
+        return covering[-1]
+
+    def history(self, session, robot_id, metric, start, end, points=200, now=None):
+        """Points for one robot's metric between start and end (epoch seconds)
+
+        The chosen resolution answers as far as it has been rolled up; the
+        rest of the window, up to the present, comes from finer ones. Points
+        are then merged down to about `points` if there are more.
+
+        Returns:
+            (resolution name, list of point dicts)
+        """
+        resolution = self.resolution_for(start, end, points, now)
+        window_start, results = start, []
+        levels = [level for level in (HOUR, MINUTE, RAW) if level <= resolution]
+        for level in levels:
+            rows = self._range(session, robot_id, metric, level, start, end)
+            results.extend(rows)
+            if rows:
+                # Continue after the last bucket this level covered
+                start = rows[-1]['bucket'] + max(level, 0.001)
+            if start >= end:
+                break
+        step = (end - window_start) / max(points, 1)
+        if len(results) > points and step > resolution:
+            results = _downsample(results, step)
+        for point in results:
+            point['time'] = format_time(point.pop('bucket'))
+        return RESOLUTION_NAMES[resolution], results
+
+    def _range(self, session, robot_id, metric, resolution, start, end):
+        if resolution == RAW:
+            rows = session.execute(
+                select(TelemetrySample.ts, TelemetrySample.value, TelemetrySample.text)
+                .where(TelemetrySample.robot_id == robot_id, TelemetrySample.metric == metric,
+                       TelemetrySample.ts >= int(start * 1000), TelemetrySample.ts < int(end * 1000))
+                .order_by(TelemetrySample.ts)
+            )
+            return [{
+                'bucket': row.ts / 1000, 'resolution': 'raw', 'count': 1,
+                'avg': row.value, 'min': row.value, 'max': row.value,
+                'last': row.value if row.text is None else row.text,
+            } for row in rows]
+
+        rows = session.execute(
+            select(TelemetryRollup)
+            .where(TelemetryRollup.robot_id == robot_id, TelemetryRollup.metric == metric,
+                   TelemetryRollup.resolution == resolution,
+                   TelemetryRollup.bucket >= _floor(start, resolution), TelemetryRollup.bucket < end)
+            .order_by(TelemetryRollup.bucket)
+        ).scalars()
+        return [{
+            'bucket': row.bucket, 'resolution': RESOLUTION_NAMES[resolution], 'count': row.count,
+            'avg': None if row.total is None else row.total / row.count,
+            'min': row.minimum, 'max': row.maximum,
+            'last': row.last if row.last_text is None else row.last_text,
+        } for row in rows]
+
+
+class _Aggregate:
+    """Running count/sum/min/max/last over raw samples or finer rollups"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = None
+        self.minimum = None
+        self.maximum = None
+        self.last = None
+        self.last_text = None
+
+    def add(self, row):
+        self.count += row.samples
+        if row.total is not None:
+            self.total = row.total if self.total is None else self.total + row.total
+            self.minimum = row.minimum if self.minimum is None else min(self.minimum, row.minimum)
+            self.maximum = row.maximum if self.maximum is None else max(self.maximum, row.maximum)
+        # Rows arrive oldest first, so the latest one wins
+        self.last, self.last_text = row.last, row.last_text
+
+    def row(self, robot_id, metric, resolution, bucket):
+        return {
+            'robot_id': robot_id, 'metric': metric, 'resolution': resolution, 'bucket': bucket,
+            'count': self.count, 'total': self.total, 'minimum': self.minimum,
+            'maximum': self.maximum, 'last': self.last, 'last_text': self.last_text,
+        }
+
+
+def _downsample(points, step):
+    """Merge consecutive points into step-second groups"""
+    merged = []
+    for point in points:
+        group = merged[-1] if merged else None
+        if group is None or point['bucket'] >= group['bucket'] + step:
+            merged.append(dict(point))
+            continue
+        if point['avg'] is not None:
+            if group['avg'] is None:
+                group.update(avg=point['avg'], min=point['min'], max=point['max'])
+            else:
+                total = group['avg'] * group['count'] + point['avg'] * point['count']
+                group['avg'] = total / (group['count'] + point['count'])
+                group['min'] = min(group['min'], point['min'])
+                group['max'] = max(group['max'], point['max'])
+        group['count'] += point['count']
+        group['last'] = point['last']
+    return merged
+
+
+def _floor(seconds, resolution):
+    return int(seconds // resolution * resolution)
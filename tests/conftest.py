@@ -0,0 +1,84 @@
+"""
+Shared fixtures: the CLI pointed at a scratch SQLite database, synthetic
+fleets and a SQL statement counter
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+MODELS = ('modelA', 'modelB', 'modelC')
+ASPECTS = ('battery-level', 'customer', 'firmware')
+
+
+# Written before any test module is imported, since importing robots.cli
+# loads the config
+WORKDIR = tempfile.mkdtemp(prefix='robots-tests-')
+os.environ['ROBOTS_CONFIG'] = os.path.join(WORKDIR, 'fleet-config.toml')
+with open(os.environ['ROBOTS_CONFIG'], 'w') as f:
+    f.write(
+        f'DATABASE_URL = "sqlite:///{WORKDIR}/robots.db"\n'
+        'SQLALCHEMY_TRACK_MODIFICATIONS = false\n'
+        # Every read goes to the database, not the local snapshot
+        'snapshot = false\n'
+        f'audit-spool-dir = "{WORKDIR}/audit"\n'
+        'audit-background-flush = false\n'
+        'aspect-types = { "battery-level" = "int" }\n'
+        # Small enough that a per-batch statement shows up in a 200-robot fleet
+        'list-batch-size = 50\n'
+    )
+
+
+@pytest.fixture(scope='session')
+def commands():
+    """robots.cli.commands, configured for a scratch SQLite database"""
+    from robots.cli import commands
+    return commands
+
+
+@pytest.fixture
+def build_fleet(commands):
+    """Function that recreates the schema with `size` robots, each with every aspect in ASPECTS"""
+    from robots.models import db, Robot, RobotAspect, User
+
+    def build(size):
+        with commands.get_app().app_context():
+            db.drop_all()
+            db.create_all()
+            user = User(oauth_id='default', email='default@robots.local', name='Default User')
+            db.session.add(user)
+            db.session.flush()
+            for i in range(size):
+                robot = Robot(name=f'robot{i:05d}', model=MODELS[i % len(MODELS)], hostname=f'robot{i}.local',
+                              status='online' if i % 3 else 'idle', user_id=user.id)
+                robot.aspects = [RobotAspect(name=name, value=aspect_value(name, i)) for name in ASPECTS]
+                db.session.add(robot)
+            db.session.commit()
+    return build
+
+
+@pytest.fixture
+def count_statements(commands):
+    """Context manager collecting every statement sent to the CLI's database"""
+    from sqlalchemy import event
+    from robots.models import db
+
+    with commands.get_app().app_context():
+        engine = db.engine
+
+    @contextmanager
+    def counting():
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+    return counting
+
+
+def aspect_value(name, i):
+    return str(i % 100) if name == 'battery-level' else f'{name}-{i % 7}'
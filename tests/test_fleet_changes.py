@@ -0,0 +1,69 @@
+"""
+The change log's sequence counter
+"""
+
+import pytest
+from click.testing import CliRunner
+
+
+@pytest.fixture
+def empty_schema(commands):
+    from robots.models import db
+    with commands.get_app().app_context():
+        db.drop_all()
+        db.create_all()
+
+
+def counter(commands):
+    from robots.models import db
+    from robots.models.fleet_change import FleetChangeCounter
+    with commands.get_app().app_context():
+        return db.session.get(FleetChangeCounter, 1)
+
+
+def test_create_all_seeds_the_counter(commands, empty_schema):
+    assert counter(commands).seq == 0
+
+
+def test_writes_recreate_a_missing_counter(commands, empty_schema):
+    from robots.models import db
+    from robots.models.fleet_change import FleetChangeCounter, _seed_counter
+    with commands.get_app().app_context():
+        db.session.query(FleetChangeCounter).delete()
+        db.session.commit()
+
+    for name in ('robot001', 'robot002'):
+        result = CliRunner().invoke(commands.cli, ['create', name, 'modelA', f'{name}.local'])
+        assert result.exit_code == 0, result.output
+    assert counter(commands).seq == 2
+
+    # A writer that lost the race to seed the row does not fail
+    with commands.get_app().app_context():
+        db.session.execute(_seed_counter(db.engine.dialect.name))
+        db.session.commit()
+    assert counter(commands).seq == 2
+
+
+def test_reading_from_zero_after_a_prune_returns_the_retained_tail(commands, empty_schema):
+    from datetime import datetime, timedelta
+    from robots.db.changes import ChangeFeed, CursorExpired
+    from robots.models import db
+
+    def create(name):
+        result = CliRunner().invoke(commands.cli, ['create', name, 'modelA', f'{name}.local'])
+        assert result.exit_code == 0, result.output
+
+    create('robot001')
+    create('robot002')
+    feed = ChangeFeed({'changes-retention': 0})
+    with commands.get_app().app_context():
+        assert feed.prune(db.session, now=datetime.utcnow() + timedelta(seconds=1)) == 2
+        db.session.commit()
+    create('robot003')
+
+    with commands.get_app().app_context():
+        changes, cursor, more = feed.changes(db.session, 0)
+        assert [change['robot'] for change in changes] == ['robot003']
+        assert (cursor, more) == (3, False)
+        with pytest.raises(CursorExpired):
+            feed.changes(db.session, 1)
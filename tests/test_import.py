@@ -0,0 +1,23 @@
+"""
+`robots import` applies entirely or not at all
+"""
+
+from click.testing import CliRunner
+
+
+def test_failed_import_leaves_nothing_behind(commands, tmp_path):
+    from robots.models import db, Robot, User
+
+    with commands.get_app().app_context():
+        db.drop_all()
+        db.create_all()
+    source = tmp_path / 'fleet.jsonl'
+    source.write_text('{"name": "new001", "model": "modelA", "hostname": "new001.local"}\n'
+                      '{"name": "new002", "model": "modelA", "hostname": "new002.local", "deployed": "maybe"}\n')
+
+    result = CliRunner().invoke(commands.cli, ['import', str(source)])
+
+    assert result.exit_code == 1, result.output
+    with commands.get_app().app_context():
+        assert Robot.query.count() == 0
+        assert User.query.count() == 0
@@ -0,0 +1,50 @@
+"""
+The status buffer's flushes, including reports the database refuses
+"""
+
+import pytest
+
+from robots.api.ingest import StatusBuffer
+
+
+def statuses(commands):
+    from robots.models import db, Robot
+    with commands.get_app().app_context():
+        return dict(db.session.query(Robot.name, Robot.status))
+
+
+def test_a_failing_robot_is_dropped_after_the_flush_attempts(commands, build_fleet):
+    from robots.models import db
+    build_fleet(3)
+    app = commands.get_app()
+    with app.app_context():
+        # Stands in for a value the database refuses, such as an overlong status
+        db.session.execute(db.text(
+            "CREATE TRIGGER refuse_broken BEFORE UPDATE ON robots WHEN NEW.status = 'broken' "
+            "BEGIN SELECT RAISE(ABORT, 'status refused'); END"))
+        db.session.commit()
+
+    buffer = StatusBuffer(app, {'ingest-flush-attempts': 2})
+    buffer.pending = {
+        'robot00000': ({'name': 'robot00000', 'status': 'charging'}, {}),
+        'robot00001': ({'name': 'robot00001', 'status': 'broken'}, {}),
+        'robot00002': ({'name': 'robot00002', 'status': 'charging'}, {}),
+    }
+
+    buffer.flush()
+    assert len(buffer.pending) == 3
+    assert statuses(commands)['robot00000'] == 'idle'
+
+    buffer.flush()
+    assert buffer.pending == {}
+    assert statuses(commands) == {'robot00000': 'charging', 'robot00001': 'online', 'robot00002': 'charging'}
+    stats = buffer.snapshot_stats()
+    assert (stats['failed_flushes'], stats['dropped']) == (2, 1)
+
+
+def test_overlong_values_are_refused_before_buffering():
+    from robots.api.routes import _parse_report
+    with pytest.raises(ValueError, match='longer than 50'):
+        _parse_report('robot00000', {'status': 'x' * 51})
+    with pytest.raises(ValueError, match='longer than 255'):
+        _parse_report('robot00000', {'aspects': {'firmware': 'x' * 256}})
@@ -0,0 +1,30 @@
+"""
+`robots list` and `robots inspect` send the same number of SQL statements
+however large the fleet is
+"""
+
+import pytest
+from click.testing import CliRunner
+
+FLEET_SIZES = (10, 200)
+
+PATHS = {
+    'list': ['list'],
+    'list --detailed': ['list', '--detailed'],
+    'list --detailed --filter --sort': ['list', '--detailed', '--filter', 'model', 'modelA',
+                                        '--sort', '-battery-level'],
+    'list --format jsonl': ['list', '--format', 'jsonl', '--detailed'],
+    'inspect': ['inspect', 'robot00001'],
+}
+
+
+@pytest.mark.parametrize('path', PATHS)
+def test_statement_count_does_not_grow_with_fleet(commands, build_fleet, count_statements, path):
+    counts = []
+    for size in FLEET_SIZES:
+        build_fleet(size)
+        with count_statements() as statements:
+            result = CliRunner().invoke(commands.cli, PATHS[path])
+        assert result.exit_code == 0, result.output
+        counts.append(len(statements))
+    assert counts[0] == counts[1], f'`robots {path}` sent {counts} statements for {FLEET_SIZES} robots'
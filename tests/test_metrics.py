@@ -0,0 +1,75 @@
+"""
+API metrics summed across `robots serve` workers
+"""
+
+import json
+import os
+import re
+
+from flask import Flask
+
+from robots.api.metrics import ApiMetrics
+from robots.models.base import db
+
+
+def make_app(tmp_path):
+    app = Flask(__name__)
+    # A file database, so the engine has a QueuePool with size counts
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path}/metrics.db'
+    db.init_app(app)
+    app.add_url_rule('/ping', 'ping', lambda: 'pong')
+    metrics = ApiMetrics()
+    metrics.init_app(app)
+    return app, metrics
+
+
+def sample(text, name):
+    match = re.search(rf'^{re.escape(name)} (\S+)$', text, re.MULTILINE)
+    return match and float(match.group(1))
+
+
+def test_scrape_sums_every_worker(tmp_path):
+    app, metrics = make_app(tmp_path)
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    metrics.share(str(shared))
+    client = app.test_client()
+    for _ in range(3):
+        client.get('/ping').close()
+
+    # A worker that has exited: its counts stay, its pool gauges do not
+    other = {'requests': [['GET', '/ping', 200, 5]], 'latency': [], 'queries': [], 'query_duration': [],
+             'connections': 2, 'pool': {'size': 7}}
+    (shared / '999999999-0.json').write_text(json.dumps(other))
+
+    text = metrics.render()
+    assert sample(text, 'robots_http_requests_total{method="GET",endpoint="/ping",status="200"}') == 8
+    assert sample(text, 'robots_http_request_duration_seconds_count{method="GET",endpoint="/ping"}') == 3
+    assert sample(text, 'robots_db_pool_size') == metrics.state()['pool']['size']
+
+
+def test_a_reused_pid_keeps_the_dead_workers_counts(tmp_path):
+    app, metrics = make_app(tmp_path)
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    metrics.share(str(shared))
+    app.test_client().get('/ping').close()
+
+    # Written by an exited worker whose pid this process now has
+    other = {'requests': [['GET', '/ping', 200, 4]], 'latency': [], 'queries': [], 'query_duration': [],
+             'connections': 1, 'pool': {'size': 7}}
+    dead = shared / f'{os.getpid()}-0.json'
+    dead.write_text(json.dumps(other))
+    os.utime(dead, (0, 0))
+
+    text = metrics.render()
+    assert dead.exists()
+    assert sample(text, 'robots_http_requests_total{method="GET",endpoint="/ping",status="200"}') == 5
+    assert sample(text, 'robots_db_pool_size') == metrics.state()['pool']['size']
+
+
+def test_unshared_metrics_stay_in_process(tmp_path):
+    app, metrics = make_app(tmp_path)
+    app.test_client().get('/ping').close()
+    text = metrics.render()
+    assert sample(text, 'robots_http_requests_total{method="GET",endpoint="/ping",status="200"}') == 1
@@ -0,0 +1,54 @@
+"""
+StreamingTable renders tables that fit in its sample just like tabulate
+"""
+
+import io
+
+from tabulate import tabulate
+
+from robots.cli.table import StreamingTable
+
+HEADERS = ['Robot', 'Hostname', 'Status', 'battery-level', 'firmware']
+ROWS = [
+    ['robot001', 'stonks.local', 'online', '87', '2.4.1'],
+    ['robot002', 'robot002.lab.example.com', 'idle', '5', '2.4'],
+    ['robot003', '10.0.0.3', 'charging', '100', '-'],
+    ['robot004', 'a.b', 'idle', '42', '3'],
+    ['r5', 'stonks.local', 'broken', '7', '10.12'],
+    ['robot006', 'x', 'idle', '3', '1.0'],
+    ['robot007', 'edge.site-a.local', 'online', '64', '2.4.1'],
+]
+
+
+def render(headers, rows, **options):
+    stream = io.StringIO()
+    table = StreamingTable(headers, stream=stream, **options)
+    for row in rows:
+        table.write(row)
+    table.close()
+    return stream.getvalue()
+
+
+def expected(headers, rows):
+    return '\n'.join(line.rstrip() for line in tabulate(rows, headers, tablefmt='simple').splitlines()) + '\n'
+
+
+def test_matches_tabulate_with_dotted_values():
+    assert render(HEADERS, ROWS) == expected(HEADERS, ROWS)
+
+
+def test_matches_tabulate_for_decimal_columns():
+    rows = [['a', '1'], ['b', '10.25'], ['c', '3.5'], ['d', '-2']]
+    assert render(['name', 'value'], rows) == expected(['name', 'value'], rows)
+
+
+def test_rows_after_the_sample_are_cut_to_width():
+    output = render(['Robot', 'Hostname'], [['r1', 'a.local'], ['r2', 'much-longer-name.local']], sample_size=1)
+    assert output.splitlines()[-1] == 'r2       much-long…'
+
+
+def test_declared_widths_skip_the_sample():
+    stream = io.StringIO()
+    table = StreamingTable(['Robot', 'Status'], stream=stream, widths={'Robot': 6, 'Status': 8})
+    table.write(['robot001', 'online'])
+    assert stream.getvalue().splitlines() == ['Robot   Status', '------  --------', 'robot…  online']
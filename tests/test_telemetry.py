@@ -0,0 +1,85 @@
+"""
+Telemetry rollups and retention
+"""
+
+import pytest
+
+from robots.models.telemetry import HOUR, MINUTE
+from robots.telemetry.store import RAW
+
+# The start of an hour, in epoch seconds
+T0 = 1_700_000_000 // HOUR * HOUR
+
+
+@pytest.fixture
+def telemetry(commands, build_fleet):
+    """(TelemetryStore without a rollup delay, function recording battery levels of robot00000)"""
+    from robots.models import db
+    from robots.telemetry import TelemetryStore
+    build_fleet(1)
+    store = TelemetryStore({'telemetry-rollup-delay': 0})
+
+    def record(*samples):
+        with commands.get_app().app_context():
+            store.record(db.session, [('robot00000', 'battery-level', int(ts * 1000), value)
+                                      for ts, value in samples])
+            db.session.commit()
+    return store, record
+
+
+def run(commands, method, **kwargs):
+    from robots.models import db
+    with commands.get_app().app_context():
+        result = method(db.session, **kwargs)
+        db.session.commit()
+        return result
+
+
+def rollups(commands, resolution):
+    """{bucket: (count, total, last)} of one resolution"""
+    from robots.models import db, TelemetryRollup
+    with commands.get_app().app_context():
+        rows = db.session.query(TelemetryRollup).filter_by(resolution=resolution)
+        return {row.bucket: (row.count, row.total, row.last) for row in rows}
+
+
+def test_rollup_aggregates_minutes_and_hours(commands, telemetry):
+    store, record = telemetry
+    record((T0 + 10, 1), (T0 + 20, 3), (T0 + 70, 5), (T0 + HOUR + 5, 2))
+
+    assert run(commands, store.rollup, now=T0 + 2 * HOUR + 1) == {'minute': 3, 'hour': 2}
+    assert rollups(commands, MINUTE) == {T0: (2, 4, 3), T0 + MINUTE: (1, 5, 5), T0 + HOUR: (1, 2, 2)}
+    assert rollups(commands, HOUR) == {T0: (3, 9, 5), T0 + HOUR: (1, 2, 2)}
+
+
+def test_late_samples_are_rolled_into_older_buckets(commands, telemetry):
+    store, record = telemetry
+    record((T0 + 10, 1), (T0 + 20, 3), (T0 + HOUR + 5, 2))
+    run(commands, store.rollup, now=T0 + 2 * HOUR + 1)
+
+    # Reported late, for a minute and an hour that are no longer the newest rolled
+    record((T0 + 30, 8))
+    run(commands, store.rollup, now=T0 + 2 * HOUR + 61)
+    assert rollups(commands, MINUTE)[T0] == (3, 12, 8)
+    assert rollups(commands, HOUR)[T0] == (3, 12, 8)
+
+
+def test_retention_keeps_what_is_not_rolled_up(commands, telemetry):
+    from robots.models import db, TelemetrySample
+    store, record = telemetry
+    store.retention[RAW] = HOUR
+    record((T0 + 10, 1), (T0 + 20, 3), (T0 + HOUR + 5, 2))
+    assert run(commands, store.retain, now=T0 + 2 * HOUR + 1) == {'raw': 0, 'minute': 0, 'hour': 0}
+
+    run(commands, store.rollup, now=T0 + 2 * HOUR + 1)
+    # Raw samples older than an hour go, except those newer than the last minute rolled up
+    assert run(commands, store.retain, now=T0 + 2 * HOUR + 1) == {'raw': 2, 'minute': 0, 'hour': 0}
+
+    # A sample reported after its minute's raw samples were deleted must
+    # not replace that minute's rollup
+    record((T0 + 40, 8))
+    run(commands, store.rollup, now=T0 + 2 * HOUR + 61)
+    assert rollups(commands, MINUTE)[T0] == (2, 4, 3)
+    run(commands, store.retain, now=T0 + 2 * HOUR + 61)
+    with commands.get_app().app_context():
+        assert [sample.ts for sample in db.session.query(TelemetrySample)] == [(T0 + HOUR + 5) * 1000]
@@ -0,0 +1,26 @@
+"""
+Statement timings stay attached to their own statements
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from robots.db.timing import watch_engine
+
+
+def test_failed_statement_leaves_no_timing_behind():
+    engine = create_engine('sqlite://')
+    timed = []
+    remove = watch_engine(engine, on_statement=lambda statement, seconds: timed.append(statement))
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM missing_table'))
+            conn.execute(text('SELECT 1'))
+            # Nothing accumulates on the (pooled) connection for statements that raised
+            assert not conn.info.get('robots_started')
+    finally:
+        remove()
+
+    assert timed == ['SELECT 1']